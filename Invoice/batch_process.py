@@ -0,0 +1,599 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from get_coordinates import (NO_INVOICE_ERROR, find_structured, merge_structured, release_cached_resources,
+                             save_sidecars)
+from input_sources import (ScanEntry, close_archives, find_sources, open_source, scan_sources, source_digest,
+                           source_name)
+import excel_summary
+import job_journal
+import output_sinks
+import result_cache
+import structured_invoice
+import triage
+from instrumentation import NULL_TIMER, MemoryPeaks, RunStats, StageTimer
+
+# 多页文档每个任务最多处理的页数
+PAGES_PER_TASK = 16
+# 流式输入时每个进程最多同时排队的文件数
+STREAM_FILES_PER_WORKER = 4
+# 文件列表按块提交时每个进程最多同时排队的块数
+CHUNKS_PER_WORKER = 4
+# 低内存模式下每个进程最多同时排队的文件数
+LOW_MEMORY_FILES_PER_WORKER = 1
+# 低内存模式下每处理完多少个文档清空一次PyMuPDF的资源缓存（每个文档都清空时，
+# 各文档共用的字体要反复加载，速度慢一倍）
+LOW_MEMORY_RELEASE_DOCUMENTS = 8
+# 流式输入时不小于该大小的文件先读取页数，所有页块一起提交
+SPLIT_FILE_BYTES = 2 * 1024 * 1024
+
+# 处理某个页块时工作进程异常退出（例如损坏的PDF让PyMuPDF崩溃）
+CRASH_ERROR = "处理时工作进程异常退出（PDF可能已损坏）"
+
+# 工作进程中当前打开的文档 (pdf_path, doc)
+_open_document = None
+# 低内存模式下当前进程已关闭、尚未清空缓存的文档数
+_unreleased_documents = 0
+
+def default_workers():
+    """默认进程数：CPU核心数"""
+    return os.cpu_count() or 1
+
+def find_pdf_files(source_path, recursive=False):
+    """获取要处理的PDF列表，文件夹按文件名排序以保证顺序确定，recursive 为 True 时包含子文件夹
+
+    ZIP压缩包中的PDF直接从压缩包读取，不解压到磁盘（见 input_sources）
+    """
+    return find_sources(source_path, recursive)
+
+def _sidecar_source(pdf_path):
+    # 压缩包条目和内存中的PDF按条目名命名JSON/CSV文件（须指定 sidecar_dir）
+    return pdf_path if isinstance(pdf_path, str) else source_name(pdf_path)
+
+def _shared_document(pdf_path):
+    # 工作进程中保持当前文档打开，同一文档的多个页块不重复打开
+    global _open_document
+    if _open_document is not None and _open_document[0] == pdf_path:
+        return _open_document[1]
+    _close_shared_document()
+    doc = triage.open_checked(pdf_path)
+    _open_document = (pdf_path, doc)
+    return doc
+
+def _close_shared_document():
+    global _open_document
+    if _open_document is not None:
+        _open_document[1].close()
+        _open_document = None
+
+def extract_pages(unit, sidecar_dir=None, regions=False, timed=False, low_memory=False):
+    """在工作进程中处理一个页块，unit 为 (pdf_path, 起始页, 结束页)，结束页为None时处理到最后一页
+
+    返回 (pdf_path, 起始页, 总页数, [(页码, 字段)], 错误信息)，调用方根据总页数分发剩余页块。
+    第一个页块先做分拣（见 triage）：不是PDF、打不开的文件和没有文本层的扫描件直接返回错误，
+    不再获取文本和提取字段，也不再分发剩余页块。
+    带有结构化发票数据（内嵌或同名的XML/OFD文件）的文档先查找结构化数据，有时不做文本层检查，
+    单页文档直接使用其中的字段，多页文档只替换发票号码相同的页（见 get_coordinates.merge_structured）。
+    结果直接在内存中返回，只有指定 sidecar_dir 时才写出JSON/CSV文件。
+    异常在这里捕获并以字符串返回，单个文件出错不会中断整批处理。
+    timed 为 True 时在末尾多返回一项各阶段耗时（StageTimer.as_dict()）；
+    low_memory 为 True 时每处理完 LOW_MEMORY_RELEASE_DOCUMENTS 个文档清空一次PyMuPDF的资源缓存
+    """
+    pdf_path, start, stop = unit
+    timer = StageTimer() if timed else None
+    page_count = 0
+    try:
+        with (timer or NULL_TIMER).stage("open"):
+            doc = _shared_document(pdf_path)
+        page_count = doc.page_count
+        # 先查找结构化数据：只有图片的扫描件带有XML/OFD时仍可以提取
+        structured = find_structured(doc, pdf_path, timer)
+        if start == 0 and structured is None:
+            with (timer or NULL_TIMER).stage("triage"):
+                triage.require_text_layer(doc)
+        invoices = merge_structured(doc, structured, start, stop, regions, timer)
+        if stop is None or stop >= page_count:
+            # 文档的最后一个页块处理完后关闭，避免一直占用文件
+            _close_shared_document()
+        if sidecar_dir:
+            with (timer or NULL_TIMER).stage("sidecars"):
+                for page_number, data in invoices:
+                    save_sidecars(_sidecar_source(pdf_path), data, sidecar_dir, page_number)
+        result = (pdf_path, start, page_count, invoices, None)
+    except Exception as e:
+        _close_shared_document()
+        result = (pdf_path, start, page_count, None, str(e))
+    if low_memory and _open_document is None:
+        _release_after_document()
+    return result + (timer.as_dict(),) if timed else result
+
+def _release_after_document():
+    global _unreleased_documents
+    _unreleased_documents += 1
+    if _unreleased_documents >= LOW_MEMORY_RELEASE_DOCUMENTS:
+        release_cached_resources()
+        _unreleased_documents = 0
+
+def _cache_digest(source):
+    # 结果缓存的键：PDF内容的哈希，有同名XML/OFD文件时包括它的内容
+    return structured_invoice.cache_digest(source, source_digest(source))
+
+def _merge_timings(timings_list):
+    merged = {"stages": {}, "counters": {}}
+    for timings in timings_list:
+        for key in merged:
+            for name, value in timings[key].items():
+                merged[key][name] = merged[key].get(name, 0) + value
+    return merged
+
+def _merge(results):
+    # 合并同一文件各页块的结果，返回 (pdf_path, [(页码, 字段)], 错误信息[, 耗时])
+    invoices = []
+    error = None
+    for result in results:
+        if result[4] is not None:
+            error = error or result[4]
+        else:
+            invoices.extend(result[3])
+    if error is None and not invoices:
+        error = NO_INVOICE_ERROR
+    merged = (results[0][0], invoices if error is None else None, error)
+    if len(results[0]) > 5:
+        merged += (_merge_timings([result[5] for result in results]),)
+    return merged
+
+def _page_count(pdf_path):
+    # 读取失败时返回0，由工作进程报告具体错误
+    try:
+        with open_source(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+def _chunksize(total, workers):
+    # 文件很多时按块分发，减少进程间通信次数
+    return max(1, min(32, total // (workers * 8)))
+
+def _iter_extract(pdf_paths, workers, task, memory=None, pool=None):
+    """按输入顺序产出每个文件的提取结果，多个文件或多页文档时使用进程池
+
+    文件数不少于进程数时，每个文件先提交前 PAGES_PER_TASK 页，工作进程返回总页数后
+    再把剩余页块分发出去；文件比进程少（例如一个合并了几十张发票的PDF）时，
+    先在主进程读取页数，把页面平均拆分给所有进程
+    """
+    workers = workers or default_workers()
+    pages_per_task = PAGES_PER_TASK
+    page_counts = None
+    if len(pdf_paths) < workers:
+        page_counts = [max(_page_count(p), 1) for p in pdf_paths]
+        total_pages = sum(page_counts)
+        workers = min(workers, total_pages)
+        pages_per_task = max(1, min(PAGES_PER_TASK, -(-total_pages // max(workers, 1))))
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            yield _merge([task((pdf_path, 0, None))])
+        return
+
+    shared = pool is not None
+    pool = pool or WorkerPool(workers, memory)
+    try:
+        if page_counts is not None:
+            futures = [[pool.submit(task, [(pdf_path, start, start + pages_per_task)])
+                        for start in range(0, page_count, pages_per_task)]
+                       for pdf_path, page_count in zip(pdf_paths, page_counts)]
+            for file_futures in futures:
+                yield _merge([pool.result(future)[0] for future in file_futures])
+            return
+
+        units = [(pdf_path, 0, pages_per_task) for pdf_path in pdf_paths]
+        for first in _iter_chunks(pool, task, units, _chunksize(len(units), workers)):
+            pdf_path, _, page_count = first[:3]
+            rest = []
+            if first[4] is None:
+                rest = [pool.submit(task, [(pdf_path, start, start + pages_per_task)])
+                        for start in range(pages_per_task, page_count, pages_per_task)]
+            yield _merge([first] + [pool.result(future)[0] for future in rest])
+    finally:
+        # 调用方提前停止迭代（例如用户取消）时，取消还没开始的任务，只等待正在运行的任务；
+        # 调用方传入的进程池由调用方关闭
+        if not shared:
+            pool.shutdown()
+
+def _iter_chunks(pool, task, units, chunksize):
+    # 按块提交页块，减少进程间通信次数；同时排队的块数有上限，进程崩溃时要重新处理的页块也有上限
+    window = pool.workers * CHUNKS_PER_WORKER
+    pending = deque()
+    for i in range(0, len(units), chunksize):
+        pending.append(pool.submit(task, units[i:i + chunksize]))
+        if len(pending) >= window:
+            yield from pool.result(pending.popleft())
+    while pending:
+        yield from pool.result(pending.popleft())
+
+def _run_units(task, units):
+    # 在工作进程中依次处理一块页块
+    return [task(unit) for unit in units]
+
+class WorkerPool:
+    """处理页块的进程池，工作进程异常退出（例如损坏的PDF让PyMuPDF崩溃）时不中断整批处理
+
+    submit(task, units) 把几个页块交给一个工作进程依次处理，result(future) 返回它们的结果列表。
+    进程池崩溃时所有还没完成的任务都会失败：先换一个新的进程池，再把这些任务中的页块逐个单独处理，
+    单独处理时仍然崩溃的页块就是原因，结果中的错误信息为 CRASH_ERROR，其余页块照常返回结果。
+    调用方应限制同时提交的任务数，崩溃后需要逐个重新处理的页块数不超过这个上限
+    """
+
+    def __init__(self, workers, memory=None):
+        self.workers = workers
+        self.memory = memory
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # 已提交、还没取走结果的任务 -> (task, units)；崩溃后逐个重新处理得到的结果
+        self.pending = {}
+        self.recovered = {}
+
+    def submit(self, task, units):
+        try:
+            future = self.executor.submit(_run_units, task, units)
+        except BrokenProcessPool:
+            self._recover()
+            future = self.executor.submit(_run_units, task, units)
+        self.pending[future] = (task, units)
+        return future
+
+    def result(self, future):
+        if future not in self.recovered:
+            try:
+                future.result()
+            except BrokenProcessPool:
+                self._recover()
+        del self.pending[future]
+        if future in self.recovered:
+            return self.recovered.pop(future)
+        return future.result()
+
+    def _restart(self):
+        self.executor.shutdown(wait=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def _recover(self):
+        # 其余任务都已随进程池一起失败，逐个单独处理时新的进程池中只有这一个页块
+        self._restart()
+        for future, (task, units) in list(self.pending.items()):
+            if future in self.recovered or future.cancelled() or \
+                    not isinstance(future.exception(), BrokenProcessPool):
+                continue
+            self.recovered[future] = [self._run_alone(task, unit) for unit in units]
+
+    def _run_alone(self, task, unit):
+        try:
+            return self.executor.submit(task, unit).result()
+        except BrokenProcessPool:
+            self._restart()
+            result = (unit[0], unit[1], 0, None, CRASH_ERROR)
+            return result + (StageTimer().as_dict(),) if task.keywords.get("timed") else result
+
+    def shutdown(self):
+        _shutdown(self.executor, self.memory)
+
+def _shutdown(executor, memory=None):
+    # 工作进程退出前记录它们的峰值内存；cancel_futures 需要 Python 3.9
+    if memory is not None:
+        memory.sample_workers()
+    try:
+        executor.shutdown(wait=True, cancel_futures=True)
+    except TypeError:
+        executor.shutdown(wait=True)
+
+def _record(stats, result):
+    # 把工作进程返回的耗时记入统计，去掉耗时项后返回
+    if stats is None:
+        return result
+    stats.add_file(result[3])
+    if result[2] is not None:
+        stats.incr("failures")
+    return result[:3]
+
+def iter_batch(pdf_paths, workers=None, sidecar_dir=None, cache=None, regions=False, stats=None,
+               low_memory=False, memory=None, pool=None):
+    """按输入顺序逐个产出 (pdf_path, [(页码, 字段)], 错误信息)，每个文件中的每张发票对应一项
+
+    workers 为 None 时使用CPU核心数，为 1 或只有一个单页文件时在当前进程中串行处理；
+    多页文档按页块分给多个进程。
+    pdf_paths 中除了文件路径，也可以是 input_sources 的 ZipMember/PdfBytes，直接在内存中打开；
+    pdf_paths 不是列表（例如 SourceScanner 边扫描边产出的生成器）时流式处理：输入一边到达一边提交，
+    同时排队的文件数有上限，可以是 ScanEntry（按文件大小安排大文件的页块）；
+    传入 cache 时先在主进程中按内容哈希查缓存，只有未命中的文件才交给工作进程；
+    regions 为 True 时使用区域模式获取文本；
+    传入 stats（instrumentation.RunStats）时记录每个文件的分阶段耗时、缓存命中和失败数；
+    low_memory 为 True 时列表也按流式处理，每个进程同时只排队一个文件，大文件不预先拆分，
+    并定期清空PyMuPDF的资源缓存，内存占用不随文件数增长；
+    传入 memory（instrumentation.MemoryPeaks）时在关闭进程池前记录工作进程的峰值内存；
+    传入 pool（WorkerPool，进程数为 workers）时使用调用方长期持有的进程池，
+    不再每次创建，结束后也不关闭（例如监视文件夹模式每批只有几个文件）。
+    工作进程异常退出时重建进程池，导致崩溃的文件返回 CRASH_ERROR，其余文件不受影响（见 WorkerPool）
+    """
+    task = partial(extract_pages, sidecar_dir=sidecar_dir, regions=regions, timed=stats is not None,
+                   low_memory=low_memory)
+    try:
+        if isinstance(pdf_paths, (list, tuple)) and not low_memory:
+            yield from _iter_batch(list(pdf_paths), workers, sidecar_dir, cache, stats, task, memory, pool)
+        else:
+            yield from _iter_stream(iter(pdf_paths), workers, sidecar_dir, cache, stats, task, memory, low_memory,
+                                    pool)
+    finally:
+        # 串行处理时压缩包在当前进程中打开
+        close_archives()
+
+def _iter_batch(pdf_paths, workers, sidecar_dir, cache, stats, task, memory, pool=None):
+    if cache is None:
+        for result in _iter_extract(pdf_paths, workers, task, memory, pool):
+            yield _record(stats, result)
+        return
+
+    # 先查缓存，记录命中结果和未命中文件的哈希
+    cached = {}
+    digests = {}
+    misses = []
+    for pdf_path in pdf_paths:
+        try:
+            with (stats or NULL_TIMER).stage("hash"):
+                digest = _cache_digest(pdf_path)
+        except Exception:
+            # 读取失败的文件交给工作进程，由它报告具体错误
+            misses.append(pdf_path)
+            continue
+        invoices = cache.get(digest)
+        if invoices is None:
+            digests[pdf_path] = digest
+            misses.append(pdf_path)
+        else:
+            cached[pdf_path] = [(page_number, data) for page_number, data in invoices]
+
+    # 未命中的结果与命中的结果按原顺序合并
+    results = _iter_extract(misses, workers, task, memory, pool)
+    for pdf_path in pdf_paths:
+        if pdf_path in cached:
+            invoices = cached[pdf_path]
+            if sidecar_dir:
+                for page_number, data in invoices:
+                    save_sidecars(_sidecar_source(pdf_path), data, sidecar_dir, page_number)
+            if stats is not None:
+                stats.add_file()
+                stats.incr("cache_hits")
+            yield pdf_path, invoices, None
+            continue
+        result = _record(stats, next(results))
+        if stats is not None:
+            stats.incr("cache_misses")
+        if result[2] is None and pdf_path in digests:
+            cache.put(digests[pdf_path], result[1])
+        yield result
+
+def _iter_stream(sources, workers, sidecar_dir, cache, stats, task, memory=None, low_memory=False, pool=None):
+    # 流式处理：每个文件先提交第一个页块（大文件提交全部页块），排队的文件达到上限时
+    # 按输入顺序取出最早的文件合并结果，再继续读取输入
+    workers = workers or default_workers()
+    shared = pool is not None
+    if not shared and workers > 1:
+        pool = WorkerPool(workers, memory)
+    per_worker = LOW_MEMORY_FILES_PER_WORKER if low_memory else STREAM_FILES_PER_WORKER
+    window = workers * per_worker if pool is not None else 0
+    pending = deque()
+    try:
+        for item in sources:
+            if low_memory and isinstance(item, ScanEntry):
+                # 预先拆分要在主进程中打开大文件读取页数，低内存模式下由工作进程逐块处理
+                item = item.source
+            pending.append(_stream_start(item, pool, cache, stats, task))
+            while len(pending) > window:
+                yield _stream_finish(pending.popleft(), pool, sidecar_dir, cache, stats, task)
+        while pending:
+            yield _stream_finish(pending.popleft(), pool, sidecar_dir, cache, stats, task)
+    finally:
+        if pool is not None and not shared:
+            pool.shutdown()
+
+def _stream_start(item, pool, cache, stats, task):
+    # 返回 (pdf_path, 缓存结果, 内容哈希, [已提交的页块或串行结果], 是否已提交全部页块)
+    size = None
+    if isinstance(item, ScanEntry):
+        item, size = item.source, item.size
+    digest = None
+    if cache is not None:
+        try:
+            with (stats or NULL_TIMER).stage("hash"):
+                digest = _cache_digest(item)
+            invoices = cache.get(digest)
+            if invoices is not None:
+                return (item, invoices, digest, None, True)
+        except Exception:
+            # 读取失败的文件交给工作进程，由它报告具体错误
+            digest = None
+    if pool is None:
+        return (item, None, digest, [task((item, 0, None))], True)
+    if size is not None and size >= SPLIT_FILE_BYTES:
+        page_count = max(_page_count(item), 1)
+        units = [(item, start, start + PAGES_PER_TASK) for start in range(0, page_count, PAGES_PER_TASK)]
+        return (item, None, digest, [pool.submit(task, [unit]) for unit in units], True)
+    return (item, None, digest, [pool.submit(task, [(item, 0, PAGES_PER_TASK)])], False)
+
+def _stream_finish(entry, pool, sidecar_dir, cache, stats, task):
+    pdf_path, invoices, digest, parts, complete = entry
+    if invoices is not None:
+        invoices = [(page_number, data) for page_number, data in invoices]
+        if sidecar_dir:
+            for page_number, data in invoices:
+                save_sidecars(_sidecar_source(pdf_path), data, sidecar_dir, page_number)
+        if stats is not None:
+            stats.add_file()
+            stats.incr("cache_hits")
+        return pdf_path, invoices, None
+    results = [part if pool is None else pool.result(part)[0] for part in parts]
+    if not complete and results[0][4] is None:
+        page_count = results[0][2]
+        rest = [pool.submit(task, [(pdf_path, start, start + PAGES_PER_TASK)])
+                for start in range(PAGES_PER_TASK, page_count, PAGES_PER_TASK)]
+        results += [pool.result(future)[0] for future in rest]
+    result = _record(stats, _merge(results))
+    if cache is not None:
+        if stats is not None:
+            stats.incr("cache_misses")
+        if result[2] is None and digest is not None:
+            cache.put(digest, result[1])
+    return result
+
+def main(argv=None):
+    """命令行批处理入口"""
+    parser = argparse.ArgumentParser(description="发票批量提取（多进程）")
+    parser.add_argument("source", help="PDF文件、ZIP压缩包或包含它们的文件夹")
+    parser.add_argument("-o", "--output", required=True, help="输出文件夹，结果写入发票数据汇总.xlsx")
+    parser.add_argument("--format", default=",".join(output_sinks.DEFAULT_FORMATS),
+                        help="输出格式，可用逗号分隔同时输出多种：xlsx,csv,jsonl,sqlite（默认xlsx）")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹中的PDF和压缩包")
+    parser.add_argument("--restart", action="store_true",
+                        help="放弃上次中断的任务，从头处理所有文件（默认跳过已完成的文件继续处理）")
+    parser.add_argument("--recreate", action="store_true",
+                        help="现有汇总文件无法读取时备份并新建，而不是退出")
+    parser.add_argument("--sidecar-dir", default=None,
+                        help="同时把每张发票的JSON/CSV文件写到该文件夹（默认不写）")
+    parser.add_argument("--regions", action="store_true",
+                        help="区域模式：只解析表头、购/销信息和合计行附近的文本，找不到锚点时退回整页")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="低内存模式：限制同时处理的文件数，及时释放PyMuPDF缓存，内存占用不随文件数增长")
+    parser.add_argument("--no-cache", action="store_true", help="不使用结果缓存")
+    parser.add_argument("--clear-cache", action="store_true", help="处理前清空结果缓存（提取规则变化时使用）")
+    parser.add_argument("--stats", action="store_true", help="输出分阶段耗时和计数统计")
+    parser.add_argument("--stats-json", default=None, help="把分阶段统计保存为JSON报告")
+    args = parser.parse_args(argv)
+    try:
+        formats = output_sinks.parse_formats(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    stats = RunStats() if args.stats or args.stats_json else None
+    memory = MemoryPeaks()
+
+    entries = list(scan_sources(args.source, args.recursive))
+    if not entries:
+        print("没有找到PDF文件")
+        return 1
+
+    if args.sidecar_dir:
+        os.makedirs(args.sidecar_dir, exist_ok=True)
+
+    excel_path = os.path.join(args.output, excel_summary.SUMMARY_FILENAME)
+    os.makedirs(args.output, exist_ok=True)
+    existing_invoice_numbers = None
+    if "xlsx" in formats:
+        try:
+            with (stats or NULL_TIMER).stage("load_index"):
+                existing_invoice_numbers = excel_summary.load_invoice_numbers(excel_path)
+        except Exception as e:
+            if not args.recreate:
+                print(f"读取现有Excel文件时出错: {str(e)}（可使用 --recreate 备份并新建）")
+                return 1
+            excel_summary.backup_summary(excel_path)
+            existing_invoice_numbers = set()
+    try:
+        sink = output_sinks.open_sinks(args.output, formats, existing_invoice_numbers)
+    except Exception as e:
+        print(f"打开输出文件时出错: {str(e)}")
+        return 1
+    # 每个文件的结果先记入任务日志；上次中断时跳过已完成的文件，并补写还没写入输出文件的行
+    journal = job_journal.open_journal(args.output, args.restart)
+    pending = list(journal.pending(entries))
+    replay_rows = journal.begin(sink)
+    if journal.resumed:
+        print(f"继续上次中断的任务：跳过已完成的 {journal.skipped} 个文件，补写 {len(replay_rows)} 行")
+    # 结果按批在后台写入，不在内存中保留全部数据行
+    writer = output_sinks.BackgroundWriter(sink)
+    for row in replay_rows:
+        writer.add(row)
+    pending_entries = {entry.source: entry for entry in pending}
+    pdf_files = [entry.source for entry in pending]
+
+    cache = None if args.no_cache else result_cache.open_cache(args.output)
+    if cache is not None and args.clear_cache:
+        cache.invalidate_all()
+
+    total_files = len(pdf_files)
+    invoice_count = 0
+    failures = []
+    start = time.perf_counter()
+    try:
+        for index, (pdf_path, invoices, error) in enumerate(
+                iter_batch(pdf_files, args.workers, args.sidecar_dir, cache, args.regions, stats,
+                           args.low_memory, memory), 1):
+            pdf_file = source_name(pdf_path)
+            if journal.checkpoint_due():
+                writer.checkpoint(journal.checkpoint_callback())
+            if error is not None:
+                journal.record(pending_entries[pdf_path], [], error)
+                failures.append((pdf_file, error))
+                print(f"[{index}/{total_files}] 处理PDF文件 {pdf_file} 时出错: {error}")
+                continue
+            rows = [excel_summary.build_row(pdf_file, data, page_number) for page_number, data in invoices]
+            journal.record(pending_entries[pdf_path], rows)
+            for row in rows:
+                writer.add(row)
+            invoice_count += len(invoices)
+            if len(invoices) > 1:
+                print(f"[{index}/{total_files}] 成功处理文件: {pdf_file}（{len(invoices)} 张发票）")
+            else:
+                print(f"[{index}/{total_files}] 成功处理文件: {pdf_file}")
+    except BaseException:
+        # 中断时保留任务日志，下次运行从这里继续
+        journal.close()
+        raise
+    finally:
+        if cache is not None:
+            cache.close()
+    try:
+        with (stats or NULL_TIMER).stage("save_summary"):
+            duplicate_invoices = writer.close()
+    except Exception as e:
+        journal.close()
+        print(f"保存结果时出错: {str(e)}")
+        return 1
+    # 所有结果都已写入输出文件，任务完成
+    journal.close(finished=True)
+    elapsed = time.perf_counter() - start
+
+    for fmt in formats:
+        print(f"数据已保存到: {output_sinks.summary_path(args.output, fmt)}")
+
+    print(f"处理完成！成功 {total_files - len(failures)} 个文件（{invoice_count} 张发票），失败 {len(failures)} 个，"
+          f"耗时 {elapsed:.1f} 秒（{total_files / max(elapsed, 1e-9):.1f} 个/秒）")
+    if cache is not None:
+        print(f"缓存命中 {cache.hits} 个，未命中 {cache.misses} 个")
+    if duplicate_invoices:
+        print(f"发现 {len(duplicate_invoices)} 个重复发票号码，已跳过")
+    print(memory.describe())
+    if failures:
+        # 扫描件、无法读取的文件和提取失败的文件分类汇总，明细保存为报告
+        print(triage.describe_failures(failures))
+        report_path = os.path.join(args.output, triage.REPORT_FILENAME)
+        triage.write_report(report_path, failures)
+        print(f"未提取的文件已保存到: {report_path}")
+    if stats is not None:
+        stats.incr("duplicates", len(duplicate_invoices))
+        stats.peak_rss = memory.as_dict()
+        if args.stats:
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+            stats.log_summary()
+        if args.stats_json:
+            stats.write_report(args.stats_json)
+            print(f"统计报告已保存到: {args.stats_json}")
+    return 0 if not failures else 2
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
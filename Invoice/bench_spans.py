@@ -0,0 +1,112 @@
+"""比较字典列表与 SpanTable 两种span表示的内存占用和耗时
+
+用法:
+    python bench_spans.py                 # 使用合成的 page.get_text("dict") 数据
+    python bench_spans.py --spans 20000   # 指定合成span数量
+    python bench_spans.py a.pdf b.pdf     # 使用真实PDF的第一页
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from get_coordinates import spans_from_text_dict, extract_invoice_fields
+
+def legacy_coordinates(text_dict):
+    """原来的实现：列表当队列用 pop(0)，每个span一个字典"""
+    coordinates = []
+    items_to_process = [(block, "block") for block in text_dict["blocks"]]
+    while items_to_process:
+        item, item_type = items_to_process.pop(0)
+        if item_type == "block" and "lines" in item:
+            items_to_process.extend([(line, "line") for line in item["lines"]])
+        elif item_type == "line":
+            items_to_process.extend([(span, "span") for span in item["spans"]])
+        elif item_type == "span":
+            text = ''.join(item["text"].split())
+            if text:
+                if text.replace('.', '').replace('E', '').replace('+', '').replace('-', '').isdigit():
+                    text = "'" + text
+                coordinates.append({
+                    "text": text,
+                    "left": float(round(item["bbox"][0], 2)),
+                    "top": float(round(item["bbox"][1], 2)),
+                    "right": float(round(item["bbox"][2], 2)),
+                    "bottom": float(round(item["bbox"][3], 2))
+                })
+    return coordinates
+
+def synthetic_text_dict(n_spans, spans_per_line=4, lines_per_block=5):
+    """生成与 page.get_text("dict") 结构相同的合成数据（含购/销/合计等锚点）"""
+    anchors = ["电子发票（普通发票）", "24110000000000000", "2024年01月15日",
+               "购", "销", "息", "息", "合计", "¥1000.00", "¥60.00", "价税合计（大写）", "¥1060.00"]
+    blocks = []
+    lines = []
+    for i in range(n_spans):
+        text = anchors[i] if i < len(anchors) else ("商品%d" % (i % 50) if i % 3 else "%d.00" % i)
+        y = 20 + i * 0.5
+        x = 30 + (i % spans_per_line) * 120
+        span = {"text": text, "bbox": (x + 0.123, y + 0.456, x + 60.789, y + 9.012),
+                "font": "SimSun", "size": 9.0, "color": 0, "flags": 0, "origin": (x, y + 8)}
+        if not lines or len(lines[-1]["spans"]) >= spans_per_line:
+            lines.append({"spans": [], "wmode": 0, "dir": (1.0, 0.0), "bbox": span["bbox"]})
+        lines[-1]["spans"].append(span)
+    for k in range(0, len(lines), lines_per_block):
+        blocks.append({"type": 0, "lines": lines[k:k + lines_per_block], "bbox": (0, 0, 0, 0)})
+    return {"width": 595, "height": 420, "blocks": blocks}
+
+def load_text_dicts(pdf_paths):
+    import fitz  # PyMuPDF
+    text_dicts = []
+    for pdf_path in pdf_paths:
+        doc = fitz.open(pdf_path)
+        text_dicts.append(doc[0].get_text("dict"))
+        doc.close()
+    return text_dicts
+
+def measure(build, text_dicts, repeat):
+    """返回 (平均构建耗时, 构建结果保留的内存, 平均提取耗时)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text_dict in text_dicts:
+            build(text_dict)
+    build_time = (time.perf_counter() - start) / repeat
+
+    gc.collect()
+    tracemalloc.start()
+    results = [build(text_dict) for text_dict in text_dicts]
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for result in results:
+            try:
+                extract_invoice_fields(result)
+            except ValueError:
+                pass  # 没有文本的页面
+    extract_time = (time.perf_counter() - start) / repeat
+    return build_time, retained, extract_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="span表示方式的内存/耗时对比")
+    parser.add_argument("pdfs", nargs="*", help="PDF文件（不指定则使用合成数据）")
+    parser.add_argument("--spans", type=int, default=5000, help="合成数据的span数量")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    args = parser.parse_args(argv)
+
+    if args.pdfs:
+        text_dicts = load_text_dicts(args.pdfs)
+    else:
+        text_dicts = [synthetic_text_dict(args.spans)]
+    total_spans = sum(len(spans_from_text_dict(text_dict)) for text_dict in text_dicts)
+    print(f"页面数: {len(text_dicts)}，span数: {total_spans}")
+
+    for name, build in (("字典列表(pop(0))", legacy_coordinates), ("SpanTable", spans_from_text_dict)):
+        build_time, retained, extract_time = measure(build, text_dicts, args.repeat)
+        print(f"{name:<16} 构建 {build_time * 1000:8.2f} ms  "
+              f"内存 {retained / 1024:9.1f} KB  "
+              f"提取 {extract_time * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
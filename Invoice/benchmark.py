@@ -0,0 +1,159 @@
+"""发票提取基准测试：分阶段吞吐量、延迟百分位和准确率
+
+用法:
+    python benchmark.py --generate 1000 [--corpus 目录]   # 生成合成发票后测试
+    python benchmark.py --corpus 目录 [--regions] [-j 4] [--json report.json]
+
+单进程逐个文件测量各阶段耗时（打开PDF、get_text、span转换、字段提取），
+指定 -j 时再用批处理引擎测一次多进程端到端吞吐量。准确率按
+<文件名>.truth.json 中的字段真值计算。
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+
+from get_coordinates import extract_invoice_fields, get_text_spans
+from instrumentation import StageTimer, percentile
+from batch_process import find_pdf_files, iter_batch
+import synthetic_invoices
+
+STAGES = ["open", "get_text", "spans", "extract", "total"]
+
+def time_one(pdf_path, regions=False):
+    """测量单个文件各阶段耗时，返回 (耗时字典, 字段)"""
+    timer = StageTimer()
+    start = time.perf_counter()
+    spans = get_text_spans(pdf_path, regions, timer)
+    with timer.stage("extract"):
+        fields = extract_invoice_fields(spans)
+    timings = dict(timer.stages)
+    timings["total"] = time.perf_counter() - start
+    return timings, fields
+
+def summarize(samples):
+    """samples: {阶段: [秒]}，返回每阶段的统计（毫秒）和吞吐量（个/秒）"""
+    report = {}
+    for stage in STAGES:
+        values = sorted(samples[stage])
+        total = sum(values)
+        report[stage] = {
+            "count": len(values),
+            "mean_ms": total / len(values) * 1000 if values else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000 if values else 0.0,
+            "files_per_sec": len(values) / total if total else 0.0
+        }
+    return report
+
+def score(results):
+    """results: [(字段, 真值)]，返回逐字段和整张发票的准确率"""
+    compared = [(fields, truth) for fields, truth in results if truth is not None]
+    if not compared:
+        return None
+    field_hits = {key: 0 for key in compared[0][1]}
+    exact = 0
+    for fields, truth in compared:
+        all_ok = True
+        for key, value in truth.items():
+            if fields is not None and fields.get(key) == value:
+                field_hits[key] += 1
+            else:
+                all_ok = False
+        exact += all_ok
+    return {
+        "invoices": len(compared),
+        "exact": exact / len(compared),
+        "fields": {key: hits / len(compared) for key, hits in field_hits.items()}
+    }
+
+def run(pdf_files, regions=False, workers=None):
+    samples = {stage: [] for stage in STAGES}
+    results = []
+    failures = 0
+    for pdf_path in pdf_files:
+        truth = synthetic_invoices.load_truth(pdf_path)
+        try:
+            timings, fields = time_one(pdf_path, regions)
+        except Exception:
+            failures += 1
+            results.append((None, truth))
+            continue
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds)
+        results.append((fields, truth))
+
+    report = {
+        "files": len(pdf_files),
+        "failures": failures,
+        "regions": regions,
+        "stages": summarize(samples),
+        "accuracy": score(results)
+    }
+
+    if workers:
+        start = time.perf_counter()
+        for _ in iter_batch(pdf_files, workers, regions=regions):
+            pass
+        elapsed = time.perf_counter() - start
+        report["batch"] = {
+            "workers": workers,
+            "seconds": elapsed,
+            "files_per_sec": len(pdf_files) / elapsed if elapsed else 0.0
+        }
+    return report
+
+def print_report(report):
+    print(f"文件数: {report['files']}，失败: {report['failures']}，区域模式: {report['regions']}")
+    print(f"{'阶段':<10}{'平均ms':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'个/秒':>12}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<10}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+              f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}{s['files_per_sec']:>12.1f}")
+    if "batch" in report:
+        b = report["batch"]
+        print(f"多进程端到端（{b['workers']} 进程）: {b['seconds']:.2f} 秒，{b['files_per_sec']:.1f} 个/秒")
+    accuracy = report["accuracy"]
+    if accuracy:
+        print(f"准确率（{accuracy['invoices']} 张有真值）: 整张 {accuracy['exact']:.2%}")
+        for key, value in accuracy["fields"].items():
+            print(f"  {key:<16}{value:.2%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="发票提取基准测试")
+    parser.add_argument("--corpus", default=None, help="发票文件夹（配合 --generate 时为生成目录）")
+    parser.add_argument("--generate", type=int, default=0, help="先生成指定数量的合成发票")
+    parser.add_argument("--max-items", type=int, default=20, help="合成发票最多的商品行数")
+    parser.add_argument("--seed", type=int, default=0, help="合成发票的随机种子")
+    parser.add_argument("--regions", action="store_true", help="测试区域模式")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="同时测试多进程端到端吞吐量")
+    parser.add_argument("--json", default=None, help="把结果保存为JSON文件")
+    args = parser.parse_args(argv)
+
+    corpus = args.corpus
+    if args.generate:
+        corpus = corpus or tempfile.mkdtemp(prefix="invoice_bench_")
+        start = time.perf_counter()
+        synthetic_invoices.generate_corpus(corpus, args.generate, args.seed, max_items=args.max_items)
+        print(f"已生成 {args.generate} 张合成发票到 {corpus}（{time.perf_counter() - start:.1f} 秒）")
+    if not corpus:
+        parser.error("请指定 --corpus 或 --generate")
+
+    pdf_files = find_pdf_files(corpus)
+    if not pdf_files:
+        print("没有找到PDF文件")
+        return 1
+    report = run(pdf_files, args.regions, args.workers)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"结果已保存到: {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import argparse
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_process import default_workers, find_pdf_files
+from get_coordinates import NO_INVOICE_ERROR, annotate_document
+from input_sources import close_archives, open_source, source_key, source_name
+
+# 清单文件名（放在输出文件夹中），每个写完的分片一行，记录其中的来源
+MANIFEST_FILENAME = "manifest.jsonl"
+# 每个分片最多的页数（一页发票一行），分片在文件边界切分
+DEFAULT_SHARD_PAGES = 10000
+# 每个任务最多处理的文件数
+SOURCES_PER_TASK = 16
+# 每个进程最多同时排队的任务数
+TASKS_PER_WORKER = 4
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+def export_sources(sources):
+    """在工作进程中为一组来源生成标注，返回 [(来源标识, [JSON行], 错误信息)]
+
+    每个文档只打开一次、每页只获取一次文本（见 annotate_document）；
+    JSON行在工作进程中序列化好，主进程只负责写入
+    """
+    results = []
+    try:
+        for source in sources:
+            key = source_key(source)
+            try:
+                with open_source(source) as doc:
+                    annotations = annotate_document(doc, source_name(source))
+                if not annotations:
+                    raise ValueError(NO_INVOICE_ERROR)
+                lines = [_dumps(dict(annotation, source=key, page=page_number))
+                         for page_number, annotation in annotations]
+                results.append((key, lines, None))
+            except Exception as e:
+                results.append((key, None, str(e)))
+    finally:
+        close_archives()
+    return results
+
+class ShardWriter:
+    """按页数切分的JSONL分片
+
+    分片先写入 .tmp 临时文件，写满（或结束）后刷盘、改名，再在清单中追加一行记录其中的来源；
+    中途退出时未完成的分片被丢弃，重新运行时其中的来源会重新导出
+    """
+
+    def __init__(self, output_dir, shard_pages=DEFAULT_SHARD_PAGES, compress=False, retry_failed=False):
+        self.output_dir = output_dir
+        self.shard_pages = shard_pages
+        self.compress = compress
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        # 已导出（以及已失败，retry_failed 为 False 时）的来源
+        self.done = set()
+        self.index = 0
+        for entry in self._read_manifest():
+            self.index += 1
+            self.done.update(entry["sources"])
+            if not retry_failed:
+                self.done.update(key for key, _ in entry["failed"])
+        for name in os.listdir(output_dir):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(output_dir, name))
+        self.manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        self.raw = None
+        self.file = None
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return []
+        entries = []
+        with open(self.manifest_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 写清单时中断留下的不完整行，对应的分片按未完成处理
+                    break
+        return entries
+
+    def shard_name(self, index):
+        return f"shard-{index:05d}.jsonl" + (".gz" if self.compress else "")
+
+    def _open(self):
+        self.path = os.path.join(self.output_dir, self.shard_name(self.index))
+        self.raw = open(self.path + ".tmp", 'wb')
+        stream = gzip.GzipFile(fileobj=self.raw, mode='wb') if self.compress else self.raw
+        self.file = io.TextIOWrapper(stream, encoding='utf-8', newline='\n')
+        self.pages = 0
+        self.sources = []
+        self.failed = []
+
+    def add(self, key, lines, error):
+        """写入一个来源的标注行，出错的来源只记入清单"""
+        if self.file is None:
+            self._open()
+        if error is not None:
+            self.failed.append([key, error])
+        else:
+            self.file.write("\n".join(lines))
+            self.file.write("\n")
+            self.pages += len(lines)
+            self.sources.append(key)
+        if self.pages >= self.shard_pages:
+            self.finish()
+
+    def finish(self):
+        """结束当前分片：刷盘后改名，并在清单中记录；返回分片文件名，没有内容时返回None"""
+        if self.file is None:
+            return None
+        self.file.flush()
+        stream = self.file.detach()
+        if self.compress:
+            # GzipFile 关闭时写入结尾，不会关闭底层文件
+            stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        self.file = self.raw = None
+        name = None
+        if self.pages:
+            name = self.shard_name(self.index)
+            os.replace(self.path + ".tmp", self.path)
+        else:
+            os.remove(self.path + ".tmp")
+        self.manifest.write(_dumps({"shard": name, "pages": self.pages,
+                                    "sources": self.sources, "failed": self.failed}) + "\n")
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+        self.index += 1
+        return name
+
+    def close(self):
+        self.finish()
+        self.manifest.close()
+
+def _chunks(sources, workers):
+    # 文件较少时减小每个任务的文件数，让所有进程都有任务
+    size = max(1, min(SOURCES_PER_TASK, len(sources) // (workers * TASKS_PER_WORKER)))
+    return [sources[i:i + size] for i in range(0, len(sources), size)]
+
+def _iter_results(chunks, workers):
+    # 按输入顺序产出每个任务的结果，同时排队的任务数有上限
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield export_sources(chunk)
+        return
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(export_sources, chunk))
+            if len(pending) >= workers * TASKS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+def export_dataset(sources, output_dir, workers=None, shard_pages=DEFAULT_SHARD_PAGES, compress=False,
+                   retry_failed=False):
+    """把来源导出为训练数据分片，已在清单中的来源跳过
+
+    返回 (跳过的文件数, 导出的文件数, 导出的页数, [(来源标识, 错误信息)])
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or default_workers()
+    writer = ShardWriter(output_dir, shard_pages, compress, retry_failed)
+    todo = [source for source in sources if source_key(source) not in writer.done]
+    exported = 0
+    pages = 0
+    failures = []
+    try:
+        for results in _iter_results(_chunks(todo, workers), workers):
+            for key, lines, error in results:
+                if error is not None:
+                    failures.append((key, error))
+                else:
+                    exported += 1
+                    pages += len(lines)
+                index = writer.index
+                writer.add(key, lines, error)
+                if writer.index != index:
+                    print(f"已写入分片 {writer.shard_name(index)}（已导出 {exported} 个文件）")
+    finally:
+        # 中断时已完成的来源同样写入分片，下次从这里继续
+        writer.close()
+    return len(sources) - len(todo), exported, pages, failures
+
+def main(argv=None):
+    """命令行入口：批量导出训练数据"""
+    parser = argparse.ArgumentParser(description="把发票批量导出为训练数据（带坐标的JSONL分片）")
+    parser.add_argument("source", help="PDF文件、ZIP压缩包或包含它们的文件夹")
+    parser.add_argument("-o", "--output", required=True, help="输出文件夹，写入 shard-*.jsonl 和清单")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹中的PDF和压缩包")
+    parser.add_argument("--shard-pages", type=int, default=DEFAULT_SHARD_PAGES,
+                        help=f"每个分片最多的页数（默认{DEFAULT_SHARD_PAGES}）")
+    parser.add_argument("--gzip", action="store_true", help="分片用gzip压缩（.jsonl.gz）")
+    parser.add_argument("--retry-failed", action="store_true", help="重新导出之前失败的文件")
+    args = parser.parse_args(argv)
+    if args.shard_pages < 1:
+        parser.error("--shard-pages 必须大于0")
+
+    sources = find_pdf_files(args.source, args.recursive)
+    if not sources:
+        print("没有找到PDF文件")
+        return 1
+
+    start = time.perf_counter()
+    skipped, exported, pages, failures = export_dataset(
+        sources, args.output, args.workers, args.shard_pages, args.gzip, args.retry_failed)
+    elapsed = time.perf_counter() - start
+    print(f"导出完成！新增 {exported} 个文件（{pages} 页），失败 {len(failures)} 个，跳过已导出的 {skipped} 个，"
+          f"耗时 {elapsed:.1f} 秒（{exported / max(elapsed, 1e-9):.1f} 个/秒）")
+    for key, error in failures:
+        print(f"失败: {key}: {error}")
+    return 0 if not failures else 2
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
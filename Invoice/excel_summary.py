@@ -0,0 +1,345 @@
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+# openpyxl 导入较慢，只在新建文件、扫描旧文件和流式追加失败时才用到，在这些函数中再导入
+
+# 汇总文件名
+SUMMARY_FILENAME = "发票数据汇总.xlsx"
+
+# 定义列标题
+COLUMNS = ["文件名", "页码", "发票类型", "发票号码", "开票日期",
+           "采购方名称", "采购方纳税人识别号",
+           "销售方名称", "销售方纳税人识别号",
+           "金额", "税额", "价税合计"]
+# 旧版汇总文件的表头（没有页码列），读取时自动升级
+LEGACY_COLUMNS = [col for col in COLUMNS if col != "页码"]
+
+# 发票号码索引文件后缀，索引保存在汇总文件旁边，去重时不需要读取xlsx
+INDEX_SUFFIX = ".index"
+# 索引文件第一行为定长的校验信息，追加时可以原地改写
+INDEX_HEADER = "#invoice-index v2 size={:020d} mtime={:020d} rows={:012d}\n"
+INDEX_HEADER_PATTERN = re.compile(r"#invoice-index v2 size=(\d{20}) mtime=(\d{20}) rows=(\d{12})")
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+def build_row(file_name, data, page_number=1):
+    """将extract_invoice_fields的结果转换为汇总表的一行，page_number 为发票所在页码（从1开始）"""
+    return {
+        "文件名": file_name,
+        "页码": page_number,
+        "发票类型": data.get("invoice_type", ""),
+        "发票号码": data.get("invoice_number", ""),
+        "开票日期": data.get("invoice_date", ""),
+        "采购方名称": data.get("buyer_name", ""),
+        "采购方纳税人识别号": data.get("buyer_tax_id", ""),
+        "销售方名称": data.get("seller_name", ""),
+        "销售方纳税人识别号": data.get("seller_tax_id", ""),
+        "金额": data.get("net_amount", ""),
+        "税额": data.get("tax_amount", ""),
+        "价税合计": data.get("total_amount", "")
+    }
+
+def backup_summary(excel_path):
+    """将现有汇总文件重命名为 .bak 备份，并删除对应的发票号码索引"""
+    _remove_index(excel_path)
+    if os.path.exists(excel_path):
+        backup_path = excel_path + '.bak'
+        try:
+            os.rename(excel_path, backup_path)
+            print(f"已将原文件备份为: {backup_path}")
+        except Exception as e:
+            print(f"备份文件时出错: {str(e)}")
+
+def index_path(excel_path):
+    return excel_path + INDEX_SUFFIX
+
+def _remove_index(excel_path):
+    try:
+        os.remove(index_path(excel_path))
+    except OSError:
+        pass
+
+def _stamp(excel_path):
+    stat = os.stat(excel_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _read_index(excel_path):
+    """读取索引，返回 (发票号码集合, 已用行数)；索引不存在或与汇总文件不一致时返回None"""
+    try:
+        with open(index_path(excel_path), 'r', encoding='utf-8') as f:
+            match = INDEX_HEADER_PATTERN.match(f.readline())
+            if not match:
+                return None
+            size, mtime, rows = (int(x) for x in match.groups())
+            if (size, mtime) != _stamp(excel_path):
+                return None
+            numbers = set(line.rstrip('\n') for line in f)
+    except OSError:
+        return None
+    numbers.discard('')
+    return numbers, rows
+
+def _write_index(excel_path, numbers, rows):
+    """重写整个索引"""
+    size, mtime = _stamp(excel_path)
+    tmp_path = index_path(excel_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(INDEX_HEADER.format(size, mtime, rows))
+        for number in numbers:
+            f.write(f"{number}\n")
+    os.replace(tmp_path, index_path(excel_path))
+
+def _append_index(excel_path, numbers, rows):
+    """在索引末尾追加新发票号码，并原地更新校验信息"""
+    size, mtime = _stamp(excel_path)
+    with open(index_path(excel_path), 'r+', encoding='utf-8', newline='\n') as f:
+        f.seek(0, os.SEEK_END)
+        for number in numbers:
+            f.write(f"{number}\n")
+        f.flush()
+        f.seek(0)
+        f.write(INDEX_HEADER.format(size, mtime, rows))
+
+def _scan_summary(excel_path):
+    """只读方式扫描汇总文件，验证表头并返回 (发票号码集合, 已用行数)
+
+    旧版没有页码列的汇总文件会先插入页码列再扫描
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(excel_path, read_only=True)
+    legacy = False
+    try:
+        ws = wb.active
+        invoice_number_col = COLUMNS.index("发票号码")
+        numbers = set()
+        rows = 0
+        for rows, row in enumerate(ws.iter_rows(values_only=True), 1):
+            if rows == 1:
+                # 验证表头是否匹配
+                if _header_matches(row, LEGACY_COLUMNS):
+                    legacy = True
+                    break
+                if not _header_matches(row, COLUMNS):
+                    raise ValueError("现有Excel文件的表头与程序不匹配")
+                continue
+            if len(row) > invoice_number_col and row[invoice_number_col]:
+                numbers.add(str(row[invoice_number_col]))
+        if rows == 0:
+            raise ValueError("现有Excel文件的表头与程序不匹配")
+    finally:
+        wb.close()
+    if legacy:
+        _upgrade_legacy(excel_path)
+        return _scan_summary(excel_path)
+    return numbers, rows
+
+def _header_matches(row, columns):
+    return list(row[:len(columns)]) == columns and all(v is None for v in row[len(columns):])
+
+def _upgrade_legacy(excel_path):
+    """旧版汇总文件插入页码列，已有数据的页码记为1"""
+    from openpyxl import load_workbook
+    wb = load_workbook(excel_path)
+    ws = wb.active
+    col = COLUMNS.index("页码") + 1
+    ws.insert_cols(col)
+    ws.cell(row=1, column=col, value="页码")
+    for row in range(2, ws.max_row + 1):
+        ws.cell(row=row, column=col, value=1)
+    wb.save(excel_path)
+    print(f"已为汇总文件添加页码列: {excel_path}")
+
+def load_invoice_numbers(excel_path):
+    """返回汇总文件中已有的发票号码集合，优先使用索引，文件不存在时返回空集合
+
+    索引与汇总文件不一致（例如在Excel中编辑过）时重新扫描并重建索引。
+    表头不匹配或文件损坏时抛出异常，由调用方决定是否备份重建
+    """
+    if not os.path.exists(excel_path):
+        return set()
+    state = _read_index(excel_path)
+    if state is None:
+        numbers, rows = _scan_summary(excel_path)
+        _write_index(excel_path, numbers, rows)
+        return numbers
+    return state[0]
+
+def summary_rows(excel_path):
+    """汇总文件已用的行数（包括表头），文件不存在时为0"""
+    if not os.path.exists(excel_path):
+        return 0
+    # 只读取索引的第一行，不读取全部发票号码
+    try:
+        with open(index_path(excel_path), 'r', encoding='utf-8') as f:
+            match = INDEX_HEADER_PATTERN.match(f.readline())
+    except OSError:
+        match = None
+    if match:
+        size, mtime, rows = (int(x) for x in match.groups())
+        if (size, mtime) == _stamp(excel_path):
+            return rows
+    numbers, rows = _scan_summary(excel_path)
+    _write_index(excel_path, numbers, rows)
+    return rows
+
+def invoice_numbers_after(excel_path, row):
+    """汇总文件第 row 行之后各行的发票号码集合（只读方式逐行读取）"""
+    from openpyxl import load_workbook
+    wb = load_workbook(excel_path, read_only=True)
+    try:
+        col = COLUMNS.index("发票号码")
+        return {str(values[col]) for values in wb.active.iter_rows(min_row=max(row, 1) + 1, values_only=True)
+                if len(values) > col and values[col]}
+    finally:
+        wb.close()
+
+def _first_sheet_part(zin):
+    # 通过 workbook.xml 和关系文件找到第一个工作表的路径
+    workbook = ET.fromstring(zin.read("xl/workbook.xml"))
+    sheet = workbook.find(f"{{{_MAIN_NS}}}sheets/{{{_MAIN_NS}}}sheet")
+    rel_id = sheet.get(f"{{{_REL_NS}}}id")
+    rels = ET.fromstring(zin.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.findall(f"{{{_PKG_REL_NS}}}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            if target.startswith("/"):
+                return target[1:]
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise ValueError("汇总文件中找不到工作表")
+
+def _rows_xml(rows, first_row):
+    # 新数据行使用内联字符串，空值不写单元格
+    parts = []
+    for row_number, invoice_data in enumerate(rows, first_row):
+        cells = []
+        for col, column in enumerate(COLUMNS):
+            value = invoice_data[column]
+            if value is None or value == "":
+                continue
+            ref = f"{chr(ord('A') + col)}{row_number}"
+            if isinstance(value, int):
+                # 页码等整数写为数字单元格，与openpyxl写入的一致
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+                continue
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>')
+        parts.append(f'<row r="{row_number}">{"".join(cells)}</row>')
+    return "".join(parts).encode("utf-8")
+
+def _splice_sheet(src, dst, rows_data, last_row):
+    """流式复制工作表XML，在 </sheetData> 前插入新行并更新 dimension"""
+    end_tag = b"</sheetData>"
+    head = b""
+    # 读到 <sheetData 为止，更新其中的 dimension
+    while b"<sheetData" not in head:
+        chunk = src.read(64 * 1024)
+        if not chunk:
+            raise ValueError("工作表中找不到sheetData")
+        head += chunk
+    last_col = chr(ord('A') + len(COLUMNS) - 1)
+    dimension = f'<dimension ref="A1:{last_col}{last_row}"'.encode()
+    head = re.sub(rb'<dimension ref="[^"]*"', lambda m: dimension, head, count=1)
+    if re.search(rb"<sheetData\s*/>", head):
+        head = re.sub(rb"<sheetData\s*/>", lambda m: b"<sheetData>" + rows_data + end_tag, head, count=1)
+        dst.write(head)
+        shutil.copyfileobj(src, dst)
+        return
+
+    pending = head
+    while True:
+        pos = pending.find(end_tag)
+        if pos >= 0:
+            dst.write(pending[:pos])
+            dst.write(rows_data)
+            dst.write(pending[pos:])
+            shutil.copyfileobj(src, dst)
+            return
+        # 保留末尾可能被截断的结束标签
+        keep = len(end_tag) - 1
+        dst.write(pending[:-keep])
+        pending = pending[-keep:]
+        chunk = src.read(1024 * 1024)
+        if not chunk:
+            raise ValueError("工作表中找不到sheetData结束标签")
+        pending += chunk
+
+def _append_xlsx_rows(excel_path, rows, first_row):
+    """不加载工作簿，直接在xlsx压缩包中流式追加数据行"""
+    tmp_path = excel_path + '.tmp'
+    try:
+        with zipfile.ZipFile(excel_path) as zin, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+            sheet_part = _first_sheet_part(zin)
+            rows_data = _rows_xml(rows, first_row)
+            for info in zin.infolist():
+                with zin.open(info) as src, zout.open(info, 'w', force_zip64=True) as dst:
+                    if info.filename == sheet_part:
+                        _splice_sheet(src, dst, rows_data, first_row + len(rows) - 1)
+                    else:
+                        shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, excel_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _create_streaming(excel_path, rows):
+    """以只写模式创建新的汇总文件"""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(COLUMNS)
+    for invoice_data in rows:
+        ws.append([invoice_data[col] for col in COLUMNS])
+    wb.save(excel_path)
+
+def save_rows(excel_path, rows, existing_invoice_numbers):
+    """按发票号码去重后把数据行追加到汇总文件，返回被跳过的重复发票号码列表
+
+    existing_invoice_numbers 一般来自 load_invoice_numbers，会被更新。
+    新文件以只写模式创建；已有文件直接在压缩包中追加行，不加载整个工作簿，
+    耗时只与新增行数和文件大小的字节复制有关。无法流式追加时退回openpyxl
+    """
+    new_rows = []
+    duplicate_invoices = []
+    for invoice_data in rows:
+        invoice_number = invoice_data["发票号码"]
+        if invoice_number in existing_invoice_numbers:
+            duplicate_invoices.append(invoice_number)
+            continue
+        new_rows.append(invoice_data)
+        existing_invoice_numbers.add(invoice_number)
+    if not new_rows:
+        return duplicate_invoices
+
+    new_numbers = [r["发票号码"] for r in new_rows if r["发票号码"]]
+    if not os.path.exists(excel_path):
+        _create_streaming(excel_path, new_rows)
+        _write_index(excel_path, new_numbers, len(new_rows) + 1)
+        return duplicate_invoices
+
+    state = _read_index(excel_path)
+    if state is None:
+        state = _scan_summary(excel_path)
+        _write_index(excel_path, state[0], state[1])
+    rows_used = state[1]
+    try:
+        _append_xlsx_rows(excel_path, new_rows, rows_used + 1)
+    except (KeyError, ValueError, AttributeError, ET.ParseError) as e:
+        # 结构不是预期的xlsx，使用openpyxl完整加载后追加
+        print(f"无法流式追加，改为完整加载Excel文件: {str(e)}")
+        from openpyxl import load_workbook
+        wb = load_workbook(excel_path)
+        ws = wb.active
+        for invoice_data in new_rows:
+            ws.append([invoice_data[col] for col in COLUMNS])
+        wb.save(excel_path)
+        numbers, rows_used = _scan_summary(excel_path)
+        _write_index(excel_path, numbers, rows_used)
+        return duplicate_invoices
+    _append_index(excel_path, new_numbers, rows_used + len(new_rows))
+    return duplicate_invoices
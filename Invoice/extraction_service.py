@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from get_coordinates import extract_pdf, extract_pdf_bytes
+from instrumentation import percentile
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 等待提取的请求数上限，队列满时直接返回503，由调用方稍后重试
+DEFAULT_QUEUE_DEPTH = 64
+# 等待提取的PDF内容总大小上限（字节）
+DEFAULT_QUEUE_BYTES = 256 * 1024 * 1024
+# 每批最多合并的小请求数
+DEFAULT_BATCH_SIZE = 8
+# 不超过该大小的PDF才会与其他请求合并成一批
+SMALL_REQUEST_BYTES = 256 * 1024
+# 单个请求体的大小上限
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# 统计延迟分位数时保留的最近请求数
+LATENCY_WINDOW = 4096
+
+class HttpError(Exception):
+    """请求格式错误，返回对应状态码后关闭连接"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _warm_up(_):
+    # 工作进程启动时已经导入了 get_coordinates（以及 fitz），这里再打开一次空文档，
+    # 让第一个请求不用承担初始化的开销
+    import fitz
+    fitz.open().close()
+    return os.getpid()
+
+def extract_batch(jobs, regions=False):
+    """在工作进程中提取一批请求，jobs 为 [(类型, 内容)]，类型为 "bytes"（PDF内容）或 "path"（文件路径）
+
+    返回 [(invoices, 错误信息)]，单个请求出错不影响同一批中的其他请求
+    """
+    results = []
+    for kind, payload in jobs:
+        try:
+            if kind == "bytes":
+                invoices = extract_pdf_bytes(payload, regions)
+            else:
+                invoices = extract_pdf(payload, regions=regions)
+            results.append((invoices, None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+class ExtractionService:
+    """把提取请求分发到预先启动的进程池
+
+    请求先进入有界队列，队列满（或排队的PDF总大小超限）时 submit 抛出 asyncio.QueueFull；
+    同时在进程池中的批次数不超过进程数的两倍，其余请求在队列中等待。
+    分发时把队列中已经在等待的小请求合并成一批交给一个工作进程，减少进程间往返；
+    负载低时每批只有一个请求，不会为了凑批而增加延迟（batch_wait 大于0时才会等待）
+    """
+
+    def __init__(self, workers=None, queue_depth=DEFAULT_QUEUE_DEPTH, queue_bytes=DEFAULT_QUEUE_BYTES,
+                 batch_size=DEFAULT_BATCH_SIZE, batch_wait=0.0, regions=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth
+        self.queue_bytes = queue_bytes
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.regions = regions
+        self.pool = None
+        self.queue = None
+        self.slots = None
+        self.dispatcher = None
+        self.queued_bytes = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"requests": 0, "rejected": 0, "failed": 0, "batches": 0, "batched_requests": 0}
+
+    async def start(self):
+        """启动进程池并等待所有工作进程就绪，返回就绪的进程数"""
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_depth)
+        self.slots = asyncio.Semaphore(self.workers * 2)
+        pids = await self._start_pool()
+        self.dispatcher = loop.create_task(self._dispatch())
+        return len(set(pids))
+
+    async def _start_pool(self):
+        loop = asyncio.get_running_loop()
+        self.pool = ProcessPoolExecutor(self.workers)
+        # 同时提交与进程数相同的预热任务，进程池会启动全部工作进程
+        return await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_up, i)
+                                      for i in range(self.workers)))
+
+    async def submit(self, kind, payload):
+        """提交一个请求并等待结果 (invoices, 错误信息)；队列已满时抛出 asyncio.QueueFull"""
+        size = len(payload) if kind == "bytes" else 0
+        if self.queued_bytes + size > self.queue_bytes and self.queued_bytes:
+            raise asyncio.QueueFull()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((kind, payload, future))
+        self.queued_bytes += size
+        return await future
+
+    def _take(self):
+        item = self.queue.get_nowait()
+        if item[0] == "bytes":
+            self.queued_bytes -= len(item[1])
+        return item
+
+    async def _dispatch(self):
+        carry = None
+        while True:
+            await self.slots.acquire()
+            if carry is None:
+                batch = [await self.queue.get()]
+                if batch[0][0] == "bytes":
+                    self.queued_bytes -= len(batch[0][1])
+            else:
+                batch, carry = [carry], None
+            if _batchable(batch[0]):
+                if self.batch_wait > 0 and self.queue.empty():
+                    await asyncio.sleep(self.batch_wait)
+                # 只合并已经在排队的请求，遇到大文件时结束本批，大文件下一批单独处理
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    item = self._take()
+                    if not _batchable(item):
+                        carry = item
+                        break
+                    batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        self.counters["batches"] += 1
+        self.counters["batched_requests"] += len(batch)
+        self.in_flight += len(batch)
+        jobs = [(kind, payload) for kind, payload, future in batch]
+        try:
+            result = loop.run_in_executor(self.pool, partial(extract_batch, regions=self.regions), jobs)
+        except Exception as e:
+            # 进程池已损坏（submit 直接抛出异常）
+            result = loop.create_future()
+            result.set_exception(e)
+        result.add_done_callback(partial(self._finish_batch, batch, self.pool))
+
+    def _finish_batch(self, batch, pool, result):
+        self.slots.release()
+        self.in_flight -= len(batch)
+        error = asyncio.CancelledError("服务已停止") if result.cancelled() else result.exception()
+        if isinstance(error, BrokenProcessPool) and pool is self.pool:
+            # 某个工作进程异常退出（例如损坏的PDF导致崩溃），同批和同时在处理的请求都会失败，
+            # 换一个新的进程池继续服务
+            print(f"工作进程异常退出，正在重启进程池: {str(error)}")
+            self.pool.shutdown(wait=False)
+            self.pool = ProcessPoolExecutor(self.workers)
+            for i in range(self.workers):
+                self.pool.submit(_warm_up, i)
+        outcomes = [(None, f"提取失败: {str(error)}")] * len(batch) if error else result.result()
+        for (kind, payload, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "queued_bytes": self.queued_bytes,
+            "in_flight": self.in_flight,
+            "counters": dict(self.counters),
+            "latency_ms": {
+                "p50": percentile(latencies, 50) * 1000,
+                "p95": percentile(latencies, 95) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000
+            }
+        }
+
+    async def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+def _batchable(item):
+    kind, payload, future = item
+    return kind == "path" or len(payload) <= SMALL_REQUEST_BYTES
+
+async def _read_head(reader):
+    """读取请求行和请求头，连接正常关闭时返回None"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HttpError(400, "请求不完整")
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "请求头过大")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HttpError(400, "请求行格式错误")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(411, "需要 Content-Length，不支持分块传输")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length 格式错误")
+    if length < 0:
+        raise HttpError(400, "Content-Length 格式错误")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"请求体超过 {MAX_BODY_BYTES // (1024 * 1024)} MB")
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+    return method.upper(), target, headers, length, keep_alive
+
+def _write_response(writer, status, payload, keep_alive=True, extra_headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            "Connection: " + ("keep-alive" if keep_alive else "close")]
+    head.extend(f"{name}: {value}" for name, value in extra_headers)
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+def _invoices_json(invoices):
+    return {"invoices": [{"page": page_number, "fields": fields} for page_number, fields in invoices]}
+
+class ServiceProtocol:
+    """最小的HTTP/1.1接口（支持keep-alive）
+
+    POST /extract   请求体为PDF内容；或 Content-Type 为 application/json、内容为 {"path": "..."}，
+                    或使用查询参数 ?path=...，按路径读取服务所在机器上的文件。
+                    返回 {"invoices": [{"page": 页码, "fields": 字段}]}，字段与 extract_invoice_fields 相同
+    GET /health     服务状态
+    GET /stats      队列深度、批次计数和最近请求的延迟分位数
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_head(reader)
+                    if request is None:
+                        break
+                    method, target, headers, length, keep_alive = request
+                    url = urlsplit(target)
+                    body = await reader.readexactly(length) if length else b""
+                except HttpError as e:
+                    _write_response(writer, e.status, {"error": str(e)}, False)
+                    await writer.drain()
+                    break
+                started = time.perf_counter()
+                status, payload, extra_headers = await self.route(method, url, headers, body)
+                if url.path == "/extract" and status != 503:
+                    self.service.record_latency(time.perf_counter() - started)
+                _write_response(writer, status, payload, keep_alive, extra_headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # 客户端中途断开
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, url, headers, body):
+        if url.path == "/health":
+            return 200, {"status": "ok", "workers": self.service.workers}, ()
+        if url.path == "/stats":
+            return 200, self.service.stats(), ()
+        if url.path != "/extract":
+            return 404, {"error": f"未知路径: {url.path}"}, ()
+        if method != "POST":
+            return 405, {"error": "请使用POST提交PDF"}, [("Allow", "POST")]
+
+        query = parse_qs(url.query)
+        if "path" in query:
+            kind, payload = "path", query["path"][0]
+        elif headers.get("content-type", "").split(";")[0].strip().lower() == "application/json":
+            try:
+                kind, payload = "path", str(json.loads(body.decode("utf-8"))["path"])
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": 'JSON请求体须为 {"path": "PDF文件路径"}'}, ()
+        elif body:
+            kind, payload = "bytes", body
+        else:
+            return 400, {"error": "请求体为空"}, ()
+
+        self.service.counters["requests"] += 1
+        try:
+            invoices, error = await self.service.submit(kind, payload)
+        except asyncio.QueueFull:
+            self.service.counters["rejected"] += 1
+            return 503, {"error": "服务繁忙，请稍后重试"}, [("Retry-After", "1")]
+        if error is not None:
+            self.service.counters["failed"] += 1
+            return 422, {"error": error}, ()
+        return 200, _invoices_json(invoices), ()
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    """启动进程池并在指定地址上提供服务，直到被取消"""
+    ready = await service.start()
+    protocol = ServiceProtocol(service)
+    if unix_path:
+        server = await asyncio.start_unix_server(protocol.handle, path=unix_path)
+        address = unix_path
+    else:
+        server = await asyncio.start_server(protocol.handle, host, port)
+        address = f"http://{host}:{port}"
+    print(f"提取服务已启动: {address}（{ready} 个工作进程，Ctrl+C 退出）")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+def main(argv=None):
+    """提取服务入口"""
+    parser = argparse.ArgumentParser(description="本地发票提取服务：通过HTTP提交PDF内容或路径，返回JSON格式的发票字段")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址，默认 {DEFAULT_HOST}（只接受本机连接）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口，默认 {DEFAULT_PORT}")
+    if hasattr(asyncio, "start_unix_server"):
+        parser.add_argument("--unix", default=None, help="改为监听该Unix套接字文件")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="等待提取的请求数上限，超过时返回503")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批最多合并的小请求数")
+    parser.add_argument("--batch-wait", type=float, default=0.0,
+                        help="凑批最多等待的毫秒数，默认不等待（只合并已经在排队的请求）")
+    parser.add_argument("--regions", action="store_true", help="使用区域模式获取文本")
+    args = parser.parse_args(argv)
+
+    service = ExtractionService(args.workers, args.queue_depth, batch_size=args.batch_size,
+                                batch_wait=args.batch_wait / 1000, regions=args.regions)
+    try:
+        asyncio.run(serve(service, args.host, args.port, getattr(args, "unix", None)))
+    except KeyboardInterrupt:
+        print("提取服务已停止")
+    except OSError as e:
+        print(f"无法启动提取服务: {str(e)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
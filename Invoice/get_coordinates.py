@@ -1,218 +1,238 @@
 import fitz  # PyMuPDF
+import sys
+from array import array
+
+from instrumentation import NULL_TIMER
+from invoice_rules import COORDINATE_TOLERANCE, ENGINE
+import structured_invoice
+import triage
 import json
 import os
 import csv
-import re
 
-# 坐标匹配误差范围（单位：点）
-COORDINATE_TOLERANCE = 8
-# 发票号码和开票日期的特殊容差
-DATE_NUMBER_TOLERANCE = 2
+# 提取规则版本，修改提取规则后需要递增，使结果缓存失效
+EXTRACTOR_VERSION = "4"
+# 多页文档中一张发票都没有找到时的错误信息
+NO_INVOICE_ERROR = "PDF中没有找到发票"
+# 获取文本时不需要图片数据：图片块没有文本，不影响提取结果，却要复制整张图片的内容
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+# 表头和购/销信息区域的锚点字
+REGION_HEADER_CHARS = "购销息"
+# 合计/价税合计行的锚点字
+REGION_ROW_CHARS = "合计"
 
-def get_text_coordinates(pdf_path):
-    """获取PDF中文本的坐标信息，使用迭代方式处理"""
-    doc = fitz.open(pdf_path)
-    page = doc[0]
-    coordinates = []
-    
-    # 获取所有文本块
-    text_dict = page.get_text("dict")
-    
-    # 使用列表来存储待处理的项目，而不是递归
-    items_to_process = [(block, "block") for block in text_dict["blocks"]]
-    
-    while items_to_process:
-        item, item_type = items_to_process.pop(0)
-        
-        if item_type == "block" and "lines" in item:
-            # 将lines添加到待处理列表
-            items_to_process.extend([(line, "line") for line in item["lines"]])
-        
-        elif item_type == "line":
-            # 将spans添加到待处理列表
-            items_to_process.extend([(span, "span") for span in item["spans"]])
-        
-        elif item_type == "span":
-            # 处理文本span
-            text = ''.join(item["text"].split())
-            if text:
+class Span:
+    """单个span的轻量记录，支持 span["text"] 形式的访问以兼容原来的字典格式"""
+    __slots__ = ("text", "left", "top", "right", "bottom")
+    KEYS = ("text", "left", "top", "right", "bottom")
+
+    def __init__(self, text, left, top, right, bottom):
+        self.text = text
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+class SpanTable:
+    """紧凑的span容器：文本列表 + left/top/right/bottom 四个 array('d')
+
+    相比每个span一个字典，内存占用小得多；按下标访问时返回 Span 记录
+    """
+    __slots__ = ("text", "left", "top", "right", "bottom")
+
+    def __init__(self):
+        self.text = []
+        self.left = array('d')
+        self.top = array('d')
+        self.right = array('d')
+        self.bottom = array('d')
+
+    def append(self, text, left, top, right, bottom):
+        self.text.append(text)
+        self.left.append(left)
+        self.top.append(top)
+        self.right.append(right)
+        self.bottom.append(bottom)
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, i):
+        return Span(self.text[i], self.left[i], self.top[i], self.right[i], self.bottom[i])
+
+    def __iter__(self):
+        for i in range(len(self.text)):
+            yield self[i]
+
+    def to_dicts(self):
+        """转换为原来的字典列表格式"""
+        return [{"text": text, "left": left, "top": top, "right": right, "bottom": bottom}
+                for text, left, top, right, bottom
+                in zip(self.text, self.left, self.top, self.right, self.bottom)]
+
+    @classmethod
+    def from_dicts(cls, coordinates):
+        """由字典列表格式构建"""
+        spans = cls()
+        for coord in coordinates:
+            spans.append(coord["text"], coord["left"], coord["top"], coord["right"], coord["bottom"])
+        return spans
+
+def spans_from_text_dict(text_dict):
+    """将 page.get_text("dict") 的结果按 block/line/span 顺序转换为 SpanTable"""
+    spans = SpanTable()
+    for block in text_dict["blocks"]:
+        # 图片块没有lines
+        for line in block.get("lines", ()):
+            for span in line["spans"]:
+                # 处理文本span
+                text = ''.join(span["text"].split())
+                if not text:
+                    continue
                 # 如果文本是数字，在前面加上单引号
                 if text.replace('.', '').replace('E', '').replace('+', '').replace('-', '').isdigit():
                     text = "'" + text
-                coordinates.append({
-                    "text": text,
-                    "left": float(round(item["bbox"][0], 2)),
-                    "top": float(round(item["bbox"][1], 2)),
-                    "right": float(round(item["bbox"][2], 2)),
-                    "bottom": float(round(item["bbox"][3], 2))
-                })
-    
-    doc.close()
-    return coordinates
+                bbox = span["bbox"]
+                spans.append(sys.intern(text),
+                             float(round(bbox[0], 2)),
+                             float(round(bbox[1], 2)),
+                             float(round(bbox[2], 2)),
+                             float(round(bbox[3], 2)))
+    return spans
 
-def extract_invoice_fields(coordinates):
-    """提取发票字段信息"""
-    fields = {
-        "invoice_type": "",
-        "invoice_number": "",
-        "invoice_date": "",
-        "buyer_name": "",
-        "buyer_tax_id": "",
-        "seller_name": "",
-        "seller_tax_id": "",
-        "net_amount": "",
-        "tax_amount": "",
-        "total_amount": ""
-    }
-    
-    # 获取文件的最大right值
-    max_right = max(coord["right"] for coord in coordinates)
-    
-    # 1. 发票类型提取规则
-    if coordinates:
-        # 直接选择 top 值最小的文本作为发票类型
-        top_coord = min(coordinates, key=lambda x: x["top"])
-        fields["invoice_type"] = top_coord["text"]
-    
-    # 2. 发票号码和开票日期提取规则
-    # 按 top 值排序所有坐标
-    sorted_coords = sorted(coordinates, key=lambda x: x["top"])
-    
-    # 找到"购"字的位置
-    gou_index = len(sorted_coords)
-    for i, coord in enumerate(sorted_coords):
-        if coord["text"] == "购":
-            gou_index = i
-            break
-    
-    # 在"购"字之前的文本中查找发票号码和开票日期
-    for coord in sorted_coords[:gou_index]:
-        text = coord["text"].replace("'", "")  # 移除可能的单引号前缀
-        
-        # 检查发票号码：长度超过6位的纯数字
-        if text.isdigit() and len(text) > 6 and not fields["invoice_number"]:
-            fields["invoice_number"] = text
-        
-        # 检查开票日期：长度为11的包含数字但不是纯数字字符串
-        if len(text) == 11 and any(c.isdigit() for c in text) and not text.isdigit() and not fields["invoice_date"]:
-            fields["invoice_date"] = text
-    
-    # 4. 购买方和销售方信息提取规则
-    gou = None
-    xiao = None
-    xin_xi_list = []
-    
-    for coord in coordinates:
-        if coord["text"] == "购":
-            gou = coord
-        elif coord["text"] == "销":
-            xiao = coord
-        elif coord["text"] == "息":
-            xin_xi_list.append(coord)
-    
-    if gou and xiao and len(xin_xi_list) >= 2:
-        # 确定信息区域边界
-        bottom = max(x["bottom"] for x in xin_xi_list)
-        right_min = min(x["right"] for x in xin_xi_list)
-        right_max = max(x["right"] for x in xin_xi_list)
-        
-        # 提取购买方信息
-        buyer_info = []
-        for coord in coordinates:
-            if (coord["top"] >= gou["top"] and 
-                coord["bottom"] <= bottom and 
-                coord["left"] >= gou["right"] and 
-                coord["right"] <= xiao["left"]):
-                if coord["text"] not in ["名称", "统一社会信用代码/纳税人识别号:"]:
-                    buyer_info.append(coord)
-        
-        # 分离名称和税号
-        for info in buyer_info:
-            if any(c.isdigit() for c in info["text"]):
-                fields["buyer_tax_id"] = info["text"]
-            else:
-                fields["buyer_name"] = info["text"]
-        
-        # 提取销售方信息
-        seller_info = []
-        for coord in coordinates:
-            if (coord["top"] >= xiao["top"] and 
-                coord["bottom"] <= bottom and 
-                coord["left"] >= xiao["right"] and 
-                coord["right"] <= max_right):
-                if coord["text"] not in ["名称", "统一社会信用代码/纳税人识别号:"]:
-                    seller_info.append(coord)
-        
-        # 分离销售方名称和税号
-        for info in seller_info:
-            if any(c.isdigit() for c in info["text"]):
-                fields["seller_tax_id"] = info["text"].replace("'", "")
-            else:
-                fields["seller_name"] = info["text"]
-    
-    # 4. 金额和税额提取规则
-    he_ji = None
-    he = None
-    ji = None
-    
-    # 先尝试找完整的"合计"
-    for coord in coordinates:
-        if coord["text"] == "合计":
-            he_ji = coord
-            break
-    
-    # 如果没找到完整的"合计"，尝试找分开的"合"和"计"
-    if not he_ji:
-        for coord in coordinates:
-            if coord["text"] == "合":
-                he = coord
-            elif coord["text"] == "计":
-                ji = coord
-            # 如果都找到了，检查是否在同一水平线上
-            if he and ji and abs(he["top"] - ji["top"]) < COORDINATE_TOLERANCE:
-                # 创建一个虚拟的合计坐标对象
-                he_ji = {
-                    "text": "合计",
-                    "left": he["left"],
-                    "top": he["top"],
-                    "right": ji["right"],
-                    "bottom": ji["bottom"]
-                }
-                break
-    
-    if he_ji:
-        amounts = []
-        for coord in coordinates:
-            if (abs(coord["top"] - he_ji["top"]) < COORDINATE_TOLERANCE and 
-                any(c.isdigit() for c in coord["text"])):
-                text = coord["text"].replace("¥", "").replace("'", "")
-                amounts.append((float(coord["left"]), text))
-        
-        if len(amounts) >= 2:
-            amounts.sort(key=lambda x: x[0])
-            fields["net_amount"] = amounts[0][1]
-            fields["tax_amount"] = amounts[1][1]
+def region_spans_from_textpage(textpage):
+    """区域模式：只转换提取规则可能用到的文本块，找不到锚点时返回None
+
+    先用 extractBLOCKS 做一次廉价的锚点扫描，保留以下文本块：
+    - 表头到购/销信息区域（最下方含"购""销""息"的块）之间的块
+    - 含"合""计"的块，以及与其上下 COORDINATE_TOLERANCE 行带相交的块
+    其余的块（主要是商品明细行）不含任何锚点字，也不在任何查询区域内，
+    跳过它们不会改变提取结果
+    """
+    header_bottom = None
+    row_bands = []
+    blocks = textpage.extractBLOCKS()
+    for x0, y0, x1, y1, text, block_no, block_type in blocks:
+        if any(c in text for c in REGION_HEADER_CHARS):
+            header_bottom = y1 if header_bottom is None else max(header_bottom, y1)
+        if any(c in text for c in REGION_ROW_CHARS):
+            row_bands.append((y0 - COORDINATE_TOLERANCE - 1, y1 + COORDINATE_TOLERANCE + 1))
+    if header_bottom is None:
+        return None
     
-    # 5. 价税合计提取规则
-    jia_shui_he_ji = None
-    for coord in coordinates:
-        if "价税合计" in coord["text"]:
-            jia_shui_he_ji = coord
-            break
+    keep = set()
+    for x0, y0, x1, y1, text, block_no, block_type in blocks:
+        # 坐标会四舍五入到两位小数，区域边界放宽1个点
+        if (y0 <= header_bottom + 1 or 
+            any(c in text for c in REGION_ROW_CHARS) or 
+            any(low <= y1 and y0 <= high for low, high in row_bands)):
+            keep.add(block_no)
     
-    if jia_shui_he_ji:
-        for coord in coordinates:
-            if (abs(coord["top"] - jia_shui_he_ji["top"]) < COORDINATE_TOLERANCE and 
-                any(c.isdigit() for c in coord["text"])):
-                fields["total_amount"] = coord["text"].replace("¥", "").replace("'", "")
+    text_dict = textpage.extractDICT()
+    text_dict["blocks"] = [block for block in text_dict["blocks"] if block["number"] in keep]
+    return spans_from_text_dict(text_dict)
+
+def page_spans(page, regions=False, timer=None):
+    """获取已打开页面中文本的坐标信息，返回 SpanTable
+
+    regions 为 True 时使用区域模式（跳过与提取无关的文本块），
+    找不到锚点时退回整页提取；两种模式的提取结果相同。
+    传入 timer（instrumentation.StageTimer）时记录 get_text/spans 各阶段耗时和span数
+    """
+    timer = timer or NULL_TIMER
+    spans = None
+    if regions:
+        with timer.stage("get_text"):
+            textpage = page.get_textpage(flags=TEXT_FLAGS)
+        with timer.stage("spans"):
+            spans = region_spans_from_textpage(textpage)
+        if spans is None:
+            with timer.stage("get_text"):
+                text_dict = textpage.extractDICT()
+    else:
+        with timer.stage("get_text"):
+            # 获取所有文本块
+            text_dict = page.get_text("dict", flags=TEXT_FLAGS)
+    if spans is None:
+        with timer.stage("spans"):
+            spans = spans_from_text_dict(text_dict)
+    timer.count("spans", len(spans))
+    return spans
+
+def release_cached_resources():
+    """清空PyMuPDF在进程内缓存的字体、图片等资源，低内存模式下每个文档处理完后调用"""
+    fitz.TOOLS.store_shrink(100)
+
+def get_text_spans(pdf_path, regions=False, timer=None, page_number=0):
+    """获取PDF第 page_number 页（从0开始）中文本的坐标信息，返回 SpanTable"""
+    timer = timer or NULL_TIMER
+    with timer.stage("open"):
+        doc = fitz.open(pdf_path)
+    try:
+        return page_spans(doc[page_number], regions, timer)
+    finally:
+        doc.close()
+
+def get_text_coordinates(pdf_path, page_number=0):
+    """获取PDF中文本的坐标信息，返回字典列表"""
+    return get_text_spans(pdf_path, page_number=page_number).to_dicts()
+
+def extract_invoice_fields(coordinates):
+    """提取发票字段信息，coordinates 可以是 SpanTable 或字典列表"""
+    spans = coordinates if isinstance(coordinates, SpanTable) else SpanTable.from_dicts(coordinates)
     
-    return fields
+    # 字段规则见 invoice_rules，一次遍历span收集所有锚点和候选值
+    return ENGINE.extract_fields(spans)
+
+# 标注中记录的字段
+ANNOTATION_FIELDS = ("invoice_type", "invoice_number", "invoice_date", "buyer_name", "buyer_tax_id",
+                     "seller_name", "seller_tax_id", "net_amount", "tax_amount", "total_amount")
+
+def build_annotation(spans, fields, width, height, filename):
+    """由已提取的span和字段构建标注，结构与 create_annotation 相同，但坐标为数值"""
+    annotation = {name: fields[name] for name in ANNOTATION_FIELDS}
+    annotation["nGrams"] = [
+        {"words": [{"text": text, "left": left, "top": top, "right": right, "bottom": bottom}], "parses": {}}
+        for text, left, top, right, bottom in zip(spans.text, spans.left, spans.top, spans.right, spans.bottom)
+    ]
+    annotation["height"] = round(height, 2)
+    annotation["width"] = round(width, 2)
+    annotation["filename"] = filename
+    return annotation
 
-def create_annotation(pdf_path, coordinates):
-    """创建标注文件"""
+def annotate_document(doc, filename):
+    """一次遍历已打开的文档，返回每张发票的标注 [(页码, 标注)]，页码从1开始
+
+    页面尺寸直接取自已打开的页面，每页只获取一次文本、提取一次字段；
+    跳过的页面与 extract_document 相同
+    """
+    page_count = doc.page_count
+    annotations = []
+    for page_number in range(page_count):
+        page = doc[page_number]
+        spans = page_spans(page)
+        if not spans:
+            continue
+        fields = extract_invoice_fields(spans)
+        if page_count == 1 or is_invoice_page(fields):
+            rect = page.rect
+            annotations.append((page_number + 1, build_annotation(spans, fields, rect.width, rect.height, filename)))
+    return annotations
+
+def create_annotation(pdf_path, coordinates, page_number=0):
+    """创建标注文件，coordinates 为第 page_number 页（从0开始）的坐标
+
+    坐标保存为字符串；批量导出训练数据见 annotate_document 和 dataset_export
+    """
     # 获取PDF尺寸
     doc = fitz.open(pdf_path)
-    page = doc[0]
+    page = doc[page_number]
     width = page.rect.width
     height = page.rect.height
     doc.close()
@@ -254,40 +274,152 @@ def create_annotation(pdf_path, coordinates):
     
     return annotation
 
-def process_pdf(pdf_path):
+def is_invoice_page(fields):
+    """多页文档中判断页面是否为一张发票：有发票号码或价税合计"""
+    return bool(fields["invoice_number"] or fields["total_amount"])
+
+def extract_document(doc, start=0, stop=None, regions=False, timer=None):
+    """提取已打开文档中第 [start, stop) 页（从0开始）的发票，返回 [(页码, 字段)]，页码从1开始
+
+    没有文本的页面（扫描件）总是跳过；单页文档有文本时与原来一样总是返回一张发票，
+    多页文档中不像发票的页面（例如销货清单）会被跳过
+    """
+    timer = timer or NULL_TIMER
+    page_count = doc.page_count
+    stop = page_count if stop is None else min(stop, page_count)
+    invoices = []
+    for page_number in range(start, stop):
+        spans = page_spans(doc[page_number], regions, timer)
+        if not spans:
+            continue
+        with timer.stage("extract"):
+            fields = extract_invoice_fields(spans)
+        if page_count == 1 or is_invoice_page(fields):
+            invoices.append((page_number + 1, fields))
+    timer.count("pages", max(stop - start, 0))
+    return invoices
+
+def find_structured(doc, source=None, timer=None):
+    """查找已打开文档的结构化发票数据（见 structured_invoice.find_invoice），没有时返回None"""
+    timer = timer or NULL_TIMER
+    with timer.stage("structured"):
+        return structured_invoice.find_invoice(doc, source)
+
+def merge_structured(doc, structured, start=0, stop=None, regions=False, timer=None):
+    """按结构化数据 structured（为None时即 extract_document）提取第 [start, stop) 页的发票
+
+    单页文档直接使用结构化数据，不再获取文本。多页文档（例如合并了多张发票的PDF）仍按版式规则
+    逐页提取，结构化数据只替换发票号码相同的那一页；整个文档都没有文本层（只有图片的扫描件）时，
+    结构化数据作为第1页的发票
+    """
+    timer = timer or NULL_TIMER
+    if structured is None:
+        return extract_document(doc, start, stop, regions, timer)
+    if doc.page_count == 1:
+        timer.count("structured")
+        return [(1, structured)] if start == 0 else []
+    invoices = extract_document(doc, start, stop, regions, timer)
+    for k, (page_number, fields) in enumerate(invoices):
+        if fields["invoice_number"] == structured["invoice_number"]:
+            timer.count("structured")
+            invoices[k] = (page_number, structured)
+            return invoices
+    if not invoices and start == 0 and triage.classify_document(doc) == triage.IMAGE_ONLY:
+        timer.count("structured")
+        return [(1, structured)]
+    return invoices
+
+def extract_structured_or_layout(doc, source=None, start=0, stop=None, regions=False, timer=None):
+    """先查找结构化发票数据，再按 merge_structured 提取，参数与 extract_document 相同"""
+    return merge_structured(doc, find_structured(doc, source, timer), start, stop, regions, timer)
+
+def extract_pdf(pdf_path, cache=None, regions=False, timer=None):
+    """提取PDF中每一页的发票字段，直接在内存中返回 [(页码, 字段)]，不写任何文件
+
+    带有结构化发票数据（内嵌或同名的XML/OFD文件，见 structured_invoice）时直接使用其中的字段；
+    传入 cache（result_cache.ResultCache）时，内容未变化的PDF直接返回缓存结果；
+    regions 为 True 时使用区域模式获取文本（见 page_spans）；
+    传入 timer 时记录各阶段耗时。没有找到任何发票时抛出 ValueError
+    """
+    if cache is not None:
+        digest = structured_invoice.cache_digest(pdf_path, cache.digest(pdf_path))
+        invoices = cache.get(digest)
+        if invoices is not None:
+            return [(page_number, fields) for page_number, fields in invoices]
+    
+    timer = timer or NULL_TIMER
+    with timer.stage("open"):
+        doc = fitz.open(pdf_path)
     try:
-        # 获取PDF文件的目录和文件名（不含扩展名）
-        pdf_dir = os.path.dirname(pdf_path)
-        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        
-        # 获取文本和坐标
-        coordinates = get_text_coordinates(pdf_path)
-        
-        # 提取发票字段
-        invoice_data = extract_invoice_fields(coordinates)
-        
-        # 创建JSON文件路径
-        json_path = os.path.join(pdf_dir, f"{pdf_name}.json")
-        
-        # 保存JSON数据
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(invoice_data, f, ensure_ascii=False, indent=4)
-        print(f"Created {json_path}")
-        
-        # 创建CSV文件路径
-        csv_path = os.path.join(pdf_dir, f"{pdf_name}.csv")
+        invoices = extract_structured_or_layout(doc, pdf_path, regions=regions, timer=timer)
+    finally:
+        doc.close()
+    if not invoices:
+        raise ValueError(NO_INVOICE_ERROR)
+    
+    if cache is not None:
+        cache.put(digest, invoices)
+    return invoices
+
+def extract_pdf_bytes(data, regions=False, timer=None):
+    """与 extract_pdf 相同，但直接从内存中的PDF内容提取，不写临时文件（只使用内嵌的结构化数据）"""
+    timer = timer or NULL_TIMER
+    with timer.stage("open"):
+        doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        invoices = extract_structured_or_layout(doc, regions=regions, timer=timer)
+    finally:
+        doc.close()
+    if not invoices:
+        raise ValueError(NO_INVOICE_ERROR)
+    return invoices
+
+def save_sidecars(pdf_path, invoice_data, output_dir=None, page_number=1):
+    """将字段保存为 <文件名>.json 和 <文件名>.csv，默认保存在PDF所在目录
+
+    第2页及以后的发票保存为 <文件名>_p<页码>.json/.csv
+    """
+    # 获取输出目录和文件名（不含扩展名）
+    pdf_dir = output_dir or os.path.dirname(pdf_path)
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    if page_number > 1:
+        pdf_name = f"{pdf_name}_p{page_number}"
+    
+    # 创建JSON文件路径
+    json_path = os.path.join(pdf_dir, f"{pdf_name}.json")
+    
+    # 保存JSON数据
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(invoice_data, f, ensure_ascii=False, indent=4)
+    print(f"Created {json_path}")
+    
+    # 创建CSV文件路径
+    csv_path = os.path.join(pdf_dir, f"{pdf_name}.csv")
+    
+    # 保存CSV数据
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['字段', '值'])
+        for key, value in invoice_data.items():
+            if key != 'nGrams':  # 排除nGrams字段
+                writer.writerow([key, value])
+    print(f"Created {csv_path}")
+    return json_path, csv_path
+
+def process_pdf(pdf_path, output_dir=None):
+    """提取字段并为每张发票写出JSON/CSV文件，返回 [(页码, 字段)]，出错时返回None"""
+    try:
+        # 提取每一页的发票字段
+        invoices = extract_pdf(pdf_path)
         
-        # 保存CSV数据
-        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['字段', '值'])
-            for key, value in invoice_data.items():
-                if key != 'nGrams':  # 排除nGrams字段
-                    writer.writerow([key, value])
-        print(f"Created {csv_path}")
+        # 保存JSON和CSV文件
+        for page_number, invoice_data in invoices:
+            save_sidecars(pdf_path, invoice_data, output_dir, page_number)
+        return invoices
         
     except Exception as e:
         print(f"处理文件时出错 {pdf_path}: {str(e)}")
+        return None
 
 def main():
     """主函数，用于测试单个PDF文件处理"""
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from collections import namedtuple
+
+# 输入可以是PDF文件路径（字符串），也可以是下面两种内存来源。两者都是普通元组，
+# 可以直接交给工作进程，也可以比较是否为同一来源。
+
+# ZIP压缩包中的一个PDF：archive 为压缩包路径，member 为包内的原始条目名，
+# name 为解码后的条目名（写入汇总表的 文件名）
+ZipMember = namedtuple("ZipMember", "archive member name")
+# 内存中的PDF内容，例如邮件附件或上游程序传来的数据
+PdfBytes = namedtuple("PdfBytes", "name data")
+# 扫描文件夹得到的输入及其大小和修改时间（压缩包条目为解压后的大小和压缩包的修改时间）
+ScanEntry = namedtuple("ScanEntry", "source size mtime_ns")
+
+# 后台扫描每攒够多少条或隔多少秒把新条目交给读取方
+SCAN_FLUSH_ENTRIES = 256
+SCAN_FLUSH_SECONDS = 0.05
+
+# ZIP条目名使用UTF-8编码时设置的标志位，否则按本地编码（国内通常为GBK）解码
+ZIP_UTF8_FLAG = 0x800
+
+# 当前进程中打开的压缩包 (路径, ZipFile)，同一压缩包的多个条目不重复读取目录
+_open_archive = None
+
+def is_pdf_name(name):
+    return name.lower().endswith('.pdf')
+
+def is_zip_name(name):
+    return name.lower().endswith('.zip')
+
+def _member_name(info):
+    # 没有UTF-8标志的条目名被zipfile按cp437解码，Windows上压缩的中文文件名实际为GBK
+    if info.flag_bits & ZIP_UTF8_FLAG:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+def iter_zip_members(zip_path):
+    """按包内顺序列出ZIP压缩包中的PDF条目（ZipMember），不解压到磁盘"""
+    for entry in _zip_entries(zip_path):
+        yield entry.source
+
+def _zip_entries(zip_path, mtime_ns=0):
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            name = _member_name(info)
+            if not info.is_dir() and is_pdf_name(name):
+                yield ScanEntry(ZipMember(zip_path, info.filename, name), info.file_size, mtime_ns)
+
+def iter_bytes_sources(items):
+    """把 (文件名, PDF内容) 的可迭代对象转换为 PdfBytes"""
+    for name, data in items:
+        yield PdfBytes(name, bytes(data))
+
+def find_sources(source_path, recursive=False):
+    """列出要处理的输入：PDF文件、ZIP压缩包中的PDF，或文件夹中的这两种文件
+
+    文件夹按文件名排序，压缩包中的条目保持包内顺序；recursive 为 True 时包含子文件夹
+    """
+    return [entry.source for entry in scan_sources(source_path, recursive)]
+
+def scan_sources(source_path, recursive=False):
+    """用 os.scandir 逐个产出 ScanEntry，边扫描边产出，不必等整个目录树扫描完
+
+    每个文件夹内按名称排序，recursive 为 True 时子文件夹按名称顺序插在同级文件之间
+    （例如 年/月/供应商 的目录结构按时间顺序处理）；不跟随指向文件夹的符号链接
+    """
+    if os.path.isdir(source_path):
+        yield from _scan_dir(source_path, recursive)
+    elif os.path.isfile(source_path):
+        stat = os.stat(source_path)
+        if is_pdf_name(source_path):
+            yield ScanEntry(source_path, stat.st_size, stat.st_mtime_ns)
+        elif is_zip_name(source_path):
+            yield from _zip_scan(source_path, stat.st_mtime_ns)
+
+def _scan_dir(dir_path, recursive):
+    try:
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError as e:
+        print(f"无法读取文件夹 {dir_path}: {str(e)}")
+        return
+    for entry in entries:
+        try:
+            if entry.is_file():
+                if is_pdf_name(entry.name):
+                    stat = entry.stat()
+                    yield ScanEntry(entry.path, stat.st_size, stat.st_mtime_ns)
+                elif is_zip_name(entry.name):
+                    yield from _zip_scan(entry.path, entry.stat().st_mtime_ns)
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                yield from _scan_dir(entry.path, recursive)
+        except OSError:
+            # 扫描期间被删除或无权访问的文件跳过
+            continue
+
+def _zip_scan(zip_path, mtime_ns):
+    # 损坏的压缩包跳过，不影响其他文件
+    try:
+        entries = list(_zip_entries(zip_path, mtime_ns))
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"无法读取压缩包 {zip_path}: {str(e)}")
+        return
+    yield from entries
+
+class SourceScanner:
+    """在后台线程中扫描输入，已找到的条目（entries）随时可读
+
+    界面可以边扫描边显示，处理也可以在扫描完成前开始：iter_entries() 按扫描顺序产出条目，
+    暂时没有新条目时等待，扫描结束后返回
+    """
+
+    def __init__(self, source_path, recursive=False):
+        self.source_path = source_path
+        self.recursive = recursive
+        self.entries = []
+        self.total_bytes = 0
+        self.done = False
+        self._cancelled = False
+        self._cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        # 按小批交给读取方，不必每个条目都加锁通知；第一批立即交出，处理可以尽快开始
+        batch = []
+        flushed = 0.0
+        try:
+            for entry in scan_sources(self.source_path, self.recursive):
+                if self._cancelled:
+                    break
+                batch.append(entry)
+                now = time.monotonic()
+                if len(batch) >= SCAN_FLUSH_ENTRIES or now - flushed >= SCAN_FLUSH_SECONDS:
+                    self._flush(batch)
+                    batch = []
+                    flushed = now
+        except Exception as e:
+            print(f"扫描 {self.source_path} 时出错: {str(e)}")
+        finally:
+            self._flush(batch, done=True)
+
+    def _flush(self, batch, done=False):
+        with self._cond:
+            self.entries.extend(batch)
+            self.total_bytes += sum(entry.size for entry in batch)
+            self.done = done
+            self._cond.notify_all()
+
+    @property
+    def count(self):
+        return len(self.entries)
+
+    def iter_entries(self):
+        """按扫描顺序产出 ScanEntry，直到扫描结束"""
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.entries) and not self.done:
+                    self._cond.wait()
+                if i >= len(self.entries):
+                    return
+                chunk = self.entries[i:]
+            i += len(chunk)
+            yield from chunk
+
+    def cancel(self):
+        """停止扫描（已找到的条目保留）"""
+        self._cancelled = True
+
+def source_name(source):
+    """写入汇总表的 文件名：PDF文件为文件名，压缩包条目为包内的条目名"""
+    if isinstance(source, str):
+        return os.path.basename(source)
+    return source.name
+
+def source_key(source):
+    """来源的唯一标识：文件为绝对路径，压缩包条目为 压缩包路径!条目名，内存中的PDF为名称"""
+    if isinstance(source, str):
+        return os.path.abspath(source)
+    if isinstance(source, ZipMember):
+        return f"{os.path.abspath(source.archive)}!{source.name}"
+    return source.name
+
+def _archive(archive_path):
+    global _open_archive
+    if _open_archive is None or _open_archive[0] != archive_path:
+        close_archives()
+        _open_archive = (archive_path, zipfile.ZipFile(archive_path))
+    return _open_archive[1]
+
+def _read_member(archive_path, member):
+    return _archive(archive_path).read(member)
+
+def close_archives():
+    """关闭当前进程中打开的压缩包"""
+    global _open_archive
+    if _open_archive is not None:
+        _open_archive[1].close()
+        _open_archive = None
+
+def read_source(source):
+    """读取来源的PDF内容"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    if isinstance(source, ZipMember):
+        return _read_member(source.archive, source.member)
+    return source.data
+
+def read_sibling(source, extensions):
+    """读取与来源同名、扩展名为 extensions 之一（依次尝试，也尝试大写）的文件，返回 (文件名, 内容)
+
+    PDF文件在同一文件夹中查找，压缩包条目在同一压缩包的同一目录中查找；没有时（以及内存来源）返回None
+    """
+    if isinstance(source, str):
+        stem = os.path.splitext(source)[0]
+        for ext in extensions:
+            for path in (stem + ext, stem + ext.upper()):
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        return os.path.basename(path), f.read()
+    elif isinstance(source, ZipMember):
+        archive = _archive(source.archive)
+        stem = os.path.splitext(source.member)[0]
+        for ext in extensions:
+            for member in (stem + ext, stem + ext.upper()):
+                try:
+                    info = archive.getinfo(member)
+                except KeyError:
+                    continue
+                return _member_name(info), archive.read(info)
+    return None
+
+def open_source(source):
+    """打开来源对应的PDF文档，内存来源直接在内存中打开"""
+    # 用到时才导入PyMuPDF，GUI列出文件夹中的文件时不需要加载PDF库
+    import fitz  # PyMuPDF
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=read_source(source), filetype="pdf")
+
+def source_digest(source):
+    """来源内容的SHA-256，与 result_cache.file_digest 一致，同一张发票不论来自哪里都命中同一条缓存"""
+    if isinstance(source, str):
+        from result_cache import file_digest
+        return file_digest(source)
+    return hashlib.sha256(read_source(source)).hexdigest()
@@ -0,0 +1,224 @@
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+def percentile(values, pct):
+    """最近秩法百分位，values 须已排序"""
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[k]
+
+def peak_rss(pid=None):
+    """进程的峰值常驻内存（字节），pid 为 None 时为当前进程，无法读取时返回None
+
+    Linux读取 /proc 中的 VmHWM，Windows读取 PeakWorkingSetSize，macOS只支持当前进程
+    """
+    if sys.platform == "win32":
+        return _windows_peak_rss(pid)
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None or pid == os.getpid():
+        try:
+            import resource
+        except ImportError:
+            return None
+        # ru_maxrss 在Linux上以KB为单位，macOS上以字节为单位
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+    return None
+
+def _windows_peak_rss(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    psapi = ctypes.WinDLL("psapi", use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+    # PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ
+    handle = kernel32.GetCurrentProcess() if pid is None else kernel32.OpenProcess(0x1010, False, pid)
+    if not handle:
+        return None
+    try:
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    finally:
+        if pid is not None:
+            kernel32.CloseHandle(handle)
+
+class MemoryPeaks:
+    """记录一次运行中主进程和工作进程的峰值内存
+
+    工作进程退出后无法再读取，所以在关闭进程池之前调用 sample_workers()
+    """
+
+    def __init__(self):
+        self.workers = None
+
+    def sample_workers(self):
+        for process in multiprocessing.active_children():
+            rss = peak_rss(process.pid)
+            if rss is not None:
+                self.workers = max(self.workers or 0, rss)
+
+    def as_dict(self):
+        """{"main_mb": 主进程峰值, "workers_mb": 单个工作进程的最大峰值}，无法读取的项为None"""
+        main = peak_rss()
+        return {"main_mb": None if main is None else main / 2 ** 20,
+                "workers_mb": None if self.workers is None else self.workers / 2 ** 20}
+
+    def describe(self):
+        peaks = self.as_dict()
+        parts = [f"{label} {peaks[key]:.1f} MB" for key, label in (("main_mb", "主进程"), ("workers_mb", "工作进程"))
+                 if peaks[key] is not None]
+        return "峰值内存: " + ("，".join(parts) if parts else "无法读取")
+
+class StageTimer:
+    """记录单个文件各阶段的耗时（秒）和计数，as_dict() 的结果可以在进程间传递"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {"stages": self.stages, "counters": self.counters}
+
+class _NullTimer:
+    """未开启统计时使用，不做任何记录"""
+
+    def stage(self, name):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+class RunStats:
+    """汇总一次运行中所有文件的分阶段耗时和计数器"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        # 阶段 -> 每个文件（或每次调用）的耗时列表
+        self.samples = {}
+        # 按文件记录的计数（例如每个文件的页数和span数）
+        self.per_file = {}
+        # 整次运行的计数器（缓存命中、重复、失败等）
+        self.counters = {}
+        # 峰值内存（MemoryPeaks.as_dict()），运行结束时设置
+        self.peak_rss = None
+
+    def add_file(self, timings=None):
+        """记录一个已处理的文件，timings 为 StageTimer.as_dict() 的结果"""
+        self.files += 1
+        if not timings:
+            return
+        for name, seconds in timings["stages"].items():
+            self.samples.setdefault(name, []).append(seconds)
+        for name, n in timings["counters"].items():
+            self.per_file.setdefault(name, []).append(n)
+
+    @contextmanager
+    def stage(self, name):
+        """在主进程中计时（例如读取索引、保存汇总文件）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    def incr(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        stages = {}
+        for name, values in self.samples.items():
+            values = sorted(values)
+            total = sum(values)
+            stages[name] = {
+                "count": len(values),
+                "total_sec": total,
+                "mean_ms": total / len(values) * 1000,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "max_ms": values[-1] * 1000
+            }
+        per_file = {}
+        for name, values in self.per_file.items():
+            per_file[name] = {
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "max": max(values)
+            }
+        return {
+            "files": self.files,
+            "elapsed_sec": elapsed,
+            "files_per_sec": self.files / elapsed if elapsed else 0.0,
+            "stages": stages,
+            "per_file": per_file,
+            "counters": dict(self.counters),
+            "peak_rss_mb": self.peak_rss
+        }
+
+    def log_summary(self, logger=None):
+        """把运行汇总写入日志"""
+        logger = logger or logging.getLogger()
+        summary = self.summary()
+        logger.info(f"运行统计: {summary['files']} 个文件，耗时 {summary['elapsed_sec']:.2f} 秒，"
+                    f"{summary['files_per_sec']:.1f} 个/秒")
+        for name, s in summary["stages"].items():
+            logger.info(f"  {name}: {s['count']} 次，p50 {s['p50_ms']:.2f} ms，"
+                        f"p95 {s['p95_ms']:.2f} ms，最大 {s['max_ms']:.2f} ms")
+        for name, s in summary["per_file"].items():
+            logger.info(f"  每个文件{name}: 平均 {s['mean']:.1f}，最大 {s['max']}")
+        for name, n in summary["counters"].items():
+            logger.info(f"  {name}: {n}")
+        for name, mb in (summary["peak_rss_mb"] or {}).items():
+            if mb is not None:
+                logger.info(f"  峰值内存 {name}: {mb:.1f}")
+        return summary
+
+    def write_report(self, path):
+        """保存为JSON报告"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=4)
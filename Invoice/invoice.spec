@@ -35,6 +35,21 @@ a = Analysis(
         'logging',
         'invoice_gui',  # 添加主程序模块
         'get_coordinates',  # 添加发票处理模块
+        'invoice_rules',  # 字段提取规则模块
+        'structured_invoice',  # 结构化发票数据（XML/OFD）模块
+        'batch_process',  # 多进程批处理模块
+        'excel_summary',  # Excel汇总模块
+        'result_cache',  # 结果缓存模块
+        'watch_folder',  # 监视文件夹模块
+        'job_queue',  # 多个工作进程共用的任务队列模块
+        'instrumentation',  # 性能统计模块
+        'output_sinks',  # CSV/JSONL/SQLite输出模块
+        'input_sources',  # ZIP压缩包输入模块
+        'job_journal',  # 任务日志模块（中断后继续）
+        'triage',  # 分拣模块（扫描件和无法读取的文件）
+        'sqlite3',
+        'multiprocessing',
+        'concurrent.futures',
         'openpyxl',
         'openpyxl.cell',
         'openpyxl.cell.cell',
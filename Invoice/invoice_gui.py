@@ -2,11 +2,13 @@ import os
 import sys
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from openpyxl import Workbook, load_workbook
-from get_coordinates import process_pdf
+# 提取和Excel相关的模块（PyMuPDF、openpyxl）导入较慢，窗口显示后再在后台预热，
+# 或在第一次处理时导入，这里只导入轻量模块
+from input_sources import SourceScanner, is_pdf_name, is_zip_name, source_name
+from instrumentation import NULL_TIMER, MemoryPeaks, RunStats
 import threading
+import time
 import queue
-import json
 import traceback
 import logging
 
@@ -41,12 +43,99 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def format_duration(seconds):
+    """把秒数格式化为 时:分:秒 或 分:秒"""
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
 # 禁用 pdf2image 的警告
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# 主线程读取后台事件的间隔（毫秒）
+POLL_INTERVAL_MS = 100
+# 窗口显示后多久开始在后台预热提取模块（毫秒）
+PREWARM_DELAY_MS = 200
+
+class VirtualListbox:
+    """只渲染可见行的列表：所有行保存在 items 中，Listbox 里始终只有可见的几行
+
+    几十万个文件名也不会逐个插入Listbox，滚动时只替换可见行
+    """
+
+    def __init__(self, parent, width=60, height=10):
+        self.items = []
+        self.top = 0
+        self.height = height
+        self.listbox = tk.Listbox(parent, width=width, height=height)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+        # Windows/macOS 使用 <MouseWheel>，Linux 使用 <Button-4>/<Button-5>
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.listbox.bind(sequence, self.on_wheel)
+        self.render()
+
+    def set_items(self, items):
+        self.items = list(items)
+        self.top = 0
+        self.render()
+
+    def extend(self, items):
+        """追加行，只有新行落在可见范围内时才重新渲染"""
+        visible_before = len(self.items) < self.top + self.height
+        self.items.extend(items)
+        if visible_before:
+            self.render()
+        else:
+            self.update_scrollbar()
+
+    def render(self):
+        self.listbox.delete(0, tk.END)
+        rows = self.items[self.top:self.top + self.height]
+        if rows:
+            self.listbox.insert(tk.END, *rows)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = len(self.items)
+        if total <= self.height:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / total, (self.top + self.height) / total)
+
+    def scroll_to(self, top):
+        top = max(0, min(top, len(self.items) - self.height))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def yview(self, *args):
+        # 滚动条回调：("moveto", 比例) 或 ("scroll", 数量, "units"/"pages")
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.items)))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self.height if args[2] == "pages" else 1)
+            self.scroll_to(self.top + step)
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.top + (-3 if up else 3))
+        return "break"
+
+def prewarm_modules():
+    """导入处理时要用到的模块（PyMuPDF、openpyxl等），返回耗时（秒）"""
+    started = time.perf_counter()
+    import batch_process
+    import excel_summary
+    import output_sinks
+    import openpyxl
+    return time.perf_counter() - started
+
 class InvoiceProcessorGUI:
-    def __init__(self, root):
+    def __init__(self, root, prewarm=True):
         self.root = root
         self.root.title("发票处理程序")
         self.root.geometry("800x600")  # 设置窗口大小
@@ -62,14 +151,36 @@ class InvoiceProcessorGUI:
         except Exception as e:
             logging.warning(f"加载图标失败: {str(e)}")
             
-        self.setup_ui()
+        # 后台线程通过该队列发送进度和结果事件，由主线程定时读取
         self.processing_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.started = 0.0
+        # 当前输入的后台扫描（见 input_sources.SourceScanner），文件列表和处理共用
+        self.scanner = None
+        self.listed = 0
+        self.setup_ui()
         logging.info("GUI初始化完成")
+        if prewarm:
+            self.root.after(PREWARM_DELAY_MS, self.start_prewarm)
+
+    def start_prewarm(self):
+        """在后台线程中导入提取模块，用户点击开始时不用再等待"""
+        def run():
+            try:
+                logging.info(f"提取模块预热完成，耗时 {prewarm_modules():.2f} 秒")
+            except Exception as e:
+                # 预热失败不影响使用，开始处理时会再次导入并报告错误
+                logging.warning(f"预热提取模块失败: {str(e)}")
+        threading.Thread(target=run, daemon=True).start()
         
     def on_closing(self):
         """处理窗口关闭事件"""
         if messagebox.askokcancel("确认", "确定要退出程序吗？"):
             logging.info("用户关闭程序")
+            # 通知后台线程停止，未开始的任务随之取消
+            self.cancel_event.set()
+            if self.scanner is not None:
+                self.scanner.cancel()
             self.root.destroy()
 
     def setup_ui(self):
@@ -96,23 +207,41 @@ class InvoiceProcessorGUI:
                       value="folder").grid(row=2, column=1, sticky="w")
         ttk.Radiobutton(main_frame, text="处理单个文件", variable=self.process_mode, 
                       value="single").grid(row=2, column=1)
+        # 按 年/月/供应商 等子文件夹存放的发票
+        self.recursive = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="包含子文件夹", variable=self.recursive,
+                        command=self.update_file_list).grid(row=2, column=2, sticky="w")
 
-        # 文件列表
+        # 文件列表（只渲染可见行，文件很多时也不会卡住界面）
         ttk.Label(main_frame, text="文件列表:").grid(row=3, column=0, sticky="w", padx=5, pady=5)
-        self.file_listbox = tk.Listbox(main_frame, width=60, height=10)
-        self.file_listbox.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+        self.scan_label = ttk.Label(main_frame, text="")
+        self.scan_label.grid(row=3, column=1, sticky="w")
+        self.file_list = VirtualListbox(main_frame, width=60, height=10)
+        self.file_list.listbox.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+        self.file_list.scrollbar.grid(row=4, column=3, sticky="ns")
 
-        # 添加滚动条
-        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.file_listbox.yview)
-        scrollbar.grid(row=4, column=3, sticky="ns")
-        self.file_listbox.configure(yscrollcommand=scrollbar.set)
+        # 开始处理和取消按钮
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=5, column=1, pady=10)
+        self.start_button = ttk.Button(button_frame, text="开始处理", command=self.start_processing)
+        self.start_button.pack(side="left", padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_processing, state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
 
-        # 开始处理按钮
-        ttk.Button(main_frame, text="开始处理", command=self.start_processing).grid(row=5, column=1, pady=10)
+        # 性能统计（默认关闭），开启后写入日志并在logs文件夹保存JSON报告；
+        # 低内存模式（默认关闭）限制同时处理的文件数并定期释放PyMuPDF缓存，适合内存较小的电脑处理大批量文件
+        option_frame = ttk.Frame(main_frame)
+        option_frame.grid(row=5, column=2, sticky="w")
+        self.record_stats = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="记录性能统计", variable=self.record_stats).pack(anchor="w")
+        self.low_memory = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="低内存模式", variable=self.low_memory).pack(anchor="w")
 
-        # 处理进度标签
+        # 进度条和处理进度标签（速度、预计剩余时间）
+        self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="determinate")
+        self.progress_bar.grid(row=6, column=0, columnspan=3, sticky="ew", padx=5, pady=5)
         self.progress_label = ttk.Label(main_frame, text="处理进度")
-        self.progress_label.grid(row=6, column=0, columnspan=3, pady=5)
+        self.progress_label.grid(row=7, column=0, columnspan=3, pady=5)
 
         # 配置网格权重
         main_frame.columnconfigure(1, weight=1)
@@ -122,7 +251,7 @@ class InvoiceProcessorGUI:
         if self.process_mode.get() == "folder":
             path = filedialog.askdirectory()
         else:
-            path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
+            path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf"), ("ZIP archives", "*.zip")])
         
         if path:
             self.source_path.set(path)
@@ -134,196 +263,302 @@ class InvoiceProcessorGUI:
             self.output_path.set(path)
 
     def update_file_list(self):
-        self.file_listbox.delete(0, tk.END)
+        """在后台线程中重新扫描输入，文件列表边扫描边显示"""
+        self.file_list.set_items([])
+        self.scan_label.config(text="")
+        self.start_scan()
+
+    def start_scan(self):
+        """为当前输入启动后台扫描，输入无效时返回None"""
+        if self.scanner is not None:
+            self.scanner.cancel()
+        self.scanner = None
+        self.listed = 0
         path = self.source_path.get()
-        
         if self.process_mode.get() == "folder":
-            if os.path.isdir(path):
-                for file in os.listdir(path):
-                    if file.lower().endswith('.pdf'):
-                        self.file_listbox.insert(tk.END, file)
-        else:
-            if os.path.isfile(path) and path.lower().endswith('.pdf'):
-                self.file_listbox.insert(tk.END, os.path.basename(path))
+            if not os.path.isdir(path):
+                return None
+        elif not (os.path.isfile(path) and (is_pdf_name(path) or is_zip_name(path))):
+            return None
+        self.scanner = SourceScanner(path, self.recursive.get() and self.process_mode.get() == "folder")
+        self.root.after(POLL_INTERVAL_MS, self.poll_scan, self.scanner)
+        return self.scanner
+
+    def current_scanner(self):
+        """开始处理时使用的扫描：与当前输入一致且仍在进行的扫描直接沿用，否则重新扫描（文件夹内容可能已变化）"""
+        scanner = self.scanner
+        recursive = self.recursive.get() and self.process_mode.get() == "folder"
+        if (scanner is not None and not scanner.done and
+                scanner.source_path == self.source_path.get() and scanner.recursive == recursive):
+            return scanner
+        self.file_list.set_items([])
+        return self.start_scan()
 
-    def process_files(self):
+    def poll_scan(self, scanner):
+        """把扫描到的新条目追加到文件列表（ZIP压缩包中的PDF按包内条目名显示）"""
+        if scanner is not self.scanner:
+            return
+        entries = scanner.entries[self.listed:]
+        self.listed += len(entries)
+        self.file_list.extend(source_name(entry.source) for entry in entries)
+        size_mb = scanner.total_bytes / (1024 * 1024)
+        if scanner.done and self.listed >= scanner.count:
+            self.scan_label.config(text=f"共 {scanner.count} 个文件（{size_mb:.1f} MB）")
+            return
+        self.scan_label.config(text=f"正在扫描... 已找到 {scanner.count} 个文件（{size_mb:.1f} MB）")
+        self.root.after(POLL_INTERVAL_MS, self.poll_scan, scanner)
+
+    def prepare_processing(self):
+        """在主线程中检查输入、开始扫描PDF文件并读取汇总文件，返回 (扫描, 汇总文件路径, 已有发票号码, 任务日志)
+
+        扫描在后台继续进行，处理不等扫描完成就开始。
+
+        需要用户确认的对话框都在这里弹出，后台线程不直接操作界面；取消时返回None
+        """
         source_path = self.source_path.get()
         output_path = self.output_path.get()
         
         if not source_path or not output_path:
             messagebox.showerror("错误", "请选择源文件/文件夹和输出文件夹")
-            return
+            return None
+
+        # 扫描要处理的PDF文件
+        scanner = self.current_scanner()
+        if scanner is None:
+            messagebox.showwarning("警告", "没有找到PDF文件")
+            return None
 
-        # 准备存储所有发票数据的列表
-        all_invoice_data = []
-        temp_files = []  # 用于记录需要清理的临时文件
+        import excel_summary  # 一般已在后台预热时导入
+        excel_path = os.path.join(output_path, excel_summary.SUMMARY_FILENAME)
+        try:
+            os.makedirs(output_path, exist_ok=True)
+            # 通过汇总文件旁边的发票号码索引获取已有发票号码，不需要加载整个Excel文件
+            existing_invoice_numbers = excel_summary.load_invoice_numbers(excel_path)
+        except Exception as e:
+            error_msg = str(e)
+            message = '读取现有Excel文件时出错: {}\n是否要创建新文件？\n(选择"是"将备份原文件并创建新文件，选择"否"将取消操作)'.format(error_msg)
+            user_choice = messagebox.askyesno("错误", message)
+            if not user_choice:
+                return None
+            # 如果文件存在，先备份
+            excel_summary.backup_summary(excel_path)
+            existing_invoice_numbers = set()
+
+        # 上次处理中断（程序崩溃、电脑休眠、关闭窗口或取消）时可以跳过已完成的文件继续处理
+        import job_journal
+        journal = job_journal.open_journal(output_path)
+        if journal.resumed:
+            message = f'输出文件夹中有上次未完成的任务（已处理 {journal.count} 个文件）。\n是否继续？\n(选择"是"将跳过已完成的文件，选择"否"将从头处理所有文件)'
+            if not messagebox.askyesno("继续任务", message):
+                journal.close()
+                journal = job_journal.open_journal(output_path, restart=True)
+        return scanner, excel_path, existing_invoice_numbers, journal
+
+    def process_files(self, scanner, excel_path, existing_invoice_numbers, journal, stats=None, low_memory=False):
+        """后台线程：提取扫描到的文件并写入汇总文件，通过 processing_queue 向界面发送事件
+
+        事件为 ("progress", 已处理数, 已找到的文件数, 文件名, 是否仍在扫描) 和 ("done", 类型, 标题, 内容)。
+        文件边扫描边提交处理；提取结果交给 output_sinks.BackgroundWriter 在另一个线程中按批写入，
+        提取不需要等待写入完成；low_memory 为 True 时使用低内存模式（见 batch_process.iter_batch），
+        结束时把主进程和工作进程的峰值内存写入日志。
+        每个文件的结果先记入任务日志 journal（job_journal.JobJournal），跳过上次已完成的文件；
+        全部处理完后删除日志，取消或出错时保留，下次可以继续
+        """
+        index = 0
+        failed_files = []  # 处理失败的文件及原因
+        invoice_count = 0
+        cache = None  # 按内容哈希缓存的提取结果
+        writer = None
+        cancelled = False
+        memory = MemoryPeaks()
         
         try:
-            # 获取要处理的PDF文件列表
-            pdf_files = []
-            if self.process_mode.get() == "folder":
-                if os.path.isdir(source_path):
-                    pdf_files = [f for f in os.listdir(source_path) if f.lower().endswith('.pdf')]
-                    pdf_files = [os.path.join(source_path, f) for f in pdf_files]
-            else:
-                if os.path.isfile(source_path) and source_path.lower().endswith('.pdf'):
-                    pdf_files = [source_path]
+            # 一般已在后台预热时导入
+            from batch_process import iter_batch
+            import excel_summary
+            import output_sinks
+            import result_cache
+            # 打开输出文件夹中的结果缓存，未变化的PDF不再重新解析
+            cache = result_cache.open_cache(os.path.dirname(excel_path))
+            sink = output_sinks.open_sinks(os.path.dirname(excel_path), ["xlsx"], existing_invoice_numbers)
+            # 继续上次的任务时，先补写上次还没写入汇总文件的行
+            replay_rows = journal.begin(sink)
+            if journal.resumed:
+                logging.info(f"继续上次未完成的任务，补写 {len(replay_rows)} 行")
+            writer = output_sinks.BackgroundWriter(sink)
+            for row in replay_rows:
+                writer.add(row)
             
-            if not pdf_files:
-                messagebox.showwarning("警告", "没有找到PDF文件")
-                return
-                
-            total_files = len(pdf_files)
+            # 跳过任务日志中已完成的文件，其余的按扫描顺序提交
+            entries = {}
+            def pending_entries():
+                for entry in journal.pending(scanner.iter_entries()):
+                    entries[entry.source] = entry
+                    yield entry
             
-            # 处理每个PDF文件
-            for index, pdf_path in enumerate(pdf_files, 1):
-                pdf_file = os.path.basename(pdf_path)
-                self.progress_label.config(text=f"正在处理PDF: {pdf_file} ({index}/{total_files})")
-                self.root.update()
+            # 多进程处理PDF文件，结果按输入顺序返回；取消时停止迭代，未开始的任务随之取消
+            for index, (pdf_path, invoices, error) in enumerate(
+                    iter_batch(pending_entries(), cache=cache, stats=stats,
+                               low_memory=low_memory, memory=memory), 1):
+                pdf_file = source_name(pdf_path)
+                self.processing_queue.put(("progress", journal.skipped + index, scanner.count, pdf_file,
+                                           not scanner.done))
+                if journal.checkpoint_due():
+                    writer.checkpoint(journal.checkpoint_callback())
                 
-                try:
-                    # 处理PDF文件生成JSON
-                    process_pdf(pdf_path)
-                    # 记录生成的临时文件
-                    base_name = os.path.splitext(pdf_file)[0]
-                    json_path = os.path.join(os.path.dirname(pdf_path), f"{base_name}.json")
-                    csv_path = os.path.join(os.path.dirname(pdf_path), f"{base_name}.csv")
-                    temp_files.extend([json_path, csv_path])
-                    
-                    # 读取生成的JSON文件
-                    try:
-                        with open(json_path, 'r', encoding='utf-8') as f:
-                            data = json.loads(f.read())
-                            # 提取所需字段
-                            invoice_data = {
-                                "文件名": pdf_file,
-                                "发票类型": data.get("invoice_type", ""),
-                                "发票号码": data.get("invoice_number", ""),
-                                "开票日期": data.get("invoice_date", ""),
-                                "采购方名称": data.get("buyer_name", ""),
-                                "采购方纳税人识别号": data.get("buyer_tax_id", ""),
-                                "销售方名称": data.get("seller_name", ""),
-                                "销售方纳税人识别号": data.get("seller_tax_id", ""),
-                                "金额": data.get("net_amount", ""),
-                                "税额": data.get("tax_amount", ""),
-                                "价税合计": data.get("total_amount", "")
-                            }
-                            all_invoice_data.append(invoice_data)
-                            print(f"成功处理文件: {pdf_file}")
-                    except Exception as e:
-                        print(f"读取JSON文件失败: {str(e)}")
-                        messagebox.showwarning("警告", f"处理文件 {pdf_file} 时出错: {str(e)}")
-                        continue
-                        
-                except Exception as e:
-                    print(f"处理PDF文件 {pdf_file} 时出错: {str(e)}")
-                    messagebox.showwarning("警告", f"处理文件 {pdf_file} 时出错: {str(e)}")
-                    continue
-
-            # 使用openpyxl处理Excel文件
-            if all_invoice_data:
-                try:
-                    excel_path = os.path.join(output_path, "发票数据汇总.xlsx")
-                    os.makedirs(output_path, exist_ok=True)
-                    
-                    # 定义列标题
-                    columns = ["文件名", "发票类型", "发票号码", "开票日期", 
-                             "采购方名称", "采购方纳税人识别号", 
-                             "销售方名称", "销售方纳税人识别号", 
-                             "金额", "税额", "价税合计"]
-                    
-                    # 检查是否已存在Excel文件
-                    existing_invoice_numbers = set()
-                    if os.path.exists(excel_path):
-                        try:
-                            # 尝试加载现有文件
-                            wb = load_workbook(excel_path)
-                            ws = wb.active
-                            
-                            # 验证表头是否匹配
-                            existing_headers = [cell.value for cell in ws[1]]
-                            if existing_headers != columns:
-                                raise ValueError("现有Excel文件的表头与程序不匹配")
-                            
-                            # 获取现有发票号码
-                            invoice_number_col = columns.index("发票号码") + 1
-                            for row in range(2, ws.max_row + 1):
-                                invoice_number = ws.cell(row=row, column=invoice_number_col).value
-                                if invoice_number:
-                                    existing_invoice_numbers.add(invoice_number)
-                                    
-                        except Exception as e:
-                            error_msg = str(e)
-                            message = '读取现有Excel文件时出错: {}\n是否要创建新文件？\n(选择"是"将备份原文件并创建新文件，选择"否"将取消操作)'.format(error_msg)
-                            user_choice = messagebox.askyesno("错误", message)
-                            if user_choice:
-                                # 如果文件存在，先备份
-                                if os.path.exists(excel_path):
-                                    backup_path = excel_path + '.bak'
-                                    try:
-                                        os.rename(excel_path, backup_path)
-                                        print(f"已将原文件备份为: {backup_path}")
-                                    except Exception as e:
-                                        print(f"备份文件时出错: {str(e)}")
-                                # 创建新的工作簿
-                                wb = Workbook()
-                                ws = wb.active
-                                # 写入表头
-                                for col, header in enumerate(columns, 1):
-                                    ws.cell(row=1, column=col, value=header)
-                    else:
-                        # 如果文件不存在，创建新的
-                        wb = Workbook()
-                        ws = wb.active
-                        # 写入表头
-                        for col, header in enumerate(columns, 1):
-                            ws.cell(row=1, column=col, value=header)
-                    
-                    # 添加新数据
-                    duplicate_invoices = []
-                    for invoice_data in all_invoice_data:
-                        invoice_number = invoice_data["发票号码"]
-                        if invoice_number in existing_invoice_numbers:
-                            duplicate_invoices.append(invoice_number)
-                            continue
-                        
-                        # 添加新行
-                        row_data = [invoice_data[col] for col in columns]
-                        ws.append(row_data)
-                        existing_invoice_numbers.add(invoice_number)
-                    
-                    # 保存Excel文件
-                    wb.save(excel_path)
-                    print(f"数据已保存到: {excel_path}")
-                    
-                    # 显示处理结果
-                    success_message = f"处理完成！\n成功处理 {len(all_invoice_data)} 个文件"
-                    if duplicate_invoices:
-                        success_message += f"\n发现 {len(duplicate_invoices)} 个重复发票号码，已跳过"
-                    messagebox.showinfo("完成", success_message)
-                    
-                except Exception as e:
-                    print(f"保存Excel文件时出错: {str(e)}")
-                    messagebox.showerror("错误", f"保存Excel文件时出错: {str(e)}")
+                if error is not None:
+                    journal.record(entries.pop(pdf_path), [], error)
+                    logging.warning(f"处理文件 {pdf_file} 时出错: {error}")
+                    failed_files.append((pdf_file, error))
+                else:
+                    # 多页PDF中每张发票一行，记录所在页码
+                    rows = [excel_summary.build_row(pdf_file, data, page_number) for page_number, data in invoices]
+                    journal.record(entries.pop(pdf_path), rows)
+                    for row in rows:
+                        writer.add(row)
+                    invoice_count += len(invoices)
+                
+                if self.cancel_event.is_set():
+                    cancelled = True
+                    break
+
+            # 等待剩余的行写入Excel汇总文件（取消时已提取的结果同样保存）
+            try:
+                with (stats or NULL_TIMER).stage("save_summary"):
+                    duplicate_invoices = writer.close()
+                writer = None
+            except Exception as e:
+                writer = None
+                logging.error(f"保存Excel文件时出错: {str(e)}")
+                self.processing_queue.put(("done", "error", "错误", f"保存Excel文件时出错: {str(e)}"))
+                return
+            logging.info(f"数据已保存到: {excel_path}")
+            # 全部处理完后任务结束，删除任务日志；取消时保留，下次可以继续
+            journal.close(finished=not cancelled)
+            if stats is not None:
+                stats.incr("duplicates", len(duplicate_invoices))
+            
+            # 显示处理结果
+            total_files = scanner.count
+            if cancelled:
+                message = (f"已取消！\n已处理 {journal.skipped + index}/{total_files} 个文件，共 {invoice_count} 张发票，"
+                           f"已保存到汇总文件，下次处理时可以继续")
+            else:
+                message = (f"处理完成！\n成功处理 {total_files - journal.skipped - len(failed_files)} 个文件，"
+                           f"共 {invoice_count} 张发票")
+            if journal.skipped:
+                message += f"\n跳过上次已完成的 {journal.skipped} 个文件"
+            if duplicate_invoices:
+                message += f"\n发现 {len(duplicate_invoices)} 个重复发票号码，已跳过"
+            if failed_files:
+                # 扫描件、无法读取的文件和提取失败的文件分类汇总，明细保存为报告
+                import triage
+                report_path = os.path.join(os.path.dirname(excel_path), triage.REPORT_FILENAME)
+                triage.write_report(report_path, failed_files)
+                message += f"\n{len(failed_files)} 个文件未提取:\n" + triage.describe_failures(failed_files, 5)
+                message += f"\n明细见 {triage.REPORT_FILENAME}"
+            if total_files == 0:
+                self.processing_queue.put(("done", "warning", "警告", "没有找到PDF文件"))
+            elif invoice_count == 0 and failed_files:
+                self.processing_queue.put(("done", "warning", "警告", message))
+            else:
+                self.processing_queue.put(("done", "info", "完成", message))
         
         except Exception as e:
-            print(f"处理过程中出错: {str(e)}")
-            messagebox.showerror("错误", f"处理过程中出错: {str(e)}")
+            logging.error(f"处理过程中出错: {str(e)}\n{traceback.format_exc()}")
+            self.processing_queue.put(("done", "error", "错误", f"处理过程中出错: {str(e)}"))
         
         finally:
-            # 清理临时文件
-            for temp_file in temp_files:
+            if writer is not None:
                 try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                        print(f"已删除临时文件: {temp_file}")
-                except Exception as e:
-                    print(f"删除临时文件 {temp_file} 时出错: {str(e)}")
-            
-            self.progress_label.config(text="就绪")
+                    writer.close()
+                except Exception:
+                    pass
+            if cache is not None:
+                cache.close()
+            journal.close()
+            logging.info(memory.describe())
+            if stats is not None:
+                stats.peak_rss = memory.as_dict()
+                self.save_stats(stats)
+
+    def poll_queue(self):
+        """在主线程中定时批量处理后台线程发来的事件，只按最新进度刷新一次界面"""
+        progress = None
+        done = None
+        try:
+            while True:
+                event = self.processing_queue.get_nowait()
+                if event[0] == "progress":
+                    progress = event
+                elif event[0] == "done":
+                    done = event
+        except queue.Empty:
+            pass
+        
+        if progress is not None:
+            self.show_progress(*progress[1:])
+        if done is not None:
+            self.finish_processing(*done[1:])
+            return
+        self.root.after(POLL_INTERVAL_MS, self.poll_queue)
+
+    def show_progress(self, index, total_files, pdf_file, scanning=False):
+        elapsed = time.perf_counter() - self.started
+        rate = index / elapsed if elapsed > 0 else 0.0
+        text = f"正在处理PDF: {pdf_file} ({index}/{total_files})"
+        if scanning:
+            # 仍在扫描时总数还会增加，不显示预计剩余时间
+            text += f"  {rate:.1f} 个/秒，仍在扫描文件..."
+        elif rate > 0:
+            remaining = (total_files - index) / rate
+            text += f"  {rate:.1f} 个/秒，预计剩余 {format_duration(remaining)}"
+        self.progress_bar.config(maximum=total_files, value=index)
+        self.progress_label.config(text=text)
+
+    def finish_processing(self, kind, title, message):
+        self.start_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        self.progress_label.config(text="就绪")
+        if kind == "error":
+            messagebox.showerror(title, message)
+        elif kind == "warning":
+            messagebox.showwarning(title, message)
+        else:
+            messagebox.showinfo(title, message)
+
+    def cancel_processing(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        self.progress_label.config(text="正在取消，等待正在处理的文件完成...")
+
+    def save_stats(self, stats):
+        """把本次运行的分阶段统计写入日志，并在logs文件夹保存JSON报告"""
+        try:
+            stats.log_summary()
+            log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+            os.makedirs(log_dir, exist_ok=True)
+            report_path = os.path.join(log_dir, f"run_report_{time.strftime('%Y%m%d_%H%M%S')}.json")
+            stats.write_report(report_path)
+            logging.info(f"性能统计报告已保存到: {report_path}")
+        except Exception as e:
+            logging.warning(f"保存性能统计时出错: {str(e)}")
 
     def start_processing(self):
-        threading.Thread(target=self.process_files, daemon=True).start()
+        prepared = self.prepare_processing()
+        if prepared is None:
+            return
+        scanner = prepared[0]
+        stats = RunStats() if self.record_stats.get() else None
+        self.cancel_event.clear()
+        self.started = time.perf_counter()
+        self.start_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.progress_bar.config(maximum=max(scanner.count, 1), value=0)
+        self.progress_label.config(text=f"正在处理PDF: 0/{scanner.count}")
+        threading.Thread(target=self.process_files, args=prepared + (stats, self.low_memory.get()),
+                         daemon=True).start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_queue)
 
 # 移除直接执行代码，因为我们使用启动器
 if __name__ == '__main__':
@@ -0,0 +1,341 @@
+import bisect
+import itertools
+import operator
+from collections import namedtuple
+
+# 坐标匹配误差范围（单位：点）
+COORDINATE_TOLERANCE = 8
+
+# 提取结果中的字段（所有规则集相同，规则集中没有的字段为空字符串）
+FIELD_NAMES = ("invoice_type", "invoice_number", "invoice_date", "buyer_name", "buyer_tax_id",
+               "seller_name", "seller_tax_id", "net_amount", "tax_amount", "total_amount")
+
+# 购买方/销售方信息区域中的标签，不作为字段值
+PARTY_LABELS = ("名称", "统一社会信用代码/纳税人识别号:")
+# 铁路电子客票购买方一行中的标签
+RAILWAY_LABELS = ("购买方名称:", "购买方名称：", "统一社会信用代码:", "统一社会信用代码：")
+
+def _has_digit(text):
+    # 全是字母（包括汉字）的文本不含数字，不用逐个字符判断
+    return not text.isalpha() and any(map(str.isdigit, text))
+
+# 候选值的条件，参数为去掉 strip 中的字符后的文本
+VALUE_PREDICATES = {
+    # 发票号码：长度超过6位的纯数字
+    "number": lambda text: text.isdigit() and len(text) > 6,
+    # 开票日期：长度为11的包含数字但不是纯数字字符串
+    "date": lambda text: len(text) == 11 and _has_digit(text) and not text.isdigit(),
+    "digits": _has_digit,
+    "no_digits": lambda text: not _has_digit(text),
+}
+
+# 增值税发票（电子发票的普通发票、专用发票）的规则，也是默认规则
+#
+# anchors: 锚点，equals 为文本完全相同的span，contains 为文本包含该子串的span；
+#   pick 为 first/last（原顺序的第一个/最后一个）、top_first（top最小的，相同时取靠前的）
+#   或 all（全部，至少 min_count 个）；找不到 equals 时可以用 pair 中分开的两个字代替
+#   （原顺序中第一次在 tolerance 内的同一水平线上出现时，取第一个字）
+# regions: 区域，title 为标题（top最小的span）；before 为按top排序时在锚点之前的span；
+#   box 为完全位于矩形 [top, bottom, left, right] 内的span，边界写作"锚点.坐标"
+#   （all 锚点取所有span的外框），None 表示页面最右侧，所有锚点和 requires 都找到时才有效；
+#   row 为 top 与锚点相差小于 tolerance 的span
+# fields: 字段，value 为 VALUE_PREDICATES 中的条件，exclude 中的文本不作为候选值，
+#   strip 中的字符在判断条件和取值前去掉；pick 为 first/last（按区域中的顺序）或
+#   left（按left从左到右），取第 nth 个（从0开始），候选值少于 min_count 个时不取
+VAT_INVOICE_RULES = {
+    "name": "vat",
+    # 标题包含其中任一文本时使用这套规则；为空表示默认规则
+    "titles": (),
+    "anchors": {
+        "header_end": {"equals": "购", "pick": "top_first"},
+        "buyer": {"equals": "购", "pick": "last"},
+        "seller": {"equals": "销", "pick": "last"},
+        "info": {"equals": "息", "pick": "all", "min_count": 2},
+        "amounts": {"equals": "合计", "pick": "first", "pair": ("合", "计"), "tolerance": COORDINATE_TOLERANCE},
+        "total": {"contains": "价税合计", "pick": "first"},
+    },
+    "regions": {
+        "title": {"kind": "title"},
+        # 发票号码和开票日期在"购"字之前
+        "header": {"kind": "before", "anchor": "header_end"},
+        "buyer": {"kind": "box", "edges": ("buyer.top", "info.bottom", "buyer.right", "seller.left")},
+        "seller": {"kind": "box", "edges": ("seller.top", "info.bottom", "seller.right", None),
+                   "requires": ("buyer",)},
+        "amounts_top": {"kind": "row", "anchor": "amounts", "tolerance": COORDINATE_TOLERANCE},
+        "total_top": {"kind": "row", "anchor": "total", "tolerance": COORDINATE_TOLERANCE},
+    },
+    "fields": {
+        "invoice_type": {"region": "title"},
+        "invoice_number": {"region": "header", "value": "number", "strip": "'"},
+        "invoice_date": {"region": "header", "value": "date", "strip": "'"},
+        "buyer_name": {"region": "buyer", "value": "no_digits", "exclude": PARTY_LABELS, "pick": "last"},
+        "buyer_tax_id": {"region": "buyer", "value": "digits", "exclude": PARTY_LABELS, "pick": "last"},
+        "seller_name": {"region": "seller", "value": "no_digits", "exclude": PARTY_LABELS, "pick": "last"},
+        "seller_tax_id": {"region": "seller", "value": "digits", "exclude": PARTY_LABELS, "strip": "'",
+                          "pick": "last"},
+        # 合计行中至少有两个数字时，从左到右依次为金额和税额
+        "net_amount": {"region": "amounts_top", "value": "digits", "strip": "¥'", "pick": "left", "nth": 0,
+                       "min_count": 2},
+        "tax_amount": {"region": "amounts_top", "value": "digits", "strip": "¥'", "pick": "left", "nth": 1,
+                       "min_count": 2},
+        "total_amount": {"region": "total_top", "value": "digits", "strip": "¥'", "pick": "last"},
+    },
+}
+
+# 铁路电子客票（电子发票（铁路电子客票））：没有购/销信息框和合计行，
+# 字段在"发票号码"、"开票日期"、"票价"、"购买方名称"、"统一社会信用代码"等标签的同一行，
+# 不印销售方和税额，这些字段为空
+RAILWAY_TICKET_RULES = {
+    "name": "railway",
+    "titles": ("铁路电子客票",),
+    "anchors": {
+        "number": {"contains": "发票号码"},
+        "date": {"contains": "开票日期"},
+        "fare": {"contains": "票价"},
+        "buyer": {"contains": "购买方名称"},
+        "buyer_tax_id": {"contains": "统一社会信用代码"},
+    },
+    "regions": {
+        "title": {"kind": "title"},
+        "number_row": {"kind": "row", "anchor": "number", "tolerance": COORDINATE_TOLERANCE},
+        "date_row": {"kind": "row", "anchor": "date", "tolerance": COORDINATE_TOLERANCE},
+        "fare_row": {"kind": "row", "anchor": "fare", "tolerance": COORDINATE_TOLERANCE},
+        "buyer_row": {"kind": "row", "anchor": "buyer", "tolerance": COORDINATE_TOLERANCE},
+        "buyer_tax_id_row": {"kind": "row", "anchor": "buyer_tax_id", "tolerance": COORDINATE_TOLERANCE},
+    },
+    "fields": {
+        "invoice_type": {"region": "title"},
+        "invoice_number": {"region": "number_row", "value": "number"},
+        "invoice_date": {"region": "date_row", "value": "date"},
+        # 购买方名称和统一社会信用代码可能在同一行，去掉两个标签后取第一个
+        "buyer_name": {"region": "buyer_row", "value": "no_digits", "exclude": RAILWAY_LABELS},
+        "buyer_tax_id": {"region": "buyer_tax_id_row", "value": "digits", "pick": "last"},
+        "total_amount": {"region": "fare_row", "value": "digits", "strip": "¥￥"},
+    },
+}
+
+# 所有规则集，按顺序匹配标题，都不匹配时使用默认规则
+RULE_SETS = (VAT_INVOICE_RULES, RAILWAY_TICKET_RULES)
+
+# 一次遍历的结果：
+# anchors 为 锚点条件编号 -> span下标（原顺序），order 为按top稳定排序的下标，tops 为对应的top，
+# inverted 为 bottom 小于 top 的异常span最多高出多少，title 为标题span（top最小的，相同时取靠前的）
+# 的下标，没有span时为None
+Scan = namedtuple("Scan", "anchors order tops inverted title")
+
+Field = namedtuple("Field", "name region predicate strip exclude pick nth min_count")
+
+class RuleSet:
+    """编译后的一套规则，锚点换成了 RuleEngine 中的条件编号"""
+
+    def __init__(self, rules, term):
+        self.name = rules["name"]
+        self.titles = tuple(rules.get("titles", ()))
+        self.anchors = {}
+        for name, spec in rules["anchors"].items():
+            kind = "equals" if "equals" in spec else "contains"
+            pair = tuple(term("equals", text) for text in spec.get("pair", ()))
+            self.anchors[name] = (term(kind, spec[kind]), spec.get("pick", "first"), spec.get("min_count", 1),
+                                  pair, spec.get("tolerance", COORDINATE_TOLERANCE))
+        self.regions = dict(rules["regions"])
+        # box 区域的边界换成 (锚点, 坐标)
+        self.edges = {name: [ref and tuple(ref.split(".")) for ref in region["edges"]]
+                      for name, region in self.regions.items() if region["kind"] == "box"}
+        self.fields = []
+        for name, spec in rules["fields"].items():
+            value = spec.get("value")
+            strip = spec.get("strip")
+            self.fields.append(Field(name, spec["region"], None if value is None else VALUE_PREDICATES[value],
+                                     str.maketrans("", "", strip) if strip else None,
+                                     frozenset(spec.get("exclude", ())), spec.get("pick", "first"),
+                                     spec.get("nth", 0), spec.get("min_count", 1)))
+
+    def anchor(self, name, spans, scan):
+        """锚点的span下标（all 锚点为下标列表），找不到时为None"""
+        term, pick, min_count, pair, tolerance = self.anchors[name]
+        found = scan.anchors.get(term, [])
+        if pick == "all":
+            return found if len(found) >= min_count else None
+        if found:
+            if pick == "first":
+                return found[0]
+            if pick == "last":
+                return found[-1]
+            return min(found, key=spans.top.__getitem__)
+        if pair:
+            # 按原顺序依次记下最近的一个字，两个字都出现且在同一水平线上时取第一个字
+            latest = [None, None]
+            tops = spans.top
+            parts = [(i, 0) for i in scan.anchors.get(pair[0], [])] + [(i, 1) for i in scan.anchors.get(pair[1], [])]
+            for i, k in sorted(parts):
+                latest[k] = i
+                if None not in latest and abs(tops[latest[0]] - tops[latest[1]]) < tolerance:
+                    return latest[0]
+        return None
+
+    def _edge(self, edge, spans, anchor):
+        name, attr = edge
+        column = getattr(spans, attr)
+        found = anchor(name)
+        if isinstance(found, list):
+            values = [column[i] for i in found]
+            return max(values) if attr in ("bottom", "right") else min(values)
+        return column[found]
+
+    def _region(self, name, spans, scan, anchor):
+        # 区域中的span下标，title/box/row 为原顺序，before 为按top排序的顺序；区域无效时为None
+        region = self.regions[name]
+        kind = region["kind"]
+        if kind == "title":
+            return None if scan.title is None else [scan.title]
+        if kind == "before":
+            stop = anchor(region["anchor"])
+            if stop is None:
+                return scan.order
+            return scan.order[:scan.order.index(stop)]
+        tops = spans.top
+        if kind == "box":
+            edges = self.edges[name]
+            needed = [edge[0] for edge in edges if edge]
+            needed.extend(region.get("requires", ()))
+            if any(anchor(a) is None for a in needed):
+                return None
+            top, bottom, left, right = [None if edge is None else self._edge(edge, spans, anchor) for edge in edges]
+            if right is None:
+                right = max(spans.right, default=0.0)
+            # 先按top的范围缩小（两端各放宽1个点），精确条件再逐个判断
+            lo = bisect.bisect_left(scan.tops, top - 1)
+            hi = bisect.bisect_right(scan.tops, bottom + scan.inverted + 1)
+            found = [i for i in scan.order[lo:hi]
+                     if tops[i] >= top and spans.bottom[i] <= bottom and
+                     spans.left[i] >= left and spans.right[i] <= right]
+            found.sort()
+            return found
+        i = anchor(region["anchor"])
+        if i is None:
+            return None
+        row = tops[i]
+        tolerance = region.get("tolerance", COORDINATE_TOLERANCE)
+        lo = bisect.bisect_left(scan.tops, row - tolerance - 1)
+        hi = bisect.bisect_right(scan.tops, row + tolerance + 1)
+        found = [i for i in scan.order[lo:hi] if abs(tops[i] - row) < tolerance]
+        found.sort()
+        return found
+
+    def extract(self, spans, scan):
+        """按区域取出各字段，锚点和区域只在字段用到时查找一次"""
+        anchors = {}
+
+        def anchor(name):
+            if name not in anchors:
+                anchors[name] = self.anchor(name, spans, scan)
+            return anchors[name]
+
+        fields = dict.fromkeys(FIELD_NAMES, "")
+        texts = spans.text
+        regions = {}
+        for field in self.fields:
+            if field.region not in regions:
+                regions[field.region] = self._region(field.region, spans, scan, anchor)
+            found = regions[field.region]
+            if not found:
+                continue
+            strip, predicate, exclude = field.strip, field.predicate, field.exclude
+            if field.pick == "left" or field.min_count > 1:
+                values = []
+                for i in found:
+                    value = texts[i] if strip is None else texts[i].translate(strip)
+                    if predicate is None or (value not in exclude and predicate(value)):
+                        values.append((spans.left[i], value))
+                if len(values) < max(field.min_count, field.nth + 1):
+                    continue
+                if field.pick == "left":
+                    values.sort(key=operator.itemgetter(0))
+                fields[field.name] = values[-1 - field.nth if field.pick == "last" else field.nth][1]
+                continue
+            # 只需要从前（或从后）数第 nth 个候选值，找到后不再判断其余的span
+            skip = field.nth
+            for i in (reversed(found) if field.pick == "last" else found):
+                value = texts[i] if strip is None else texts[i].translate(strip)
+                if predicate is None or (value not in exclude and predicate(value)):
+                    if not skip:
+                        fields[field.name] = value
+                        break
+                    skip -= 1
+        return fields
+
+class RuleEngine:
+    """把所有规则集编译成一组锚点条件，一次遍历span收集所有规则集的锚点
+
+    完全相同的锚点文本在C中按集合筛出，包含子串的锚点在拼接后的文本中查找。之后按标题
+    选出规则集，区域在按top排序的下标上二分查找，候选值的条件只对选中规则集的区域中的span
+    判断，所以增加规则集不会增加遍历次数，也不会增加每页判断条件的次数
+    """
+
+    def __init__(self, rule_sets=RULE_SETS):
+        self._term_ids = {}
+        # 文本 -> 完全等于该文本的锚点条件编号；包含子串的锚点条件
+        self._equals = {}
+        self._contains = []
+        self.rule_sets = [RuleSet(rules, self._term) for rules in rule_sets]
+        defaults = [rule_set for rule_set in self.rule_sets if not rule_set.titles]
+        if not defaults:
+            raise ValueError("缺少默认规则集（titles 为空）")
+        self.default = defaults[0]
+
+    def _term(self, kind, text):
+        key = (kind, text)
+        if key not in self._term_ids:
+            term = self._term_ids[key] = len(self._term_ids)
+            if kind == "equals":
+                self._equals.setdefault(text, []).append(term)
+            else:
+                self._contains.append((term, text))
+        return self._term_ids[key]
+
+    def scan(self, spans):
+        """遍历一次span，返回 Scan"""
+        texts = spans.text
+        anchors = {}
+        for i in itertools.compress(range(len(texts)), map(self._equals.__contains__, texts)):
+            for term in self._equals[texts[i]]:
+                anchors.setdefault(term, []).append(i)
+        if self._contains:
+            # 在拼接后的文本中查找子串，再数前面的分隔符得到下标；文本本身含有分隔符时逐个查找
+            joined = "\x00".join(texts)
+            separated = joined.count("\x00") == len(texts) - 1
+            for term, sub in self._contains:
+                if not separated:
+                    found = [i for i, text in enumerate(texts) if sub in text]
+                else:
+                    found = []
+                    i = last = 0
+                    pos = joined.find(sub)
+                    while pos >= 0:
+                        i += joined.count("\x00", last, pos)
+                        last = pos
+                        if not found or found[-1] != i:
+                            found.append(i)
+                        pos = joined.find(sub, pos + 1)
+                if found:
+                    anchors[term] = found
+        tops = spans.top
+        order = sorted(range(len(texts)), key=tops.__getitem__)
+        inverted = max(0.0, max(map(operator.sub, tops, spans.bottom), default=0.0))
+        return Scan(anchors, order, [tops[i] for i in order], inverted, order[0] if order else None)
+
+    def select(self, spans, scan):
+        """按标题选择规则集"""
+        if scan.title is not None:
+            title = spans.text[scan.title]
+            for rule_set in self.rule_sets:
+                if any(text in title for text in rule_set.titles):
+                    return rule_set
+        return self.default
+
+    def extract_fields(self, spans):
+        """提取一页的发票字段，spans 为 get_coordinates.SpanTable"""
+        scan = self.scan(spans)
+        return self.select(spans, scan).extract(spans, scan)
+
+ENGINE = RuleEngine()
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+
+from input_sources import source_key
+
+# 日志文件名（放在输出文件夹中）
+JOURNAL_FILENAME = "job_journal.jsonl"
+# 追加的记录最多隔多少秒刷盘一次（进程崩溃不会丢失已写入的记录，断电最多丢失这段时间内的记录）
+SYNC_SECONDS = 1.0
+# 最多隔多少秒把已提取的行写入输出文件并记录检查点
+CHECKPOINT_SECONDS = 60.0
+
+class JobJournal:
+    """批处理任务的检查点日志：每个文件处理完后追加一行，记录结果和提取出的数据行
+
+    输出文件（特别是xlsx）按批写入，中途崩溃时最后一批还没有写入。日志是追加式的JSONL，
+    每个文件一行 {"source", "size", "mtime_ns", "rows", "error"}，写入成本与文件数成正比；
+    输出文件写入后追加 {"checkpoint": n, "positions": 各输出文件的位置}，表示前 n 个文件的行
+    已经在输出文件中。
+
+    重新运行时跳过日志中大小和修改时间都没变的文件（包括失败的文件），把输出文件回退到
+    最后一个检查点的位置，再重新写入之后的行，所以CSV/JSONL/SQLite中也不会出现重复行
+    （xlsx不能回退，跳过检查点之后已经写入的行，见 output_sinks.ExcelSink）。任务完成后删除日志，下次是一个新任务
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # 来源标识 -> (大小, 修改时间)
+        self.completed = {}
+        # 最后一个检查点之后的数据行，继续任务时需要重新写入输出文件
+        self.replay_rows = []
+        # 最后一个检查点时各输出文件的位置（OutputSink.position()）
+        self.positions = None
+        self.count = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        valid_bytes = self._load()
+        self.file = open(path, 'ab')
+        if self.file.tell() > valid_bytes:
+            # 写入时中断留下的不完整行
+            self.file.truncate(valid_bytes)
+        self._synced = time.monotonic()
+        self._checkpointed = time.monotonic()
+
+    def _load(self):
+        # 读取已有的日志，返回完整记录的字节数
+        if not os.path.exists(self.path):
+            return 0
+        valid_bytes = 0
+        # (序号, 数据行)，检查点写入时其后的文件可能已经追加在它前面，所以按序号而不是位置判断
+        unflushed = []
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+                if "checkpoint" in record:
+                    unflushed = [item for item in unflushed if item[0] >= record["checkpoint"]]
+                    self.positions = record["positions"]
+                    continue
+                unflushed.append((self.count, record["rows"]))
+                self.count += 1
+                self.completed[record["source"]] = (record["size"], record["mtime_ns"])
+        self.replay_rows = [row for _, rows in unflushed for row in rows]
+        return valid_bytes
+
+    @property
+    def resumed(self):
+        """是否在继续一个未完成的任务"""
+        return self.count > 0
+
+    def is_done(self, entry):
+        """entry（ScanEntry）是否已在日志中，且之后没有修改过"""
+        return self.completed.get(source_key(entry.source)) == (entry.size, entry.mtime_ns)
+
+    def begin(self, sink):
+        """开始写入输出目标 sink（OutputSink），返回需要重新写入的行
+
+        继续任务时先把 sink 回退到最后一个检查点；新任务记录 sink 的初始位置作为第一个检查点
+        """
+        if self.positions is not None:
+            sink.rollback(self.positions)
+        else:
+            self.checkpoint(0, sink.position())
+        rows, self.replay_rows = self.replay_rows, []
+        return rows
+
+    def pending(self, entries):
+        """跳过已完成的条目，逐个产出其余的 ScanEntry，跳过的个数记在 skipped 中"""
+        for entry in entries:
+            if self.is_done(entry):
+                self.skipped += 1
+            else:
+                yield entry
+
+    def record(self, entry, rows, error=None):
+        """记录一个文件的结果，rows 为 excel_summary.build_row 生成的数据行"""
+        line = json.dumps({"source": source_key(entry.source), "size": entry.size,
+                           "mtime_ns": entry.mtime_ns, "rows": rows, "error": error},
+                          ensure_ascii=False) + "\n"
+        with self._lock:
+            self.file.write(line.encode('utf-8'))
+            self.file.flush()
+            self.count += 1
+            now = time.monotonic()
+            if now - self._synced >= SYNC_SECONDS:
+                os.fsync(self.file.fileno())
+                self._synced = now
+
+    def checkpoint_due(self):
+        """距上次检查点是否已超过 CHECKPOINT_SECONDS"""
+        return time.monotonic() - self._checkpointed >= CHECKPOINT_SECONDS
+
+    def checkpoint_callback(self):
+        """返回记录检查点的函数，交给 output_sinks.BackgroundWriter.checkpoint，
+        在目前为止的所有行写入输出文件后调用"""
+        self._checkpointed = time.monotonic()
+        count = self.count
+        return lambda positions: self.checkpoint(count, positions)
+
+    def checkpoint(self, count, positions):
+        """记录前 count 个文件的行已经写入输出文件，positions 为此时各输出文件的位置"""
+        with self._lock:
+            self.positions = positions
+            record = {"checkpoint": count, "positions": positions}
+            self.file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self._synced = time.monotonic()
+
+    def close(self, finished=False):
+        """关闭日志；finished 为 True（所有文件都已处理并写入输出文件）时删除日志"""
+        with self._lock:
+            if self.file.closed:
+                return
+            if not finished:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.file.close()
+            if finished:
+                os.remove(self.path)
+
+def open_journal(output_dir, restart=False):
+    """打开输出文件夹中的任务日志；restart 为 True 时丢弃未完成的任务，从头开始"""
+    path = os.path.join(output_dir, JOURNAL_FILENAME)
+    if restart and os.path.exists(path):
+        os.remove(path)
+    return JobJournal(path)
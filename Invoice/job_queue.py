@@ -0,0 +1,616 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import excel_summary
+import output_sinks
+import triage
+from batch_process import iter_batch
+from input_sources import ScanEntry, ZipMember, scan_sources, source_name
+
+# 队列数据库和各工作进程结果分片的位置（都在队列文件夹中，可以放在多台机器共享的网络盘上）
+QUEUE_FILENAME = "job_queue.sqlite"
+SHARDS_DIRNAME = "shards"
+SHARD_SUFFIX = ".jsonl"
+# 租约时长：工作进程领取文件后在这段时间内没有续约（进程崩溃、机器断开）时，文件由其他进程重新领取
+DEFAULT_LEASE_SECONDS = 120.0
+# 同一个文件最多领取几次，超过后记为失败（例如每次处理都让进程崩溃的文件）
+MAX_ATTEMPTS = 3
+# 每次领取的文件数，领取在一个事务中完成，多个进程同时领取时不会拿到同一个文件
+CLAIM_FILES = 16
+# 处理完的文件每攒够多少个或隔多少秒写入分片并在队列中标记完成
+COMMIT_FILES = 32
+COMMIT_SECONDS = 2.0
+# 队列中只剩其他进程领取的文件时，最多隔多少秒检查一次（等待它们完成或租约过期）
+POLL_SECONDS = 5.0
+# 数据库被其他进程锁定时最多等待的秒数
+BUSY_TIMEOUT = 60.0
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+STATE_LABELS = {
+    PENDING: "等待处理",
+    LEASED: "处理中",
+    DONE: "已完成",
+    FAILED: "失败",
+}
+ABANDONED_ERROR = "已领取 {} 次都没有处理完（处理时进程出错退出或超时）"
+
+# 领取到的文件：key 为队列中的标识，attempt 为第几次领取（与 worker 一起标识这次处理）
+Job = namedtuple("Job", "key source size mtime_ns attempt")
+
+def default_worker_id():
+    """默认的工作进程标识：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class JobQueue:
+    """多个工作进程（可以在多台机器上）共用的文件队列，保存在队列文件夹的SQLite数据库中
+
+    每个文件一行 (key, 来源, 大小, 修改时间, 状态, 工作进程, 租约到期时间, 领取次数, 错误信息, 是否已合并)。
+    工作进程在一个写事务（BEGIN IMMEDIATE）中领取文件并写入租约到期时间，之后定期续约；
+    租约过期的文件视为无人处理，由下一个领取的进程接手。完成时只有租约仍属于自己
+    （工作进程和领取次数都相同）才标记完成，被接手后的迟到结果在合并时忽略。
+
+    来源保存为相对队列文件夹的路径，各机器挂载共享盘的位置不同也能找到文件。
+    数据库使用默认的回滚日志而不是WAL：WAL依赖共享内存，不能跨机器使用。
+    租约按各机器的系统时间计算，机器之间的时间差应远小于租约时长
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.path = os.path.join(self.queue_dir, QUEUE_FILENAME)
+        self.conn = self._connect()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " key TEXT PRIMARY KEY,"
+            " source TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " merged INTEGER NOT NULL DEFAULT 0)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, lease_until)")
+
+    def _connect(self):
+        # 自动提交模式，事务由 BEGIN IMMEDIATE / COMMIT 显式控制
+        return sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+
+    def _portable(self, path):
+        # 相对队列文件夹的路径，统一用 / 分隔；不在同一个盘符时只能保存绝对路径
+        try:
+            path = os.path.relpath(os.path.abspath(path), self.queue_dir)
+        except ValueError:
+            path = os.path.abspath(path)
+        return path.replace(os.sep, "/")
+
+    def _resolve(self, path):
+        return os.path.normpath(os.path.join(self.queue_dir, path))
+
+    def _encode(self, source):
+        # 返回 (key, 来源JSON)
+        if isinstance(source, ZipMember):
+            archive = self._portable(source.archive)
+            return (f"{archive}!{source.name}",
+                    json.dumps({"archive": archive, "member": source.member, "name": source.name},
+                               ensure_ascii=False))
+        if not isinstance(source, str):
+            raise ValueError("队列只能加入文件和压缩包中的PDF")
+        path = self._portable(source)
+        return path, json.dumps({"path": path}, ensure_ascii=False)
+
+    def _decode(self, text):
+        record = json.loads(text)
+        if "archive" in record:
+            return ZipMember(self._resolve(record["archive"]), record["member"], record["name"])
+        return self._resolve(record["path"])
+
+    def _transaction(self, func, *args):
+        # 在写事务中执行 func(*args)，出错时回滚
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return result
+
+    def enqueue(self, entries, batch_size=1000):
+        """加入 entries（ScanEntry），返回新加入或重新排队的文件数
+
+        已在队列中且大小和修改时间都没变的文件（包括已完成和失败的）不重复加入，
+        变化了的文件重新排队，之后合并时写入新的结果
+        """
+        sql = ("INSERT INTO jobs (key, source, size, mtime_ns, state) VALUES (?, ?, ?, ?, ?)"
+               " ON CONFLICT(key) DO UPDATE SET source = excluded.source, size = excluded.size,"
+               " mtime_ns = excluded.mtime_ns, state = excluded.state, worker = NULL, lease_until = NULL,"
+               " attempts = 0, error = NULL, merged = 0"
+               " WHERE jobs.size != excluded.size OR jobs.mtime_ns != excluded.mtime_ns")
+        added = 0
+        batch = []
+        for entry in entries:
+            key, source = self._encode(entry.source)
+            batch.append((key, source, entry.size, entry.mtime_ns, PENDING))
+            if len(batch) >= batch_size:
+                added += self._transaction(self._insert, sql, batch)
+                batch = []
+        if batch:
+            added += self._transaction(self._insert, sql, batch)
+        return added
+
+    def _insert(self, sql, rows):
+        before = self.conn.total_changes
+        self.conn.executemany(sql, rows)
+        return self.conn.total_changes - before
+
+    def claim(self, worker, limit=CLAIM_FILES, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """为 worker 领取最多 limit 个文件（先接手租约过期的，再按加入顺序领取），返回 [Job]
+
+        没有可领取的文件时返回空列表；领取次数达到 MAX_ATTEMPTS 的过期文件记为失败
+        """
+        while True:
+            jobs, abandoned = self._transaction(self._claim, worker, limit, lease_seconds)
+            if jobs or not abandoned:
+                return jobs
+
+    def _claim(self, worker, limit, lease_seconds):
+        now = time.time()
+        rows = self.conn.execute(
+            "SELECT key, source, size, mtime_ns, attempts FROM jobs WHERE state = ? AND lease_until < ?"
+            " LIMIT ?", (LEASED, now, limit)).fetchall()
+        if len(rows) < limit:
+            rows += self.conn.execute(
+                "SELECT key, source, size, mtime_ns, attempts FROM jobs WHERE state = ? ORDER BY rowid LIMIT ?",
+                (PENDING, limit - len(rows))).fetchall()
+        jobs = []
+        abandoned = 0
+        for key, source, size, mtime_ns, attempts in rows:
+            if attempts >= MAX_ATTEMPTS:
+                self.conn.execute(
+                    "UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL, error = ? WHERE key = ?",
+                    (FAILED, ABANDONED_ERROR.format(attempts), key))
+                abandoned += 1
+                continue
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = ? WHERE key = ?",
+                (LEASED, worker, now + lease_seconds, attempts + 1, key))
+            jobs.append(Job(key, self._decode(source), size, mtime_ns, attempts + 1))
+        return jobs, abandoned
+
+    def renew(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """续约 worker 领取的所有文件"""
+        self.conn.execute("UPDATE jobs SET lease_until = ? WHERE worker = ? AND state = ?",
+                          (time.time() + lease_seconds, worker, LEASED))
+
+    def complete(self, worker, results):
+        """标记 results [(Job, 错误信息)] 完成（错误信息为None）或失败，返回租约已被接手、没有标记的文件数"""
+        return self._transaction(self._complete, worker, results)
+
+    def _complete(self, worker, results):
+        lost = 0
+        for job, error in results:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET state = ?, lease_until = NULL, error = ?, merged = 0"
+                " WHERE key = ? AND worker = ? AND attempts = ? AND state = ?",
+                (DONE if error is None else FAILED, error, job.key, worker, job.attempt, LEASED))
+            if cursor.rowcount == 0:
+                lost += 1
+        return lost
+
+    def release(self, worker, failed_key=None):
+        """放回 worker 还没处理完的文件（正常退出或中断时），不计领取次数，返回放回的文件数
+
+        failed_key 为处理出错退出时正在处理的文件，只有它保留这次领取次数：每次都让工作进程出错的文件
+        领取 MAX_ATTEMPTS 次后记为失败，不会一直重试，同时领取的其他文件不受影响
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL,"
+            " attempts = attempts - CASE WHEN key = ? THEN 0 ELSE 1 END"
+            " WHERE worker = ? AND state = ?", (PENDING, failed_key, worker, LEASED))
+        return cursor.rowcount
+
+    def retry_failed(self):
+        """把失败的文件重新排队，返回文件数"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL, attempts = 0, error = NULL"
+            " WHERE state = ?", (PENDING, FAILED))
+        return cursor.rowcount
+
+    def others_leased_until(self, worker):
+        """其他工作进程领取的文件中最晚的租约到期时间，没有时返回None"""
+        return self.conn.execute("SELECT MAX(lease_until) FROM jobs WHERE state = ? AND worker != ?",
+                                 (LEASED, worker)).fetchone()[0]
+
+    def counts(self):
+        """各状态的文件数"""
+        counts = dict.fromkeys(STATE_LABELS, 0)
+        for state, count in self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+            counts[state] = count
+        return counts
+
+    def active_workers(self):
+        """租约未过期的工作进程及其领取的文件数"""
+        return self.conn.execute(
+            "SELECT worker, COUNT(*) FROM jobs WHERE state = ? AND lease_until >= ? GROUP BY worker ORDER BY worker",
+            (LEASED, time.time())).fetchall()
+
+    def completed(self, include_merged=False):
+        """已完成的文件 {key: (加入顺序, 工作进程, 领取次数)}，默认只包括还没合并过的"""
+        sql = "SELECT key, rowid, worker, attempts FROM jobs WHERE state = ?"
+        if not include_merged:
+            sql += " AND merged = 0"
+        return {key: (rowid, worker, attempts) for key, rowid, worker, attempts in self.conn.execute(sql, (DONE,))}
+
+    def failures(self):
+        """失败的文件 [(文件名, 错误信息)]"""
+        return [(source_name(self._decode(source)), error) for source, error in self.conn.execute(
+            "SELECT source, error FROM jobs WHERE state = ? ORDER BY rowid", (FAILED,))]
+
+    def mark_merged(self, keys):
+        self._transaction(self.conn.executemany, "UPDATE jobs SET merged = 1 WHERE key = ?",
+                          ((key,) for key in keys))
+
+    def close(self):
+        self.conn.close()
+
+class LeaseKeeper:
+    """后台线程：每隔租约时长的四分之一为工作进程领取的文件续约（使用单独的数据库连接）"""
+
+    def __init__(self, queue_dir, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.queue_dir = queue_dir
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        job_queue = JobQueue(self.queue_dir)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 4):
+                try:
+                    job_queue.renew(self.worker, self.lease_seconds)
+                except sqlite3.Error as e:
+                    # 数据库暂时锁定或网络盘断开，下次再续；一直续不上时租约过期，文件由其他进程接手
+                    print(f"续约失败: {str(e)}")
+        finally:
+            job_queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+def shards_dir(queue_dir):
+    return os.path.join(queue_dir, SHARDS_DIRNAME)
+
+class ResultShard:
+    """一个工作进程的结果分片：队列文件夹 shards 下以工作进程标识命名的JSONL文件，
+    每个完成的文件一行 {"key", "worker", "attempt", "rows"}，只由该进程追加"""
+
+    def __init__(self, queue_dir, worker):
+        os.makedirs(shards_dir(queue_dir), exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", worker)
+        self.path = os.path.join(shards_dir(queue_dir), name + SHARD_SUFFIX)
+        self.file = open(self.path, 'ab')
+        self._truncate_partial()
+
+    def _truncate_partial(self):
+        # 同一标识的进程上次写入时中断，去掉末尾不完整的行，新记录不会接在它后面
+        size = self.file.tell()
+        if size == 0:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(max(0, size - 1))
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            data = f.read()
+        self.file.truncate(data.rfind(b"\n") + 1)
+
+    def write(self, worker, results):
+        """写入 results [(Job, 数据行)] 并刷盘，之后才能在队列中标记完成"""
+        for job, rows in results:
+            record = {"key": job.key, "worker": worker, "attempt": job.attempt, "rows": rows}
+            self.file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+def _claim_entries(job_queue, worker, lease_seconds, jobs):
+    # 按需领取文件，交给 iter_batch 流式处理；领取到的 Job 记入 jobs 供按来源查找
+    while True:
+        claimed = job_queue.claim(worker, CLAIM_FILES, lease_seconds)
+        if not claimed:
+            return
+        for job in claimed:
+            jobs[job.source] = job
+            yield ScanEntry(job.source, job.size, job.mtime_ns)
+
+def run_worker(queue_dir, worker=None, workers=None, lease_seconds=DEFAULT_LEASE_SECONDS, wait=False,
+               regions=False, low_memory=False):
+    """处理队列中的文件，直到队列处理完（wait 为 True 时一直等待新文件），返回 (成功数, 失败数)
+
+    结果写入以 worker 命名的分片；其他进程领取的文件还没完成时等待，它们的租约过期后接手
+    """
+    worker = worker or default_worker_id()
+    job_queue = JobQueue(queue_dir)
+    shard = ResultShard(queue_dir, worker)
+    keeper = LeaseKeeper(queue_dir, worker, lease_seconds)
+    # 已领取、还没处理完的 Job；处理完还没写入分片的结果
+    jobs = {}
+    finished = []
+    done_count = failed_count = lost_count = 0
+    last_commit = time.monotonic()
+    # 出错退出时正在处理的文件
+    failed_key = None
+
+    def commit():
+        nonlocal lost_count, last_commit
+        shard.write(worker, [(job, rows) for job, rows, error in finished if error is None])
+        lost_count += job_queue.complete(worker, [(job, error) for job, rows, error in finished])
+        finished.clear()
+        last_commit = time.monotonic()
+
+    try:
+        while True:
+            for source, invoices, error in iter_batch(_claim_entries(job_queue, worker, lease_seconds, jobs),
+                                                      workers, regions=regions, low_memory=low_memory):
+                job = jobs[source]
+                pdf_file = source_name(source)
+                if error is not None:
+                    failed_count += 1
+                    print(f"[{worker}] 处理PDF文件 {pdf_file} 时出错: {error}")
+                    finished.append((job, None, error))
+                else:
+                    done_count += 1
+                    rows = [excel_summary.build_row(pdf_file, data, page_number) for page_number, data in invoices]
+                    print(f"[{worker}] 成功处理文件: {pdf_file}")
+                    finished.append((job, rows, None))
+                del jobs[source]
+                if len(finished) >= COMMIT_FILES or time.monotonic() - last_commit >= COMMIT_SECONDS:
+                    commit()
+            if finished:
+                commit()
+            # 没有可领取的文件：等待其他进程领取的文件完成或租约过期，或者（wait）等待新加入的文件
+            leased_until = job_queue.others_leased_until(worker)
+            if leased_until is None and not wait:
+                break
+            delay = POLL_SECONDS if leased_until is None else leased_until - time.time() + 1
+            time.sleep(min(POLL_SECONDS, max(delay, 0.1)))
+    except Exception:
+        # iter_batch 按领取顺序产出结果，出错时正在处理的是还没处理完的文件中最早领取的一个
+        failed_key = next(iter(jobs.values())).key if jobs else None
+        raise
+    finally:
+        keeper.stop()
+        try:
+            if finished:
+                commit()
+        finally:
+            # 中断时放回已领取、还没处理完的文件，其他进程可以马上接手
+            job_queue.release(worker, failed_key)
+            shard.close()
+            job_queue.close()
+    if lost_count:
+        print(f"[{worker}] 有 {lost_count} 个文件处理超时，已由其他进程接手")
+    return done_count, failed_count
+
+def _shard_records(queue_dir, completed):
+    # 在各分片中查找已完成文件对应的行（工作进程和领取次数与队列中一致），返回 {加入顺序: (分片, 偏移)}
+    locations = {}
+    directory = shards_dir(queue_dir)
+    if not os.path.isdir(directory):
+        return locations
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(SHARD_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    job = completed.get(record["key"]) if record else None
+                    if job is not None and job[1:] == (record["worker"], record["attempt"]):
+                        locations[job[0]] = (path, offset)
+                offset += len(line)
+    return locations
+
+def iter_merged_rows(queue_dir, completed):
+    """按文件加入队列的顺序产出 (key, 数据行)，completed 见 JobQueue.completed
+
+    先记下各分片中结果行的位置，再逐个读取，不在内存中保留全部数据行
+    """
+    locations = _shard_records(queue_dir, completed)
+    files = {}
+    try:
+        for order in sorted(locations):
+            path, offset = locations[order]
+            if path not in files:
+                files[path] = open(path, 'rb')
+            f = files[path]
+            f.seek(offset)
+            record = json.loads(f.readline())
+            yield record["key"], record["rows"]
+    finally:
+        for f in files.values():
+            f.close()
+
+def merge_results(queue_dir, output_dir, formats, include_merged=False, recreate=False):
+    """把各分片中已完成文件的结果合并到输出文件夹的汇总文件，返回 (文件数, 发票数, 重复的发票号码)
+
+    xlsx按发票号码去重（包括汇总文件中已有的发票）；合并过的文件在队列中标记，
+    再次合并只写入之后完成的文件，include_merged 为 True 时全部重新写入
+    """
+    excel_path = os.path.join(output_dir, excel_summary.SUMMARY_FILENAME)
+    os.makedirs(output_dir, exist_ok=True)
+    existing_invoice_numbers = None
+    if "xlsx" in formats:
+        try:
+            existing_invoice_numbers = excel_summary.load_invoice_numbers(excel_path)
+        except Exception:
+            if not recreate:
+                raise
+            excel_summary.backup_summary(excel_path)
+            existing_invoice_numbers = set()
+    job_queue = JobQueue(queue_dir)
+    try:
+        completed = job_queue.completed(include_merged)
+        writer = output_sinks.BackgroundWriter(output_sinks.open_sinks(output_dir, formats, existing_invoice_numbers))
+        merged_keys = []
+        invoice_count = 0
+        try:
+            for key, rows in iter_merged_rows(queue_dir, completed):
+                merged_keys.append(key)
+                invoice_count += len(rows)
+                for row in rows:
+                    writer.add(row)
+        finally:
+            duplicate_invoices = writer.close()
+        job_queue.mark_merged(merged_keys)
+        missing = len(completed) - len(merged_keys)
+        if missing:
+            print(f"有 {missing} 个已完成的文件在分片中找不到结果（分片被删除或移动），可重新加入队列")
+    finally:
+        job_queue.close()
+    return len(merged_keys), invoice_count, duplicate_invoices
+
+def _print_status(job_queue):
+    counts = job_queue.counts()
+    print("，".join(f"{STATE_LABELS[state]} {count} 个" for state, count in counts.items()))
+    for worker, count in job_queue.active_workers():
+        print(f"  {worker}: 正在处理 {count} 个文件")
+    return counts
+
+def main(argv=None):
+    """命令行入口：多个工作进程共用一个队列处理大量发票"""
+    parser = argparse.ArgumentParser(
+        description="多进程/多机共用的发票处理队列：加入文件，在一台或多台机器上启动任意数量的工作进程，最后合并结果")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="把文件夹、PDF或ZIP压缩包中的文件加入队列")
+    add.add_argument("queue", help="队列文件夹（多台机器时放在共享盘上）")
+    add.add_argument("source", help="PDF文件、ZIP压缩包或包含它们的文件夹")
+    add.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹中的PDF和压缩包")
+
+    work = commands.add_parser("work", help="启动一个工作进程处理队列中的文件")
+    work.add_argument("queue", help="队列文件夹")
+    work.add_argument("-j", "--workers", type=int, default=None, help="本工作进程使用的进程数，默认为CPU核心数")
+    work.add_argument("--worker-id", default=None, help="工作进程标识（结果分片的文件名），默认为 主机名-进程号")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                      help=f"租约时长（秒），超时没有续约的文件由其他进程接手，默认 {DEFAULT_LEASE_SECONDS:g}")
+    work.add_argument("--wait", action="store_true", help="队列处理完后继续等待新加入的文件")
+    work.add_argument("--regions", action="store_true",
+                      help="区域模式：只解析表头、购/销信息和合计行附近的文本，找不到锚点时退回整页")
+    work.add_argument("--low-memory", action="store_true",
+                      help="低内存模式：限制同时处理的文件数，及时释放PyMuPDF缓存")
+
+    status = commands.add_parser("status", help="查看队列中各状态的文件数和正在运行的工作进程")
+    status.add_argument("queue", help="队列文件夹")
+
+    retry = commands.add_parser("retry", help="把失败的文件重新排队")
+    retry.add_argument("queue", help="队列文件夹")
+
+    merge = commands.add_parser("merge", help="把各工作进程的结果合并为发票数据汇总.xlsx（按发票号码去重）")
+    merge.add_argument("queue", help="队列文件夹")
+    merge.add_argument("-o", "--output", default=None, help="输出文件夹，默认为队列文件夹")
+    merge.add_argument("--format", default=",".join(output_sinks.DEFAULT_FORMATS),
+                       help="输出格式，可用逗号分隔同时输出多种：xlsx,csv,jsonl,sqlite（默认xlsx）")
+    merge.add_argument("--all", action="store_true", help="重新写入所有已完成的文件，包括之前合并过的")
+    merge.add_argument("--recreate", action="store_true", help="现有汇总文件无法读取时备份并新建，而不是退出")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        os.makedirs(args.queue, exist_ok=True)
+        entries = list(scan_sources(args.source, args.recursive))
+        if not entries:
+            print("没有找到PDF文件")
+            return 1
+        job_queue = JobQueue(args.queue)
+        try:
+            added = job_queue.enqueue(entries)
+            print(f"找到 {len(entries)} 个文件，加入队列 {added} 个（其余已在队列中且没有修改）")
+            _print_status(job_queue)
+        finally:
+            job_queue.close()
+        return 0
+
+    if not os.path.exists(os.path.join(args.queue, QUEUE_FILENAME)):
+        print(f"队列不存在: {args.queue}（先用 add 加入文件）")
+        return 1
+
+    if args.command == "work":
+        start = time.perf_counter()
+        try:
+            done_count, failed_count = run_worker(args.queue, args.worker_id, args.workers, args.lease, args.wait,
+                                                  args.regions, args.low_memory)
+        except KeyboardInterrupt:
+            print("已中断，已完成的结果已保存，其余文件已放回队列")
+            return 130
+        except Exception as e:
+            print(f"处理时出错: {str(e)}（已完成的结果已保存，其余文件已放回队列）")
+            return 1
+        elapsed = time.perf_counter() - start
+        print(f"队列已处理完：本进程成功 {done_count} 个文件，失败 {failed_count} 个，耗时 {elapsed:.1f} 秒")
+        return 0
+
+    job_queue = JobQueue(args.queue)
+    try:
+        if args.command == "status":
+            _print_status(job_queue)
+            return 0
+        if args.command == "retry":
+            print(f"重新排队 {job_queue.retry_failed()} 个失败的文件")
+            return 0
+        counts = job_queue.counts()
+        failures = job_queue.failures()
+    finally:
+        job_queue.close()
+
+    try:
+        formats = output_sinks.parse_formats(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    output_dir = args.output or args.queue
+    try:
+        file_count, invoice_count, duplicate_invoices = merge_results(args.queue, output_dir, formats, args.all,
+                                                                      args.recreate)
+    except Exception as e:
+        print(f"合并结果时出错: {str(e)}（汇总文件无法读取时可使用 --recreate 备份并新建）")
+        return 1
+    for fmt in formats:
+        print(f"数据已保存到: {output_sinks.summary_path(output_dir, fmt)}")
+    print(f"合并 {file_count} 个文件（{invoice_count} 张发票）")
+    if duplicate_invoices:
+        print(f"发现 {len(duplicate_invoices)} 个重复发票号码，已跳过")
+    unfinished = counts[PENDING] + counts[LEASED]
+    if unfinished:
+        print(f"队列中还有 {unfinished} 个文件没有处理完，完成后再次合并会写入它们的结果")
+    if failures:
+        print(triage.describe_failures(failures))
+        report_path = os.path.join(output_dir, triage.REPORT_FILENAME)
+        triage.write_report(report_path, failures)
+        print(f"未提取的文件已保存到: {report_path}")
+    return 0 if not failures else 2
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,343 @@
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+import excel_summary
+
+# 可选的输出格式，对应输出文件夹中的 发票数据汇总.<扩展名>
+FORMATS = ["xlsx", "csv", "jsonl", "sqlite"]
+DEFAULT_FORMATS = ["xlsx"]
+
+def summary_path(output_dir, fmt):
+    """输出文件路径，例如 发票数据汇总.csv"""
+    base = os.path.splitext(excel_summary.SUMMARY_FILENAME)[0]
+    return os.path.join(output_dir, f"{base}.{fmt}")
+
+class OutputSink:
+    """输出目标：write(rows) 追加一批 build_row 生成的数据行，close() 结束写入
+
+    按发票号码去重由 MultiSink 统一完成，各输出目标收到的是同样的行；
+    CSV/JSONL/SQLite 为追加式的流式输出，每批写完立即落盘，内存占用只与批大小有关
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # rollback() 后仍留在文件中（无法撤销）的行的发票号码，见 ExcelSink
+        self.kept = set()
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    def flush(self):
+        """把缓存的行写入文件（只有按批写入的xlsx需要）"""
+        pass
+
+    def invoice_numbers(self):
+        """文件中已有的发票号码集合（xlsx由调用方通过 excel_summary.load_invoice_numbers 读取）"""
+        return set()
+
+    def position(self):
+        """当前写到的位置，配合 rollback() 撤销之后写入的行；不支持时返回None"""
+        return None
+
+    def rollback(self, position):
+        """撤销 position 之后写入的行（继续中断的任务时使用，见 job_journal）"""
+        pass
+
+    def close(self):
+        pass
+
+class ExcelSink(OutputSink):
+    """原有的xlsx汇总文件，流式追加
+
+    每次追加都要复制整个xlsx压缩包，所以先攒够 batch_rows 行（或 close() 时）再写入。
+    位置为已用行数；xlsx不能截断，rollback() 只记下位置之后已写入的发票号码（kept），
+    重新写入时跳过这些行
+    """
+
+    def __init__(self, path, batch_rows=10000):
+        super().__init__(path)
+        self.batch_rows = batch_rows
+        self.pending = []
+
+    def write(self, rows):
+        if self.kept:
+            rows = [row for row in rows if row["发票号码"] not in self.kept]
+        self.pending.extend(rows)
+        if len(self.pending) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            rows, self.pending = self.pending, []
+            # 行已由 MultiSink 去重，这里不再按已有发票号码跳过
+            excel_summary.save_rows(self.path, rows, set())
+
+    def position(self):
+        return excel_summary.summary_rows(self.path)
+
+    def rollback(self, position):
+        if position is not None and excel_summary.summary_rows(self.path) > position:
+            self.kept = excel_summary.invoice_numbers_after(self.path, position)
+
+    def close(self):
+        self.flush()
+
+class CsvSink(OutputSink):
+    """CSV文件，新文件写入表头；使用带BOM的UTF-8，Excel可以直接打开"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', encoding='utf-8-sig' if is_new else 'utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        if is_new:
+            self.writer.writerow(excel_summary.COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows([row[col] for col in excel_summary.COLUMNS] for row in rows)
+        self.file.flush()
+
+    def invoice_numbers(self):
+        self.file.flush()
+        with open(self.path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header or "发票号码" not in header:
+                return set()
+            col = header.index("发票号码")
+            return {row[col] for row in reader if len(row) > col and row[col]}
+
+    def position(self):
+        return self.file.tell()
+
+    def rollback(self, position):
+        if position is not None and position < self.file.tell():
+            self.file.truncate(position)
+            self.file.seek(position)
+
+    def close(self):
+        self.file.close()
+
+class JsonlSink(OutputSink):
+    """JSON Lines文件，每行一张发票"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'a', encoding='utf-8', newline='\n')
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        self.file.flush()
+
+    def invoice_numbers(self):
+        self.file.flush()
+        numbers = set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    number = json.loads(line).get("发票号码")
+                except ValueError:
+                    # 中断时没写完的最后一行
+                    continue
+                if number:
+                    numbers.add(str(number))
+        return numbers
+
+    def position(self):
+        return self.file.tell()
+
+    def rollback(self, position):
+        if position is not None and position < self.file.tell():
+            self.file.truncate(position)
+            self.file.seek(position)
+
+    def close(self):
+        self.file.close()
+
+class SqliteSink(OutputSink):
+    """SQLite数据库中的 invoices 表，列名与汇总表相同，按发票号码建索引"""
+
+    TABLE = "invoices"
+
+    def __init__(self, path):
+        super().__init__(path)
+        # 连接在主线程中创建，由 BackgroundWriter 的写入线程使用
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f'"{col}" {"INTEGER" if col == "页码" else "TEXT"}'
+                            for col in excel_summary.COLUMNS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({columns})")
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_invoice_number ON {self.TABLE} ("发票号码")')
+        self.conn.commit()
+        placeholders = ", ".join("?" for _ in excel_summary.COLUMNS)
+        self.insert_sql = f"INSERT INTO {self.TABLE} VALUES ({placeholders})"
+
+    def write(self, rows):
+        self.conn.executemany(self.insert_sql, ([row[col] for col in excel_summary.COLUMNS] for row in rows))
+        self.conn.commit()
+
+    def invoice_numbers(self):
+        return {number for number, in self.conn.execute(f'SELECT DISTINCT "发票号码" FROM {self.TABLE}') if number}
+
+    def position(self):
+        return self.conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def rollback(self, position):
+        if position is not None:
+            self.conn.execute(f"DELETE FROM {self.TABLE} WHERE rowid > ?", (position,))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+class MultiSink(OutputSink):
+    """按发票号码去重后同时写入多个输出目标，每个目标收到同样的行
+
+    invoice_numbers 为已有的发票号码（一般来自xlsx汇总文件），写入时会被更新；第一次写入时再加入
+    CSV/JSONL/SQLite文件中已有的号码（在 rollback() 之后读取，不包括被撤销的行）。
+    duplicates 记录因发票号码重复而跳过的号码
+    """
+
+    def __init__(self, sinks, invoice_numbers=None):
+        super().__init__(None)
+        self.sinks = sinks
+        self.invoice_numbers = invoice_numbers if invoice_numbers is not None else set()
+        self.duplicates = []
+        self.loaded = False
+
+    def write(self, rows):
+        if not self.loaded:
+            for sink in self.sinks:
+                self.invoice_numbers.update(sink.invoice_numbers())
+            self.loaded = True
+        unique = []
+        for row in rows:
+            invoice_number = row["发票号码"]
+            if invoice_number in self.invoice_numbers:
+                self.duplicates.append(invoice_number)
+                continue
+            self.invoice_numbers.add(invoice_number)
+            unique.append(row)
+        if unique:
+            for sink in self.sinks:
+                sink.write(unique)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def position(self):
+        # 按文件名记录各输出目标的位置
+        return {os.path.basename(sink.path): sink.position() for sink in self.sinks}
+
+    def rollback(self, position):
+        for sink in self.sinks:
+            sink.rollback((position or {}).get(os.path.basename(sink.path)))
+            # 检查点之后已写入xlsx的行要重新写入其他目标，不能当作重复跳过
+            self.invoice_numbers.difference_update(sink.kept)
+
+    def close(self):
+        errors = []
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+def parse_formats(value):
+    """解析逗号分隔的格式列表，例如 "xlsx,csv" """
+    formats = [fmt.strip().lower() for fmt in value.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"不支持的输出格式: {', '.join(unknown) or value}（可选: {', '.join(FORMATS)}）")
+    return list(dict.fromkeys(formats))
+
+def open_sinks(output_dir, formats, existing_invoice_numbers=None):
+    """在输出文件夹中打开指定格式的输出目标，返回 MultiSink
+
+    包含xlsx时 existing_invoice_numbers 为汇总文件中已有的发票号码（见 excel_summary.load_invoice_numbers）；
+    其他格式已有的发票号码由 MultiSink 读取，所有格式都跳过任一输出文件中已有的发票号码
+    """
+    sinks = []
+    try:
+        for fmt in formats:
+            path = summary_path(output_dir, fmt)
+            if fmt == "xlsx":
+                sinks.append(ExcelSink(path))
+            elif fmt == "csv":
+                sinks.append(CsvSink(path))
+            elif fmt == "jsonl":
+                sinks.append(JsonlSink(path))
+            elif fmt == "sqlite":
+                sinks.append(SqliteSink(path))
+    except Exception:
+        MultiSink(sinks).close()
+        raise
+    return MultiSink(sinks, existing_invoice_numbers)
+
+class BackgroundWriter:
+    """在后台线程中按批把数据行写入输出目标，提取可以在写入前面结果的同时继续进行
+
+    sink 只在写入线程中使用。close() 写完剩余的行并关闭 sink，返回被跳过的重复发票号码；
+    写入出错时在 close() 中重新抛出。等待写入的批次有上限，写入跟不上时提取会暂停，内存占用有界。
+    checkpoint(callback) 在之前的行都写入文件后，在写入线程中调用 callback(sink.position())（见 job_journal）
+    """
+
+    def __init__(self, sink, batch_rows=500, max_pending_batches=4):
+        self.sink = sink
+        self.batch_rows = batch_rows
+        self.pending = []
+        self.error = None
+        self.queue = queue.Queue(maxsize=max_pending_batches)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.queue.put(self.pending)
+            self.pending = []
+
+    def checkpoint(self, callback):
+        self.flush()
+        self.queue.put(callback)
+
+    def _run(self):
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                if callable(rows):
+                    # 检查点：之前的行都已交给 sink，先写入文件再通知
+                    self.sink.flush()
+                    rows(self.sink.position())
+                else:
+                    self.sink.write(rows)
+            except Exception as e:
+                # 出错后不再写入后续批次，由 close() 报告
+                self.error = e
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.sink.close()
+        except Exception as e:
+            self.error = self.error or e
+        if self.error is not None:
+            raise self.error
+        return self.sink.duplicates
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from get_coordinates import EXTRACTOR_VERSION
+
+# 缓存文件名（默认放在输出文件夹中）
+CACHE_FILENAME = "invoice_cache.sqlite"
+# 缓存大小上限（按结果JSON的字节数计算），超过后淘汰最久未使用的记录
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 每累计多少次写操作提交一次事务
+COMMIT_EVERY = 200
+
+def file_digest(pdf_path):
+    """计算文件内容的SHA-256"""
+    h = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ResultCache:
+    """以PDF内容哈希+提取规则版本为键的持久化结果缓存（SQLite）"""
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES, version=EXTRACTOR_VERSION):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " digest TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (digest, version))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used)")
+        # 提取规则版本变化后，旧版本的结果全部作废
+        self.conn.execute("DELETE FROM results WHERE version != ?", (self.version,))
+        self.conn.commit()
+        self._total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    digest = staticmethod(file_digest)
+
+    def get(self, digest):
+        """命中时返回缓存的字段字典，否则返回None"""
+        row = self.conn.execute(
+            "SELECT data FROM results WHERE digest = ? AND version = ?",
+            (digest, self.version)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE results SET last_used = ? WHERE digest = ? AND version = ?",
+            (time.time(), digest, self.version))
+        self._written()
+        return json.loads(row[0])
+
+    def put(self, digest, data):
+        """保存提取结果，超过大小上限时淘汰最久未使用的记录"""
+        text = json.dumps(data, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        old = self.conn.execute(
+            "SELECT size FROM results WHERE digest = ? AND version = ?",
+            (digest, self.version)).fetchone()
+        if old:
+            self._total_bytes -= old[0]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results (digest, version, data, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (digest, self.version, text, size, time.time()))
+        self._total_bytes += size
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+        self._written()
+
+    def _evict(self):
+        # 淘汰到上限的90%，避免每次写入都触发淘汰
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT digest, version, size FROM results ORDER BY last_used")
+        to_delete = []
+        for digest, version, size in rows:
+            if self._total_bytes <= target:
+                break
+            to_delete.append((digest, version))
+            self._total_bytes -= size
+        self.conn.executemany("DELETE FROM results WHERE digest = ? AND version = ?", to_delete)
+
+    def invalidate_all(self):
+        """清空全部缓存（提取规则变化时使用）"""
+        self.conn.execute("DELETE FROM results")
+        self.conn.commit()
+        self._total_bytes = 0
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def open_cache(output_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """打开输出文件夹中的缓存，无法打开时返回None（不影响正常处理）"""
+    try:
+        return ResultCache(os.path.join(output_dir, CACHE_FILENAME), max_bytes)
+    except sqlite3.Error as e:
+        print(f"打开结果缓存失败，将不使用缓存: {str(e)}")
+        return None
@@ -1,5 +1,6 @@
 import os
 import sys
+import multiprocessing
 import traceback
 from tkinter import messagebox
 import tkinter as tk
@@ -43,4 +44,6 @@ def main():
         input("\n按回车键退出...")
 
 if __name__ == "__main__":
+    # 打包后使用多进程批处理时需要
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""启动时间基准测试：窗口出现时间和第一次提取完成时间
+
+用法:
+    python startup_benchmark.py [--runs 5] [--sample 发票.pdf] [--click-delay 500] [--json report.json]
+
+每次测量都启动一个新的Python进程（冷启动），按 run.py 的顺序导入 invoice_gui、创建窗口，
+再模拟用户在窗口出现 --click-delay 毫秒后开始处理一个PDF。分别测量开启和关闭后台预热时：
+- gui_import：导入 invoice_gui 完成
+- first_window：窗口创建并显示完成（没有图形界面的环境中跳过）
+- first_extraction：第一个PDF提取完成（包括导入PyMuPDF等模块）
+时间均从启动子进程开始计算，python_startup 为空解释器的启动时间，作为参照。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from instrumentation import percentile
+
+MILESTONES = ["python_startup", "gui_import", "first_window", "first_extraction"]
+
+def child(t0, sample, prewarm, click_delay):
+    """子进程：按用户启动程序的顺序执行，输出各节点距启动的秒数（JSON）"""
+    marks = {}
+    import tkinter as tk
+    import invoice_gui
+    marks["gui_import"] = time.time() - t0
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        # 没有图形界面时只测量导入和提取
+        root = None
+    if root is not None:
+        invoice_gui.InvoiceProcessorGUI(root, prewarm=prewarm)
+        root.update()
+        marks["first_window"] = time.time() - t0
+        # 等待用户点击期间照常处理界面事件，预热在后台进行
+        deadline = time.time() + click_delay / 1000
+        while time.time() < deadline:
+            root.update()
+            time.sleep(0.01)
+    else:
+        if prewarm:
+            threading.Thread(target=invoice_gui.prewarm_modules, daemon=True).start()
+        time.sleep(click_delay / 1000)
+    # 与 process_files 相同：导入批处理模块后提取
+    from batch_process import iter_batch
+    for pdf_path, invoices, error in iter_batch([sample], workers=1):
+        if error is not None:
+            raise SystemExit(f"提取失败: {error}")
+    marks["first_extraction"] = time.time() - t0
+    if root is not None:
+        root.destroy()
+    print(json.dumps(marks))
+
+def measure(sample, prewarm, click_delay):
+    """启动一个子进程测量一次，返回 {节点: 秒}"""
+    script = os.path.abspath(__file__)
+    args = [sys.executable, "-W", "ignore", script, "--child", repr(time.time()),
+            "--sample", sample, "--click-delay", str(click_delay)]
+    if prewarm:
+        args.append("--prewarm")
+    output = subprocess.run(args, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(script)).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_python_startup():
+    t0 = time.time()
+    output = subprocess.run([sys.executable, "-c", "import time; print(time.time())"],
+                            capture_output=True, text=True, check=True).stdout
+    return float(output) - t0
+
+def run(sample, runs, click_delay):
+    """分别在关闭和开启预热时测量 runs 次，返回每种配置下各节点的中位数和最大值（毫秒）"""
+    baseline = sorted(measure_python_startup() for _ in range(runs))
+    report = {"runs": runs, "click_delay_ms": click_delay, "configs": {}}
+    for prewarm in (False, True):
+        samples = {}
+        for _ in range(runs):
+            for name, seconds in measure(sample, prewarm, click_delay).items():
+                samples.setdefault(name, []).append(seconds)
+        samples["python_startup"] = baseline
+        report["configs"]["prewarm" if prewarm else "no_prewarm"] = {
+            name: {"p50_ms": percentile(sorted(samples[name]), 50) * 1000,
+                   "max_ms": max(samples[name]) * 1000}
+            for name in MILESTONES if name in samples
+        }
+    return report
+
+def print_report(report):
+    print(f"冷启动 {report['runs']} 次，窗口出现 {report['click_delay_ms']} 毫秒后开始处理")
+    for config, milestones in report["configs"].items():
+        print(f"{'开启预热' if config == 'prewarm' else '关闭预热'}:")
+        for name, s in milestones.items():
+            print(f"  {name:<17} p50 {s['p50_ms']:8.1f} ms  最大 {s['max_ms']:8.1f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动时间基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="每种配置的冷启动次数")
+    parser.add_argument("--sample", default=None, help="用于第一次提取的PDF（默认生成一张合成发票）")
+    parser.add_argument("--click-delay", type=int, default=500,
+                        help="窗口出现多少毫秒后模拟用户开始处理")
+    parser.add_argument("--json", default=None, help="把结果保存为JSON文件")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--prewarm", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        child(float(args.child), args.sample, args.prewarm, args.click_delay)
+        return 0
+
+    sample = args.sample
+    if sample is None:
+        import synthetic_invoices
+        corpus = tempfile.mkdtemp(prefix="invoice_startup_")
+        synthetic_invoices.generate_corpus(corpus, 1, 0)
+        sample = os.path.join(corpus, sorted(f for f in os.listdir(corpus) if f.endswith(".pdf"))[0])
+    report = run(os.path.abspath(sample), args.runs, args.click_delay)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"结果已保存到: {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import argparse
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from input_sources import close_archives, find_sources, open_source, read_sibling, source_name
+from invoice_rules import FIELD_NAMES
+
+# 结构化发票数据的文件类型：发票XML，以及OFD版式文件（ZIP格式，其中带有发票XML）
+SIBLING_EXTENSIONS = (".xml", ".ofd")
+# 内嵌文件、同名文件和OFD中的XML超过该大小时不读取（发票XML通常只有几十KB）
+MAX_DATA_BYTES = 8 * 1024 * 1024
+
+# 字段 -> XML元素名（不含命名空间，依次查找，取文档中第一个有文本的元素）：
+# 全电发票XML（InvoiceNumber、SellerIdNum 等）和OFD电子发票中的 original_invoice.xml（InvoiceNo、SellerTaxID 等）
+FIELD_TAGS = {
+    "invoice_number": ("InvoiceNumber", "InvoiceNo"),
+    "invoice_date": ("IssueTime", "IssueDate", "RequestTime"),
+    "buyer_name": ("BuyerName",),
+    "buyer_tax_id": ("BuyerIdNum", "BuyerTaxID"),
+    "seller_name": ("SellerName",),
+    "seller_tax_id": ("SellerIdNum", "SellerTaxID"),
+    "net_amount": ("TotalAmWithoutTax", "TaxExclusiveTotalAmount"),
+    "tax_amount": ("TotalTaxAm", "TaxTotalAmount"),
+    "total_amount": ("TotalTax-includedAmount", "TaxInclusiveTotalAmount"),
+}
+# 发票种类标签（其下的 LabelName 为"普通发票"、"增值税专用发票"等），发票类型写作 电子发票（种类）
+TYPE_TAGS = ("GeneralOrSpecialVAT", "EInvoiceType")
+AMOUNT_FIELDS = ("net_amount", "tax_amount", "total_amount")
+# 2024-01-15、2024-01-15 10:00:00、20240115、2024年01月15日 等日期
+DATE_PATTERN = re.compile(r"(\d{4})\D?(\d{1,2})\D?(\d{1,2})")
+
+# 核对结果：structured 为结构化数据的字段（没有时为None），mismatches 为 [(字段, 结构化数据, 版式规则)]
+CrossCheck = namedtuple("CrossCheck", "source structured mismatches error")
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def _normalize_date(value):
+    # 与版式规则提取出的开票日期格式一致：2024年01月15日
+    match = DATE_PATTERN.match(value)
+    if not match:
+        return value
+    year, month, day = match.groups()
+    return f"{year}年{int(month):02d}月{int(day):02d}日"
+
+def _normalize_amount(value):
+    # 与票面上的金额格式一致：保留两位小数
+    try:
+        return str(Decimal(value.replace(",", "").replace("¥", "")).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return value
+
+def parse_invoice_xml(data):
+    """从发票XML中解析字段，字段格式与版式规则的提取结果相同；
+    不是发票数据（没有发票号码或价税合计）或无法解析时返回None"""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return None
+    values = {}
+    labels = {}
+    for element in root.iter():
+        tag = _local_name(element.tag)
+        text = (element.text or "").strip()
+        if text and tag not in values:
+            values[tag] = text
+        if tag in TYPE_TAGS and tag not in labels:
+            for child in element:
+                if _local_name(child.tag) == "LabelName" and (child.text or "").strip():
+                    labels[tag] = child.text.strip()
+                    break
+    fields = dict.fromkeys(FIELD_NAMES, "")
+    for name, tags in FIELD_TAGS.items():
+        fields[name] = next((values[tag] for tag in tags if tag in values), "")
+    if not fields["invoice_number"] or not fields["total_amount"]:
+        return None
+    label = next((labels[tag] for tag in TYPE_TAGS if tag in labels), "")
+    if label:
+        fields["invoice_type"] = f"电子发票（{label}）"
+    if fields["invoice_date"]:
+        fields["invoice_date"] = _normalize_date(fields["invoice_date"])
+    for name in AMOUNT_FIELDS:
+        if fields[name]:
+            fields[name] = _normalize_amount(fields[name])
+    return fields
+
+def parse_invoice_ofd(data):
+    """从OFD文件中的发票XML解析字段，文件名含 invoice 的XML（如 original_invoice.xml）优先"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        members = [info for info in archive.infolist()
+                   if info.filename.lower().endswith(".xml") and info.file_size <= MAX_DATA_BYTES]
+        members.sort(key=lambda info: "invoice" not in info.filename.lower())
+        for info in members:
+            fields = parse_invoice_xml(archive.read(info))
+            if fields is not None:
+                return fields
+    return None
+
+def parse_invoice_data(name, data):
+    """按文件名（或内容）解析XML或OFD中的发票字段，不是发票数据时返回None"""
+    if name.lower().endswith(".ofd") or data[:4] == b"PK\x03\x04":
+        return parse_invoice_ofd(data)
+    return parse_invoice_xml(data)
+
+def _embedded_files(doc):
+    # PDF内嵌的XML/OFD文件 (文件名, 内容)
+    for i in range(doc.embfile_count()):
+        info = doc.embfile_info(i)
+        name = info.get("ufilename") or info.get("filename") or info.get("name") or ""
+        if name.lower().endswith(SIBLING_EXTENSIONS) and info.get("size", 0) <= MAX_DATA_BYTES:
+            yield name, doc.embfile_get(i)
+
+def find_invoice(doc, source=None):
+    """查找已打开文档的结构化发票数据，返回字段字典，没有时返回None
+
+    先查找PDF内嵌的XML/OFD文件，再查找与 source 同名的XML/OFD文件（见 input_sources.read_sibling）。
+    结构化数据无法读取或不是发票数据时同样返回None，由调用方按版式规则提取
+    """
+    try:
+        for name, data in _embedded_files(doc):
+            fields = parse_invoice_data(name, data)
+            if fields is not None:
+                return fields
+        if source is not None:
+            sibling = read_sibling(source, SIBLING_EXTENSIONS)
+            if sibling is not None:
+                return parse_invoice_data(*sibling)
+    except Exception:
+        return None
+    return None
+
+def cache_digest(source, digest):
+    """结果缓存的键：source 有同名的XML/OFD文件时把它的内容也算进去，
+    同名文件出现、变化或删除后不会命中之前的结果；digest 为PDF内容的哈希"""
+    try:
+        sibling = read_sibling(source, SIBLING_EXTENSIONS)
+    except OSError:
+        return digest
+    if sibling is None:
+        return digest
+    return hashlib.sha256((digest + hashlib.sha256(sibling[1]).hexdigest()).encode('ascii')).hexdigest()
+
+def compare(structured, layout):
+    """比较结构化数据和版式规则的提取结果，返回不一致的字段 [(字段, 结构化数据, 版式规则)]；
+    结构化数据中为空的字段不比较"""
+    return [(name, structured[name], layout.get(name, "")) for name in FIELD_NAMES
+            if structured[name] and structured[name] != layout.get(name, "")]
+
+def cross_check_source(source):
+    """核对一个来源：有结构化数据时同时按版式规则提取第一张发票并比较，返回 CrossCheck"""
+    # 核对时才需要版式规则
+    from get_coordinates import extract_document
+    try:
+        with open_source(source) as doc:
+            structured = find_invoice(doc, source)
+            if structured is None:
+                return CrossCheck(source, None, [], "")
+            invoices = extract_document(doc)
+    except Exception as e:
+        return CrossCheck(source, None, [], str(e))
+    layout = invoices[0][1] if invoices else {}
+    return CrossCheck(source, structured, compare(structured, layout), "")
+
+def _cross_check_chunk(sources):
+    try:
+        return [cross_check_source(source) for source in sources]
+    finally:
+        close_archives()
+
+def iter_cross_check(sources, workers=None):
+    """按输入顺序产出每个来源的 CrossCheck，文件多时使用多个进程"""
+    workers = workers or os.cpu_count() or 1
+    size = max(1, min(64, len(sources) // (workers * 4)))
+    chunks = [sources[i:i + size] for i in range(0, len(sources), size)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from _cross_check_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_cross_check_chunk, chunks):
+            yield from results
+
+def main(argv=None):
+    """命令行入口：核对结构化数据与版式规则的提取结果"""
+    parser = argparse.ArgumentParser(description="核对发票的结构化数据（内嵌或同名XML/OFD）与版式规则的提取结果")
+    parser.add_argument("source", help="PDF文件、ZIP压缩包或包含它们的文件夹")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹中的PDF和压缩包")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("--csv", default=None, help="把不一致的字段保存为CSV")
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.source, args.recursive)
+    if not sources:
+        print("没有找到PDF文件")
+        return 1
+    structured = matched = 0
+    failures = []
+    rows = []
+    for result in iter_cross_check(sources, args.workers):
+        name = source_name(result.source)
+        if result.error:
+            failures.append(name)
+            print(f"处理PDF文件 {name} 时出错: {result.error}")
+            continue
+        if result.structured is None:
+            continue
+        structured += 1
+        if not result.mismatches:
+            matched += 1
+        for field, expected, actual in result.mismatches:
+            print(f"{name}: {field} 结构化数据为 {expected!r}，版式规则为 {actual!r}")
+            rows.append([name, field, expected, actual])
+    print(f"共 {len(sources)} 个文件，其中 {structured} 个有结构化数据：一致 {matched} 个，"
+          f"不一致 {structured - matched} 个；出错 {len(failures)} 个")
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["文件名", "字段", "结构化数据", "版式规则"])
+            writer.writerows(rows)
+        print(f"核对结果已保存到: {args.csv}")
+    return 0 if structured == matched and not failures else 2
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""生成用于测试和基准测试的合成增值税电子发票PDF
+
+版式与 extract_invoice_fields 的规则一致：标题、发票号码/开票日期、购/销信息区域
+（名称和纳税人识别号）、商品明细、合计行和价税合计行。每个PDF旁边保存
+<文件名>.truth.json，内容为提取结果应有的字段值。
+
+用法:
+    python synthetic_invoices.py <输出文件夹> -n 1000 [--min-items 1] [--max-items 20] [--seed 0] [-j 进程数]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+TRUTH_SUFFIX = ".truth.json"
+
+# 页面尺寸（与常见电子发票相同，单位：点）
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 396
+
+INVOICE_TYPES = ["电子发票（普通发票）", "电子发票（增值税专用发票）"]
+COMPANY_PREFIXES = ["北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "南京"]
+COMPANY_WORDS = ["星辰", "远航", "华信", "博达", "启明", "恒通", "众诚", "万象"]
+COMPANY_SUFFIXES = ["科技有限公司", "贸易有限公司", "咨询服务有限公司", "文化传媒有限公司"]
+ITEM_NAMES = ["*餐饮服务*餐费", "*现代服务*技术服务费", "*办公用品*打印纸",
+              "*运输服务*客运服务费", "*电子计算机*笔记本电脑", "*住宿服务*住宿费"]
+TAX_ID_CHARS = "0123456789ABCDEFGHJKLMNPQRTUWXY"
+
+# 字体：中文标签、中文内容和数字使用不同字体或字号，保证各自成为独立的span
+LABEL_FONT = ("china-s", 9)
+TEXT_FONT = ("china-s", 8)
+NUMBER_FONT = ("helv", 8)
+
+def _company(rng):
+    return rng.choice(COMPANY_PREFIXES) + rng.choice(COMPANY_WORDS) + rng.choice(COMPANY_SUFFIXES)
+
+def _tax_id(rng):
+    # 统一社会信用代码：18位，包含字母，不会被当作纯数字
+    return "91" + "".join(rng.choice(TAX_ID_CHARS) for _ in range(7)) + "MA" + \
+        "".join(rng.choice(TAX_ID_CHARS) for _ in range(6)) + rng.choice("ABCDEFGHX")
+
+def random_invoice(rng, items):
+    """随机生成一张发票的内容，返回 (字段真值, 商品明细列表)"""
+    lines = []
+    net_cents = 0
+    tax_cents = 0
+    for _ in range(items):
+        amount = rng.randint(100, 500000)
+        tax = amount * rng.choice([1, 6, 9, 13]) // 100
+        net_cents += amount
+        tax_cents += tax
+        lines.append((rng.choice(ITEM_NAMES), f"{amount / 100:.2f}", f"{tax / 100:.2f}"))
+    truth = {
+        "invoice_type": rng.choice(INVOICE_TYPES),
+        "invoice_number": "24" + "".join(rng.choice("0123456789") for _ in range(18)),
+        "invoice_date": f"{rng.randint(2020, 2025)}年{rng.randint(1, 12):02d}月{rng.randint(1, 28):02d}日",
+        "buyer_name": _company(rng),
+        "buyer_tax_id": _tax_id(rng),
+        "seller_name": _company(rng),
+        "seller_tax_id": _tax_id(rng),
+        "net_amount": f"{net_cents / 100:.2f}",
+        "tax_amount": f"{tax_cents / 100:.2f}",
+        "total_amount": f"{(net_cents + tax_cents) / 100:.2f}"
+    }
+    return truth, lines
+
+def render_invoice(truth, lines, rng=None):
+    """按发票版式绘制PDF，返回PDF字节"""
+    rng = rng or random.Random(0)
+    # 商品多时加高页面
+    height = max(PAGE_HEIGHT, 260 + len(lines) * 12)
+    doc = fitz.open()
+    page = doc.new_page(width=PAGE_WIDTH, height=height)
+    dx = rng.uniform(-3, 3)
+    dy = rng.uniform(-2, 2)
+
+    def text(x, y, value, font=TEXT_FONT):
+        page.insert_text((x + dx, y + dy), value, fontname=font[0], fontsize=font[1])
+
+    # 标题和发票号码、开票日期
+    text(200, 30, truth["invoice_type"], ("china-s", 14))
+    text(410, 52, "发票号码：", LABEL_FONT)
+    text(460, 52, truth["invoice_number"], NUMBER_FONT)
+    text(410, 66, "开票日期：", LABEL_FONT)
+    text(460, 66, truth["invoice_date"], TEXT_FONT)
+
+    # 购买方/销售方信息区域，左侧为竖排的标签
+    page.draw_rect(fitz.Rect(15 + dx, 78 + dy, 580 + dx, 140 + dy), width=0.5)
+    for i, c in enumerate("购买方信息"):
+        text(20, 90 + i * 11, c, LABEL_FONT)
+    for i, c in enumerate("销售方信息"):
+        text(300, 90 + i * 11, c, LABEL_FONT)
+    text(36, 100, "名称", LABEL_FONT)
+    text(60, 100, truth["buyer_name"])
+    text(36, 122, "统一社会信用代码/纳税人识别号:", LABEL_FONT)
+    text(190, 122, truth["buyer_tax_id"], NUMBER_FONT)
+    text(316, 100, "名称", LABEL_FONT)
+    text(340, 100, truth["seller_name"])
+    text(316, 122, "统一社会信用代码/纳税人识别号:", LABEL_FONT)
+    text(470, 122, truth["seller_tax_id"], NUMBER_FONT)
+
+    # 商品明细
+    text(36, 158, "项目名称", LABEL_FONT)
+    text(400, 158, "金 额", LABEL_FONT)
+    text(500, 158, "税 额", LABEL_FONT)
+    y = 172
+    for name, amount, tax in lines:
+        text(36, y, name)
+        text(400, y, amount, NUMBER_FONT)
+        text(500, y, tax, NUMBER_FONT)
+        y += 12
+
+    # 合计行：随机使用完整的"合计"或分开的"合""计"
+    y += 10
+    if rng.random() < 0.5:
+        text(60, y, "合计", LABEL_FONT)
+    else:
+        text(50, y, "合", LABEL_FONT)
+        text(90, y, "计", LABEL_FONT)
+    text(400, y, "¥" + truth["net_amount"], NUMBER_FONT)
+    text(500, y, "¥" + truth["tax_amount"], NUMBER_FONT)
+
+    # 价税合计行
+    y += 22
+    text(36, y, "价税合计（大写）", LABEL_FONT)
+    text(180, y, "（小写）", TEXT_FONT)
+    text(400, y, "¥" + truth["total_amount"], NUMBER_FONT)
+
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def generate_one(output_dir, index, seed, min_items, max_items):
+    """生成第index张发票，返回PDF路径"""
+    rng = random.Random(f"{seed}-{index}")
+    truth, lines = random_invoice(rng, rng.randint(min_items, max_items))
+    pdf_path = os.path.join(output_dir, f"invoice_{index:06d}.pdf")
+    with open(pdf_path, 'wb') as f:
+        f.write(render_invoice(truth, lines, rng))
+    with open(os.path.splitext(pdf_path)[0] + TRUTH_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump(truth, f, ensure_ascii=False, indent=4)
+    return pdf_path
+
+def load_truth(pdf_path):
+    """读取PDF对应的字段真值，没有时返回None"""
+    truth_path = os.path.splitext(pdf_path)[0] + TRUTH_SUFFIX
+    if not os.path.exists(truth_path):
+        return None
+    with open(truth_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def generate_corpus(output_dir, count, seed=0, min_items=1, max_items=20, workers=None):
+    """生成count张发票，返回PDF路径列表"""
+    os.makedirs(output_dir, exist_ok=True)
+    args = [(output_dir, i, seed, min_items, max_items) for i in range(count)]
+    workers = min(workers or os.cpu_count() or 1, max(count, 1))
+    if workers <= 1:
+        return [generate_one(*a) for a in args]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(generate_one, *zip(*args), chunksize=64))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成的增值税电子发票PDF及字段真值")
+    parser.add_argument("output", help="输出文件夹")
+    parser.add_argument("-n", "--count", type=int, default=100, help="生成的发票数量")
+    parser.add_argument("--min-items", type=int, default=1, help="每张发票最少的商品行数")
+    parser.add_argument("--max-items", type=int, default=20, help="每张发票最多的商品行数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同种子生成相同的发票")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    args = parser.parse_args(argv)
+
+    paths = generate_corpus(args.output, args.count, args.seed, args.min_items, args.max_items, args.workers)
+    print(f"已生成 {len(paths)} 张发票到 {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from input_sources import close_archives, find_sources, read_source, source_name
+
+# 分拣类别：有文本层的电子发票（交给提取）、只有图片的扫描件、无法读取的文件
+TEXT_LAYER = "text"
+IMAGE_ONLY = "scan"
+BROKEN = "broken"
+# 提取阶段的其他错误（例如有文本层但不像发票）
+EXTRACT_FAILED = "failed"
+CATEGORY_LABELS = {
+    TEXT_LAYER: "电子发票",
+    IMAGE_ONLY: "扫描件（没有文本层，需要OCR）",
+    BROKEN: "无法读取的文件",
+    EXTRACT_FAILED: "提取失败",
+}
+
+# PDF文件头，按规范可以出现在前1024字节内
+PDF_HEADER = b"%PDF-"
+HEADER_SEARCH_BYTES = 1024
+
+SCANNED_ERROR = "扫描件，没有文本层"
+EMPTY_FILE_ERROR = "空文件"
+NOT_PDF_ERROR = "不是PDF文件"
+OPEN_ERROR = "无法打开PDF"
+ENCRYPTED_ERROR = "PDF已加密"
+NO_PAGES_ERROR = "PDF没有页面"
+_BROKEN_ERRORS = (EMPTY_FILE_ERROR, NOT_PDF_ERROR, OPEN_ERROR, ENCRYPTED_ERROR, NO_PAGES_ERROR)
+
+# 分拣报告文件名（放在输出文件夹中）
+REPORT_FILENAME = "未提取文件报告.csv"
+
+TriageResult = namedtuple("TriageResult", "source category page_count reason")
+
+class TriageError(ValueError):
+    """分拣时发现的问题：扫描件或无法读取的文件，错误信息以上面的 *_ERROR 开头"""
+
+def _check_header(head):
+    if not head:
+        raise TriageError(EMPTY_FILE_ERROR)
+    if PDF_HEADER not in head[:HEADER_SEARCH_BYTES]:
+        raise TriageError(f"{NOT_PDF_ERROR}（文件头不是%PDF-）")
+
+def open_checked(source):
+    """检查文件头后打开PDF，文件头不对、打不开、已加密或没有页面时抛出 TriageError
+
+    只读取文件开头，不是PDF的文件不会交给PyMuPDF尝试修复
+    """
+    if isinstance(source, str):
+        try:
+            with open(source, 'rb') as f:
+                head = f.read(HEADER_SEARCH_BYTES)
+        except OSError as e:
+            raise TriageError(f"{OPEN_ERROR}: {str(e)}")
+        _check_header(head)
+        opener = lambda: fitz.open(source)
+    else:
+        data = read_source(source)
+        _check_header(data[:HEADER_SEARCH_BYTES])
+        opener = lambda: fitz.open(stream=data, filetype="pdf")
+    try:
+        doc = opener()
+    except Exception as e:
+        raise TriageError(f"{OPEN_ERROR}: {str(e)}")
+    if doc.needs_pass:
+        doc.close()
+        raise TriageError(ENCRYPTED_ERROR)
+    if doc.page_count == 0:
+        doc.close()
+        raise TriageError(NO_PAGES_ERROR)
+    return doc
+
+def has_text_layer(page):
+    """页面是否有文本：先看页面是否引用了字体（很快），没有字体时再确认一次没有文字"""
+    return bool(page.get_fonts()) or bool(page.get_text("text").strip())
+
+def classify_document(doc):
+    """已打开文档的类别：任何一页有文本层为 TEXT_LAYER，否则为 IMAGE_ONLY"""
+    return TEXT_LAYER if any(has_text_layer(page) for page in doc) else IMAGE_ONLY
+
+def require_text_layer(doc):
+    """文档没有文本层（扫描件）时抛出 TriageError，不再获取文本和提取字段"""
+    if classify_document(doc) == IMAGE_ONLY:
+        raise TriageError(SCANNED_ERROR)
+
+def error_category(error):
+    """提取时返回的错误信息属于哪个类别"""
+    if error.startswith(SCANNED_ERROR):
+        return IMAGE_ONLY
+    if error.startswith(_BROKEN_ERRORS):
+        return BROKEN
+    return EXTRACT_FAILED
+
+def triage_source(source):
+    """分拣一个来源，返回 TriageResult"""
+    try:
+        doc = open_checked(source)
+    except TriageError as e:
+        return TriageResult(source, BROKEN, 0, str(e))
+    try:
+        return TriageResult(source, classify_document(doc), doc.page_count, "")
+    finally:
+        doc.close()
+
+def _triage_chunk(sources):
+    try:
+        return [triage_source(source) for source in sources]
+    finally:
+        close_archives()
+
+def iter_triage(sources, workers=None):
+    """按输入顺序产出每个来源的 TriageResult，文件多时使用多个进程"""
+    workers = workers or os.cpu_count() or 1
+    size = max(1, min(64, len(sources) // (workers * 4)))
+    chunks = [sources[i:i + size] for i in range(0, len(sources), size)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from _triage_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_triage_chunk, chunks):
+            yield from results
+
+def group_failures(failures):
+    """把 [(文件名, 错误信息)] 按类别分组，返回 {类别: [(文件名, 错误信息)]}（按 CATEGORY_LABELS 的顺序）"""
+    groups = {}
+    for name, error in failures:
+        groups.setdefault(error_category(error), []).append((name, error))
+    return {category: groups[category] for category in CATEGORY_LABELS if category in groups}
+
+def describe_failures(failures, limit=10):
+    """汇总报告的文字：每个类别一行，列出前 limit 个文件名"""
+    lines = []
+    for category, items in group_failures(failures).items():
+        names = "、".join(name for name, _ in items[:limit])
+        more = "等" if len(items) > limit else ""
+        lines.append(f"{CATEGORY_LABELS[category]} {len(items)} 个: {names}{more}")
+    return "\n".join(lines)
+
+def write_report(path, failures):
+    """把未提取的文件保存为CSV报告（文件名、类别、原因），带BOM的UTF-8，Excel可以直接打开"""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["文件名", "类别", "原因"])
+        for category, items in group_failures(failures).items():
+            for name, error in items:
+                writer.writerow([name, CATEGORY_LABELS[category], error])
+
+def main(argv=None):
+    """命令行入口：只分拣不提取，列出扫描件和无法读取的文件"""
+    parser = argparse.ArgumentParser(description="发票分拣：区分电子发票、扫描件和无法读取的文件")
+    parser.add_argument("source", help="PDF文件、ZIP压缩包或包含它们的文件夹")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹中的PDF和压缩包")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("--csv", default=None, help="把所有文件的分拣结果保存为CSV")
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.source, args.recursive)
+    if not sources:
+        print("没有找到PDF文件")
+        return 1
+    counts = {category: 0 for category in (TEXT_LAYER, IMAGE_ONLY, BROKEN)}
+    failures = []
+    rows = []
+    for result in iter_triage(sources, args.workers):
+        name = source_name(result.source)
+        counts[result.category] += 1
+        if result.category != TEXT_LAYER:
+            failures.append((name, result.reason or SCANNED_ERROR))
+        rows.append([name, CATEGORY_LABELS[result.category], result.page_count, result.reason])
+    print("，".join(f"{CATEGORY_LABELS[category]} {n} 个" for category, n in counts.items()))
+    if failures:
+        print(describe_failures(failures))
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["文件名", "类别", "页数", "原因"])
+            writer.writerows(rows)
+        print(f"分拣结果已保存到: {args.csv}")
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
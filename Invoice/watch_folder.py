@@ -0,0 +1,253 @@
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+from batch_process import WorkerPool, default_workers, iter_batch
+import excel_summary
+import result_cache
+
+# 清单文件名（放在输出文件夹中），记录已处理过的文件
+MANIFEST_FILENAME = "watch_manifest.sqlite"
+# 扫描收件箱的间隔（秒）
+DEFAULT_INTERVAL = 2.0
+# 文件大小和修改时间保持不变多少秒后才认为已复制完成
+DEFAULT_SETTLE = 3.0
+# 每批最多处理的文件数，处理完一批就写入汇总文件
+DEFAULT_BATCH_SIZE = 50
+
+class Manifest:
+    """已处理文件清单（路径、大小、修改时间、内容哈希）
+
+    启动时整个读入内存，每次扫描按路径在字典中查找，不再逐个文件查询数据库；
+    record()/touch() 的修改在 commit() 时才写入字典，rollback() 丢弃
+    """
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " digest TEXT,"
+            " invoice_number TEXT,"
+            " error TEXT,"
+            " processed_at REAL NOT NULL)")
+        self.conn.commit()
+        # 路径 -> (size, mtime_ns, digest)；还没提交的修改
+        self.files = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in
+                      self.conn.execute("SELECT path, size, mtime_ns, digest FROM files")}
+        self.staged = {}
+
+    def get(self, path):
+        """返回 (size, mtime_ns, digest)，没有记录时返回None"""
+        return self.files.get(path)
+
+    def record(self, path, size, mtime_ns, digest, invoice_number=None, error=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, digest, invoice_number, error, processed_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, digest, invoice_number, error, time.time()))
+        self.staged[path] = (size, mtime_ns, digest)
+
+    def touch(self, path, size, mtime_ns):
+        """内容没变只是修改时间变化时，只更新大小和修改时间"""
+        self.conn.execute(
+            "UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?", (size, mtime_ns, path))
+        known = self.staged.get(path) or self.files.get(path)
+        if known:
+            self.staged[path] = (size, mtime_ns, known[2])
+
+    def commit(self):
+        self.conn.commit()
+        self.files.update(self.staged)
+        self.staged.clear()
+
+    def rollback(self):
+        self.conn.rollback()
+        self.staged.clear()
+
+    def close(self):
+        # 没有提交的记录（汇总文件还没写入的批次）丢弃，下次启动时重新处理
+        self.conn.close()
+
+class FolderWatcher:
+    """轮询收件箱，提取新到达或有变化的PDF并按批追加到汇总文件
+
+    进程池在第一次需要时创建，之后各批共用，直到停止监视；工作进程异常退出时重建
+    """
+
+    def __init__(self, inbox, output_dir, interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE,
+                 batch_size=DEFAULT_BATCH_SIZE, workers=None, regions=False):
+        self.inbox = inbox
+        self.output_dir = output_dir
+        self.interval = interval
+        self.settle = settle
+        self.batch_size = batch_size
+        self.workers = workers or default_workers()
+        self.regions = regions
+        self.pool = None
+        self.excel_path = os.path.join(output_dir, excel_summary.SUMMARY_FILENAME)
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest = Manifest(os.path.join(output_dir, MANIFEST_FILENAME))
+        self.cache = result_cache.open_cache(output_dir)
+        self.existing_invoice_numbers = excel_summary.load_invoice_numbers(self.excel_path)
+        # 正在等待复制完成的文件: path -> (size, mtime_ns, 首次看到该状态的时间)
+        self.pending = {}
+
+    def scan(self, now=None):
+        """扫描收件箱，返回大小和修改时间已稳定的待处理文件列表 [(path, size, mtime_ns)]"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        try:
+            entries = list(os.scandir(self.inbox))
+        except OSError as e:
+            print(f"读取收件箱失败: {str(e)}")
+            return ready
+        for entry in entries:
+            if not entry.name.lower().endswith('.pdf') or not entry.is_file():
+                continue
+            path = entry.path
+            seen.add(path)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            # 清单中大小和修改时间都没变的文件已经处理过
+            known = self.manifest.get(path)
+            if known and known[:2] == state:
+                self.pending.pop(path, None)
+                continue
+            # 去抖：状态变化时重新计时，保持不变超过 settle 秒才处理
+            previous = self.pending.get(path)
+            if previous is None or previous[:2] != state:
+                self.pending[path] = state + (now,)
+                continue
+            if state[0] > 0 and now - previous[2] >= self.settle:
+                ready.append((path, state[0], state[1]))
+        # 已经被移走的文件不再等待
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
+        ready.sort()
+        return ready[:self.batch_size]
+
+    def _pool(self):
+        if self.pool is None and self.workers > 1:
+            self.pool = WorkerPool(self.workers)
+        return self.pool
+
+    def process(self, ready):
+        """提取一批文件并写入汇总文件，返回 (新增行数, 重复数, 失败数)"""
+        to_extract = []
+        digests = {}
+        for path, size, mtime_ns in ready:
+            try:
+                digest = result_cache.file_digest(path)
+            except OSError as e:
+                # 文件可能刚被移走或仍被占用，下次扫描再试
+                print(f"读取文件失败 {path}: {str(e)}")
+                continue
+            known = self.manifest.get(path)
+            if known and known[2] == digest:
+                # 只是修改时间变了，内容没变
+                self.manifest.touch(path, size, mtime_ns)
+                self.pending.pop(path, None)
+                continue
+            digests[path] = (size, mtime_ns, digest)
+            to_extract.append(path)
+
+        # 工作进程异常退出时 iter_batch 会重建进程池，导致崩溃的文件作为失败记入清单，不再反复处理
+        results = list(iter_batch(to_extract, self.workers, cache=self.cache, regions=self.regions,
+                                  pool=self._pool()))
+
+        rows = []
+        failures = 0
+        for pdf_path, invoices, error in results:
+            size, mtime_ns, digest = digests[pdf_path]
+            self.pending.pop(pdf_path, None)
+            if error is not None:
+                failures += 1
+                print(f"处理PDF文件 {os.path.basename(pdf_path)} 时出错: {error}")
+                self.manifest.record(pdf_path, size, mtime_ns, digest, error=error)
+                continue
+            for page_number, data in invoices:
+                rows.append(excel_summary.build_row(os.path.basename(pdf_path), data, page_number))
+            numbers = ",".join(data.get("invoice_number", "") for _, data in invoices)
+            self.manifest.record(pdf_path, size, mtime_ns, digest, invoice_number=numbers)
+
+        duplicates = []
+        if rows:
+            # save_rows 会先把号码加入集合，写入失败时要去掉，否则下次会被当作重复
+            added = {row["发票号码"] for row in rows} - self.existing_invoice_numbers
+            try:
+                duplicates = excel_summary.save_rows(self.excel_path, rows, self.existing_invoice_numbers)
+            except Exception as e:
+                # 例如汇总文件正在Excel中打开：这批文件不记入清单，下次扫描时重新处理
+                print(f"写入汇总文件失败，稍后重试: {str(e)}")
+                self.existing_invoice_numbers -= added
+                self.manifest.rollback()
+                return 0, 0, failures
+        # 汇总文件写入成功后再提交清单，中途退出时这批文件会被重新处理
+        self.manifest.commit()
+        return len(rows) - len(duplicates), len(duplicates), failures
+
+    def run_forever(self):
+        print(f"正在监视 {self.inbox}，结果写入 {self.excel_path}（Ctrl+C 退出）")
+        try:
+            while True:
+                ready = self.scan()
+                if ready:
+                    added, duplicates, failures = self.process(ready)
+                    print(f"处理 {len(ready)} 个文件：新增 {added} 条，重复 {duplicates} 条，失败 {failures} 个")
+                    # 还有积压时立即处理下一批
+                    if len(ready) >= self.batch_size:
+                        continue
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("已停止监视")
+        finally:
+            self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.manifest.close()
+        if self.cache is not None:
+            self.cache.close()
+
+def main(argv=None):
+    """监视文件夹模式入口"""
+    parser = argparse.ArgumentParser(description="监视收件箱文件夹，持续提取新到达的发票")
+    parser.add_argument("inbox", help="要监视的收件箱文件夹")
+    parser.add_argument("-o", "--output", required=True, help="输出文件夹，结果写入发票数据汇总.xlsx")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="扫描间隔（秒）")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                        help="文件保持不变多少秒后才处理，避免读取正在复制的文件")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批最多处理的文件数")
+    parser.add_argument("--regions", action="store_true", help="使用区域模式获取文本")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.inbox):
+        print(f"收件箱文件夹不存在: {args.inbox}")
+        return 1
+    try:
+        watcher = FolderWatcher(args.inbox, args.output, args.interval, args.settle,
+                                args.batch_size, args.workers, args.regions)
+    except Exception as e:
+        print(f"启动监视失败（请检查输出文件夹中的汇总文件）: {str(e)}")
+        return 1
+    watcher.run_forever()
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())